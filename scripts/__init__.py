@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""GAC 시스템 모듈 패키지. 저장소 루트에서 `python -m scripts.main` (또는 scripts.batch / scripts.benchmark)으로 실행합니다."""
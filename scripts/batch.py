@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+GAC 시스템 다지역 일괄 실행기
+
+지역 목록(manifest JSON)의 각 지역에 대해 단계 1(원본 노드) → 단계 2(섬 노드) → 단계 3(Phase별 시나리오)
+→ 단계 4(최종 스냅샷·섬 외부 목축 소스 노드)를 실행합니다. 지역은 크기가 제한된 프로세스 풀에서 병렬로 실행되고,
+지역마다 단계가 끝날 때마다 출력 디렉터리의 checkpoints/에 결과 테이블(node_store.save_arrays)과 상태 파일을 남깁니다.
+중단 후 다시 실행하면 완료된 단계는 건너뛰고 마지막 체크포인트부터 이어 갑니다.
+Phase 난수는 지역 시드와 Phase 이름으로 정해지므로 이어서 실행한 결과는 한 번에 실행한 결과와 같습니다.
+
+사용 예:
+    python -m scripts.batch regions.json --workers 4 --output-root output/national
+
+manifest 형식:
+    {"defaults": {"backend": "gpkg", "config": {"SIMULATION_PHASES_MIGRATION": [0.5, 1.0], ...}},
+     "regions": [{"name": "seoul_incheon_gyeonggi", "gpkg_path": "data/sig.gpkg",
+                  "lc_layer": "LandCover", "gb_layer": "GB_Boundary", "island_layer": "Islands", "seed": 1}, ...]}
+arcpy 백엔드에서는 lc_layer / gb_layer / island_layer에 데이터셋 경로를, output_gdb에 결과 GDB 경로를 줍니다.
+지역별 로그는 <output_dir>/batch.log, 전체 요약은 <output-root>/batch_summary.json에 저장됩니다.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import shutil
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import config
+from . import gpkg_backend
+from . import instrumentation
+from . import main as gac_main
+from . import processing
+from . import simulation
+from .node_store import open_arrays, save_arrays
+from .scenario import Scenario
+
+STATE_FILE = "state.json"
+STEP1, STEP2, OUTPUTS = "step1", "step2", "outputs"
+_REGION_KEYS = ("name", "backend", "gpkg_path", "lc_layer", "gb_layer", "island_layer", "output_dir", "output_gdb", "seed", "config")
+
+
+def load_manifest(path):
+    """manifest를 읽어 defaults를 각 지역에 합친 지역 목록을 반환합니다 (config 항목은 지역 값이 우선)."""
+    with open(path, "r", encoding="utf-8") as f: manifest = json.load(f)
+    defaults = manifest.get("defaults", {}); regions = []
+    for spec in manifest["regions"]:
+        unknown = set(spec) - set(_REGION_KEYS)
+        if unknown: raise ValueError(f"지역 '{spec.get('name')}': 알 수 없는 항목 {sorted(unknown)}")
+        region = dict(defaults, **spec); region["config"] = dict(defaults.get("config", {}), **spec.get("config", {}))
+        regions.append(region)
+    names = [region["name"] for region in regions]
+    if len(set(names)) != len(names): raise ValueError("manifest에 중복된 지역 이름이 있습니다.")
+    return regions
+
+
+def _region_overrides(region, output_dir):
+    """지역 실행 동안 적용할 config 값 (입력·출력 경로 + manifest의 config 항목)."""
+    backend = region.get("backend", config.BACKEND)
+    overrides = {"BACKEND": backend, "USE_PREP_CACHE": False,
+                 "TRACE_OUTPUT_PATH": os.path.join(output_dir, "gac_trace.json"), "COLUMNAR_OUTPUT_PATH": os.path.join(output_dir, "phases.arrow")}
+    for key, config_key in (("gpkg_path", "GPKG_PATH"), ("lc_layer", "LC_LAYER_NAME"), ("gb_layer", "GB_LAYER_NAME"), ("island_layer", "ISLAND_LAYER_NAME")):
+        if key in region: overrides[config_key] = region[key]
+    if backend == "gpkg": overrides["OUTPUT_GPKG"] = os.path.join(output_dir, "GAAT_Results.gpkg")
+    else: overrides["OUTPUT_GDB"] = region.get("output_gdb") or os.path.join(os.path.abspath(output_dir), "GAAT_Results.gdb")
+    overrides.update(region.get("config", {}))
+    return overrides
+
+
+@contextlib.contextmanager
+def config_overrides(overrides):
+    """config 모듈 값을 잠시 바꾸고 끝나면 되돌립니다 (같은 작업자 프로세스에서 다음 지역으로 새지 않도록)."""
+    for key in overrides:
+        if not key.isupper() or not hasattr(config, key): raise KeyError(f"알 수 없는 config 항목: {key}")
+    previous = {key: getattr(config, key) for key in overrides}
+    try:
+        for key, value in overrides.items(): setattr(config, key, value)
+        yield
+    finally:
+        for key, value in previous.items(): setattr(config, key, value)
+
+
+class RegionCheckpoint:
+    """
+    지역 하나의 체크포인트 디렉터리. state.json에 완료된 단계 목록과 이어 실행에 필요한 값을 기록하고,
+    단계 결과 테이블은 단계 이름의 하위 디렉터리에 save_arrays로 저장합니다.
+    fingerprint(지역 설정 + Phase 일정)가 바뀌면 이전 체크포인트는 버립니다.
+    """
+
+    def __init__(self, directory, fingerprint, restart=False):
+        self.directory = directory
+        state = None if restart else self._read()
+        if state is not None and state.get("fingerprint") != fingerprint:
+            print(f"  지역 설정이 바뀌어 이전 체크포인트를 버립니다: {directory}"); state = None
+        if state is None:
+            shutil.rmtree(directory, ignore_errors=True)
+            state = {"fingerprint": fingerprint, "completed": []}
+        os.makedirs(directory, exist_ok=True)
+        self.state = state
+
+    def _read(self):
+        try:
+            with open(os.path.join(self.directory, STATE_FILE), "r", encoding="utf-8") as f: return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def done(self, stage):
+        return stage in self.state["completed"]
+
+    def table_path(self, stage):
+        return os.path.join(self.directory, stage.replace(":", "_"))
+
+    def save_table(self, stage, table):
+        return save_arrays(table, self.table_path(stage))
+
+    def open_table(self, stage):
+        return open_arrays(self.table_path(stage))
+
+    def complete(self, stage, **values):
+        """stage를 완료로 기록합니다. 상태 파일은 임시 파일을 쓴 뒤 교체하므로 중단되어도 이전 상태가 남습니다."""
+        self.state.update(values); self.state["completed"].append(stage)
+        tmp_path = os.path.join(self.directory, STATE_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f: json.dump(self.state, f, indent=2, default=str)
+        os.replace(tmp_path, os.path.join(self.directory, STATE_FILE))
+
+
+def region_fingerprint(region):
+    spec = {key: region.get(key) for key in _REGION_KEYS if key != "output_dir"}
+    spec["schedule"] = simulation.phase_schedule()
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _phase_rng(seed, phase_name):
+    # Phase마다 (지역 시드, Phase 이름)으로 정해지는 난수열 -> 이어 실행해도 같은 결과
+    return random.Random(f"{seed}:{phase_name}")
+
+
+def _load_layers(headless):
+    if headless: return gac_main.load_gpkg_layers()
+    return config.LC_LAYER_NAME, config.GB_LAYER_NAME, config.ISLAND_LAYER_NAME
+
+
+def _run_region_stages(region, checkpoint, stages):
+    """체크포인트를 확인하며 단계 1~4를 실행하고, 이번 실행에서 수행한 단계 목록을 반환합니다."""
+    headless = config.BACKEND == "gpkg"; seed = region.get("seed", config.MONTE_CARLO_SEED); ran = []; layers = None
+    # 지역 설정이 적용된 config로 시나리오를 한 번 만들고, 단계 1의 221/222 추첨도 지역 시드로 고정합니다.
+    scenario = Scenario.from_config(seed=seed)
+    if not headless:
+        if gac_main.arcpy is None: raise RuntimeError("arcpy를 불러올 수 없습니다. 지역 backend를 'gpkg'로 설정하세요.")
+        if not gac_main.arcpy.Exists(scenario.output_gdb): gac_main.arcpy.management.CreateFileGDB(os.path.dirname(scenario.output_gdb), os.path.basename(scenario.output_gdb))
+        gac_main.setup_arcpy_workspace()
+    else:
+        os.makedirs(os.path.dirname(scenario.output_gpkg) or ".", exist_ok=True)
+
+    # --- 단계 1 ---
+    stages.next(STEP1, resumed=checkpoint.done(STEP1))
+    if checkpoint.done(STEP1): source_table = checkpoint.open_table(STEP1); print(f"단계 1: 체크포인트 사용 (원본 노드 {len(source_table)}개)")
+    else:
+        layers = layers or _load_layers(headless); lc_layer, gb_layer, island_layer = layers
+        source_nodes_path, _ = processing.prepare_source_greenbelt_nodes(lc_layer, gb_layer, island_layer, scenario)
+        if headless: source_table, source_nodes_path = source_nodes_path, None
+        else: source_table = processing.load_source_node_table(source_nodes_path)
+        checkpoint.save_table(STEP1, source_table)
+        checkpoint.complete(STEP1, source_nodes_path=source_nodes_path, lc_srs_id=getattr(lc_layer, "srs_id", 0)); ran.append(STEP1)
+
+    # --- 단계 2 ---
+    stages.next(STEP2, resumed=checkpoint.done(STEP2))
+    delta_mode = config.PERSIST_PHASE_RESULTS and config.PERSIST_PHASE_AS_DELTA
+    if checkpoint.done(STEP2): base_store = checkpoint.open_table(STEP2); print(f"단계 2: 체크포인트 사용 (섬 노드 {len(base_store)}개)")
+    else:
+        layers = layers or _load_layers(headless); lc_layer, _, island_layer = layers
+        island_nodes_path, _, total_replaceable_count = processing.prepare_target_island_nodes(lc_layer, island_layer, scenario)
+        if headless: base_store, island_nodes_path = island_nodes_path, None
+        else: base_store = processing.load_island_node_store(island_nodes_path)
+        srs_id = getattr(island_layer, "srs_id", 0)
+        if delta_mode and headless: gpkg_backend.write_island_node_store(base_store, scenario.output_gpkg, "Result_Island_Nodes_Base", srs_id)
+        checkpoint.save_table(STEP2, base_store)
+        checkpoint.complete(STEP2, island_nodes_path=island_nodes_path, total_replaceable_count=total_replaceable_count, srs_id=srs_id); ran.append(STEP2)
+    state = checkpoint.state
+
+    # --- 단계 3: 마지막으로 완료된 Phase의 테이블부터 이어 실행 ---
+    schedule = simulation.phase_schedule(scenario=scenario); completed_phases = [i for i, (name, _, _) in enumerate(schedule) if checkpoint.done(f"phase:{name}")]
+    last_done = max(completed_phases, default=-1); node_store = base_store.copy(); previous_checkpoint = None
+    if last_done >= 0:
+        # 정적 컬럼은 단계 2 테이블과 같으므로 Phase 체크포인트에서는 갱신되는 컬럼과 (추가 전용) 사전만 가져옵니다.
+        previous_checkpoint = f"phase:{schedule[last_done][0]}"; phase_table = checkpoint.open_table(previous_checkpoint)
+        node_store.codebooks = phase_table.codebooks
+        for column in node_store.MUTABLE_COLUMNS: getattr(node_store, column)[:] = getattr(phase_table, column)
+        del phase_table
+    # 추출 순열은 지역 시드로 고정하고, 이미 처리한 원본 수만큼 커서를 앞으로 옮깁니다.
+    source_pool = simulation.SourcePool(source_table, random.Random(seed), scenario=scenario)
+    processed_source_ids = set(source_pool.unique_ids(source_pool.draw(state.get("processed_source_count", 0))))
+    candidate_queues = simulation.CandidateQueues(node_store)
+    for i, (phase_name, migration_ratio, demolition_ratio) in enumerate(schedule):
+        if i <= last_done: continue
+        stages.next(phase_name); print(f"\n===== 시나리오 실행 중: {phase_name} ({migration_ratio*100}% 배치) =====")
+        _, processed_source_ids = processing.execute_scenario_phase_in_memory(
+            phase_name=phase_name, node_store=node_store, source_table=source_table, persist=config.PERSIST_PHASE_RESULTS,
+            base_feature_class=state["island_nodes_path"], candidate_queues=candidate_queues, source_pool=source_pool, rng=_phase_rng(seed, phase_name), scenario=scenario,
+            srs_id=state["srs_id"], total_source_nodes_count=len(source_table), total_original_replaceable_count=state["total_replaceable_count"],
+            processed_source_node_ids=processed_source_ids, p_cumulative_migration_ratio_curr=migration_ratio, p_cumulative_demolition_ratio_curr=demolition_ratio)
+        stage = f"phase:{phase_name}"; checkpoint.save_table(stage, node_store)
+        checkpoint.complete(stage, processed_source_count=source_pool.processed_count); ran.append(stage)
+        # 이어 실행에는 마지막 Phase 테이블만 필요합니다.
+        if previous_checkpoint: shutil.rmtree(checkpoint.table_path(previous_checkpoint), ignore_errors=True)
+        previous_checkpoint = stage
+    if last_done == len(schedule) - 1 and schedule: print(f"단계 3: 모든 Phase 체크포인트 완료 ({len(schedule)}개)")
+
+    # --- 단계 4: 최종 스냅샷과 섬 외부 목축 소스 노드 ---
+    stages.next(OUTPUTS, resumed=checkpoint.done(OUTPUTS))
+    if not checkpoint.done(OUTPUTS):
+        if schedule and delta_mode and config.MATERIALIZE_FINAL_SNAPSHOT:
+            # 기준 + 모든 변경분을 합친 결과는 마지막 Phase 테이블과 같으므로 그대로 저장합니다 (이어 실행에서도 변경분 불필요).
+            final_name = f"Result_Island_Nodes_{schedule[-1][0]}"; print(f"\n--- 최종 Phase 전체 스냅샷 저장: {final_name} ---")
+            if headless: gpkg_backend.write_island_node_store(node_store, scenario.output_gpkg, final_name, state["srs_id"])
+            else: processing.write_island_node_store(node_store, state["island_nodes_path"], os.path.join(scenario.output_gdb, final_name))
+        gac_main.export_outer_grazing_sources(source_table, state.get("source_nodes_path"), state.get("lc_srs_id", 0), headless, scenario)
+        checkpoint.complete(OUTPUTS); ran.append(OUTPUTS)
+    return ran
+
+
+def run_region(region, output_root, restart=False):
+    """
+    지역 하나를 실행하고 결과 요약 dict를 반환합니다 (작업자 프로세스 진입점).
+    실패해도 예외를 올리지 않고 status="failed"와 오류를 반환하여 다른 지역 실행은 계속됩니다.
+    """
+    name = region["name"]; output_dir = region.get("output_dir") or os.path.join(output_root, name); os.makedirs(output_dir, exist_ok=True)
+    start = time.time(); summary = {"name": name, "output_dir": output_dir, "status": "failed", "stages_run": []}
+    with open(os.path.join(output_dir, "batch.log"), "a", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        print(f"\n===== [{time.strftime('%Y-%m-%d %H:%M:%S')}] 지역 '{name}' 실행 시작 (pid {os.getpid()}) =====")
+        try:
+            with config_overrides(_region_overrides(region, output_dir)):
+                instrumentation.TRACER.reset(); instrumentation.enable(config.ENABLE_TRACING)
+                checkpoint = RegionCheckpoint(os.path.join(output_dir, "checkpoints"), region_fingerprint(region), restart)
+                summary["resumed_from"] = list(checkpoint.state["completed"])
+                stages = instrumentation.stages(f"region.{name}")
+                try:
+                    summary["stages_run"] = _run_region_stages(region, checkpoint, stages)
+                finally:
+                    stages.close()
+                    if config.ENABLE_TRACING: print(f"계측 결과 저장: {instrumentation.write_trace()}")
+            summary["status"] = "completed"
+        except Exception as e:
+            summary["error"] = f"{type(e).__name__}: {e}"; traceback.print_exc(file=log)
+        summary["seconds"] = round(time.time() - start, 3)
+        print(f"===== 지역 '{name}' {summary['status']} ({summary['seconds']}초) =====")
+    return summary
+
+
+def run_batch(regions, output_root, workers=1, restart=False):
+    """지역 목록을 최대 workers개 프로세스에서 실행하고 지역별 요약 목록을 반환합니다 (manifest 순서)."""
+    os.makedirs(output_root, exist_ok=True)
+    print(f"일괄 실행: 지역 {len(regions)}개, 작업자 {workers}개, 출력 {output_root}")
+    results = {}
+
+    def report(summary):
+        results[summary["name"]] = summary
+        detail = summary.get("error") or f"실행 단계 {len(summary['stages_run'])}개, 이전 완료 {len(summary.get('resumed_from', []))}개"
+        print(f"  [{len(results)}/{len(regions)}] {summary['name']}: {summary['status']} ({summary['seconds']}초) - {detail}")
+
+    if workers <= 1:
+        for region in regions: report(run_region(region, output_root, restart))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_region, region, output_root, restart) for region in regions]
+            for future in as_completed(futures): report(future.result())
+    summaries = [results[region["name"]] for region in regions]
+    summary_path = os.path.join(output_root, "batch_summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f: json.dump(summaries, f, indent=2, ensure_ascii=False)
+    print(f"일괄 실행 요약 저장: {summary_path} (완료 {sum(s['status'] == 'completed' for s in summaries)}개, 실패 {sum(s['status'] != 'completed' for s in summaries)}개)")
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GAC 다지역 일괄 실행 (지역별 단계 체크포인트, 이어 실행)")
+    parser.add_argument("manifest", help="지역 목록 JSON")
+    parser.add_argument("--workers", type=int, default=1, help="동시에 실행할 지역 수")
+    parser.add_argument("--output-root", default=os.path.join("output", "batch"), help="지역별 출력 디렉터리의 상위 경로")
+    parser.add_argument("--regions", nargs="+", default=None, help="이 이름의 지역만 실행")
+    parser.add_argument("--restart", action="store_true", help="체크포인트를 버리고 처음부터 실행")
+    args = parser.parse_args(argv)
+    regions = load_manifest(args.manifest)
+    if args.regions:
+        missing = set(args.regions) - {region["name"] for region in regions}
+        if missing: parser.error(f"manifest에 없는 지역: {sorted(missing)}")
+        regions = [region for region in regions if region["name"] in args.regions]
+    summaries = run_batch(regions, args.output_root, args.workers, args.restart)
+    return 0 if all(s["status"] == "completed" for s in summaries) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+GAC 시스템 성능 벤치마크
+
+크기를 조절할 수 있는 합성 군도(섬 수, 섬당 노드 수, 공업 비율, 원본 노드 수)를 만들어
+allocate_integer_counts, 단계 1, 단계 2 점수 계산, Phase별 시나리오 실행 시간을 규모 단계(tier)마다 따로 측정하고
+회귀 추적용 JSON으로 저장합니다.
+
+사용 예:
+    python -m scripts.benchmark --tiers 1000 10000 100000 1000000 --output benchmark_results.json
+
+지오메트리 단계(GeoPackage 작성 + 단계 1/2 전체)는 --geometry-max-nodes 이하 규모에서만 실행하고,
+그보다 큰 규모는 같은 합성 데이터를 배열로 만들어 단계 2 점수 계산과 Phase 실행만 측정합니다.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from . import config
+from . import gpkg_backend
+from . import scoring
+from . import simulation
+from .node_store import IslandNodeStore, SourceNodeTable
+
+DEFAULT_TIERS = (1_000, 10_000, 100_000, 1_000_000)
+CELL_SIZE = 10.0
+# 공업(121)을 제외한 섬 내부 L3 코드 구성비
+_ISLAND_CODE_MIX = {
+    '111': 0.20, '112': 0.10, '141': 0.03, '161': 0.02, '131': 0.06, '132': 0.04,
+    '151': 0.04, '154': 0.06, '311': 0.10, '331': 0.08, '211': 0.07, '221': 0.05, '411': 0.10, '251': 0.05,
+}
+_ALLOCATE_REPEATS = 1000
+
+
+class Archipelago:
+    """합성 군도. 토지피복은 CELL_SIZE 정사각형 셀, 섬은 셀 블록을 덮는 정사각형, 그린벨트는 전체를 덮는 사각형입니다."""
+
+    def __init__(self, island_cell_xy, island_codes, island_index, island_origin, island_side, source_cell_xy, source_codes):
+        self.island_cell_xy = island_cell_xy    # 섬 내부 셀 좌하단 (n, 2)
+        self.island_codes = island_codes        # 섬 내부 셀 L3 코드 (n,)
+        self.island_index = island_index        # 셀이 속한 섬 번호 (n,)
+        self.island_origin = island_origin      # 섬 정사각형 좌하단 (섬 수, 2)
+        self.island_side = island_side          # 섬 정사각형 한 변 길이
+        self.source_cell_xy = source_cell_xy    # 섬 밖 원본 셀 좌하단 (원본 수, 2)
+        self.source_codes = source_codes
+        sizes = np.bincount(island_index, minlength=len(island_origin))
+        self.island_ids = np.array([f"I{i + 1}_{size}" for i, size in enumerate(sizes.tolist())], dtype=object)
+
+    @property
+    def n_nodes(self):
+        return len(self.island_codes)
+
+    @property
+    def n_islands(self):
+        return len(self.island_origin)
+
+    @property
+    def n_source(self):
+        return len(self.source_codes)
+
+    def extent(self):
+        points = np.vstack([self.island_cell_xy, self.source_cell_xy, self.island_origin + self.island_side])
+        return points[:, 0].min() - CELL_SIZE, points[:, 1].min() - CELL_SIZE, points[:, 0].max() + 2 * CELL_SIZE, points[:, 1].max() + 2 * CELL_SIZE
+
+
+def generate_archipelago(n_nodes, nodes_per_island=400, industrial_share=0.05, source_ratio=0.5, seed=0):
+    """
+    섬 내부 노드 n_nodes개, 섬당 노드 nodes_per_island개(마지막 섬은 나머지), 공업(121) 비율 industrial_share,
+    원본 노드 round(n_nodes * source_ratio)개인 합성 군도를 만듭니다. 같은 인자와 seed면 같은 데이터가 나옵니다.
+    """
+    rng = np.random.default_rng(seed)
+    k = max(1, math.ceil(math.sqrt(nodes_per_island)))  # 섬 한 변의 셀 수
+    n_islands = max(1, math.ceil(n_nodes / nodes_per_island))
+    per_row = math.ceil(math.sqrt(n_islands)); pitch = (k + 2) * CELL_SIZE  # 섬 사이 두 셀 간격
+    island_origin = np.array([((i % per_row) * pitch, (i // per_row) * pitch) for i in range(n_islands)], dtype=np.float64)
+
+    local = np.array([(c % k, c // k) for c in range(nodes_per_island)], dtype=np.float64) * CELL_SIZE
+    island_index = np.repeat(np.arange(n_islands), nodes_per_island)[:n_nodes]
+    island_cell_xy = (island_origin[island_index] + np.tile(local, (n_islands, 1))[:n_nodes])
+
+    mix_codes = list(_ISLAND_CODE_MIX) + list(config.INDUSTRIAL_L3_CODES)
+    mix_share = np.array(list(_ISLAND_CODE_MIX.values())) / sum(_ISLAND_CODE_MIX.values()) * (1.0 - industrial_share)
+    mix_share = np.concatenate([mix_share, np.full(len(config.INDUSTRIAL_L3_CODES), industrial_share / len(config.INDUSTRIAL_L3_CODES))])
+    island_codes = np.array(mix_codes, dtype=object)[rng.choice(len(mix_codes), size=n_nodes, p=mix_share)]
+
+    # 원본 셀: 섬 격자 오른쪽 띠에 배치 (그린벨트 안, 섬 밖)
+    n_source = int(round(n_nodes * source_ratio))
+    band_x0 = per_row * pitch + CELL_SIZE; band_rows = max(1, math.ceil(math.ceil(n_islands / per_row) * pitch / CELL_SIZE))
+    cells = np.arange(n_source)
+    source_cell_xy = np.column_stack([band_x0 + (cells // band_rows) * CELL_SIZE, (cells % band_rows) * CELL_SIZE]).astype(np.float64)
+    source_codes = np.array(config.SOURCE_L3_CODES, dtype=object)[rng.integers(0, len(config.SOURCE_L3_CODES), size=n_source)]
+    return Archipelago(island_cell_xy, island_codes, island_index, island_origin, k * CELL_SIZE, source_cell_xy, source_codes)
+
+
+def _square(x0, y0, size):
+    return [np.array([(x0, y0), (x0 + size, y0), (x0 + size, y0 + size), (x0, y0 + size), (x0, y0)], dtype=np.float64)]
+
+
+def write_archipelago_gpkg(archipelago, gpkg_path):
+    """합성 군도를 config의 레이어/필드 이름으로 GeoPackage에 씁니다 (토지피복, 그린벨트 경계, 섬)."""
+    if os.path.exists(gpkg_path): os.remove(gpkg_path)
+    # 셀을 살짝 줄여 이웃 셀과 경계가 닿지 않게 함 (섬 경계 밖 셀이 섬과 교차로 잡히지 않도록)
+    inset = CELL_SIZE * 0.05; size = CELL_SIZE - 2 * inset
+    cells = np.vstack([archipelago.island_cell_xy, archipelago.source_cell_xy])
+    codes = list(archipelago.island_codes) + list(archipelago.source_codes)
+    gpkg_backend.write_polygon_layer(gpkg_path, config.LC_LAYER_NAME, [_square(x + inset, y + inset, size) for x, y in cells], {config.FIELD_L3_CODE: codes})
+    xmin, ymin, xmax, ymax = archipelago.extent()
+    gpkg_backend.write_polygon_layer(gpkg_path, config.GB_LAYER_NAME, [_square(xmin, ymin, max(xmax - xmin, ymax - ymin))], {"NAME": ["GB"]})
+    gpkg_backend.write_polygon_layer(gpkg_path, config.ISLAND_LAYER_NAME, [_square(x, y, archipelago.island_side) for x, y in archipelago.island_origin],
+                                     {config.FIELD_ISLAND_ID_IN_POLYGONS: archipelago.island_ids.tolist()})
+    return gpkg_path
+
+
+def archipelago_source_table(archipelago, seed=0):
+    """지오메트리 없이 원본 노드 테이블을 만듭니다 (셀 중심점, 벡터화 분류)."""
+    category_idx, factors = simulation.classify_source_codes(archipelago.source_codes, np.random.default_rng(seed))
+    keep = np.flatnonzero(category_idx >= 0); xy = archipelago.source_cell_xy[keep] + CELL_SIZE / 2
+    return SourceNodeTable(keep + 1, np.array(config.EVOLVED_CATEGORIES, dtype=object)[category_idx[keep]], factors[keep], archipelago.source_codes[keep], x=xy[:, 0], y=xy[:, 1])
+
+
+def score_archipelago(archipelago):
+    """지오메트리 없이 단계 2e 점수 계산을 수행하고 IslandNodeStore를 만듭니다."""
+    xy = archipelago.island_cell_xy + CELL_SIZE / 2
+    status_label = {code: simulation.classify_island_code(code) for code in set(archipelago.island_codes.tolist())}
+    statuses = [status_label[code][0] for code in archipelago.island_codes]; labels = [status_label[code][1] for code in archipelago.island_codes]
+    unique_ids = np.arange(1, archipelago.n_nodes + 1, dtype=np.int64); island_ids = archipelago.island_ids[archipelago.island_index]
+    centroids = archipelago.island_origin + archipelago.island_side / 2
+    cen_dist, ind_dist, priority = scoring.score_island_nodes(unique_ids, xy[:, 0], xy[:, 1], island_ids, statuses, archipelago.island_codes, archipelago.island_ids, centroids[:, 0], centroids[:, 1])
+    return IslandNodeStore(unique_ids, statuses, labels, archipelago.island_codes, priority, island_ids, x=xy[:, 0], y=xy[:, 1], near_cen_dist=cen_dist, near_ind_dist=ind_dist)
+
+
+class BenchmarkRecorder:
+    """측정값 목록. 각 측정은 규모 단계와 데이터 크기를 함께 기록합니다."""
+
+    def __init__(self):
+        self.results = []
+
+    @contextlib.contextmanager
+    def measure(self, tier, stage, archipelago, **extra):
+        # 측정 구간의 진행 로그는 시간에 영향을 주므로 버립니다.
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+        seconds = time.perf_counter() - start
+        record = {"tier": tier, "stage": stage, "seconds": seconds, "n_island_nodes": archipelago.n_nodes, "n_islands": archipelago.n_islands, "n_source_nodes": archipelago.n_source}
+        record.update(extra); self.results.append(record)
+        print(f"  {stage:<32} {seconds:10.4f}s")
+
+
+def _bench_allocate(recorder, tier, archipelago, source_table, seed):
+    codes = source_table.evolved_category
+    potentials = np.bincount(codes, weights=1.0 / source_table.compression_factor, minlength=len(config.EVOLVED_CATEGORIES))
+    category_potentials = {category: float(potentials[i]) for i, category in enumerate(config.EVOLVED_CATEGORIES)}
+    target = round(sum(category_potentials.values())); rng = random.Random(seed)
+    with recorder.measure(tier, "allocate_integer_counts", archipelago, repeats=_ALLOCATE_REPEATS, target_count=target):
+        for _ in range(_ALLOCATE_REPEATS): simulation.allocate_integer_counts(category_potentials, target, rng)
+
+
+def _bench_geometry(recorder, tier, archipelago, work_dir):
+    gpkg_path = os.path.join(work_dir, f"archipelago_{tier}.gpkg")
+    with recorder.measure(tier, "write_gpkg", archipelago): write_archipelago_gpkg(archipelago, gpkg_path)
+    with recorder.measure(tier, "read_layers", archipelago):
+        lc_layer, gb_layer, island_layer = (gpkg_backend.read_layer(gpkg_path, name) for name in (config.LC_LAYER_NAME, config.GB_LAYER_NAME, config.ISLAND_LAYER_NAME))
+    with recorder.measure(tier, "step1", archipelago): gpkg_backend.prepare_source_greenbelt_nodes(lc_layer, gb_layer, island_layer)
+    with recorder.measure(tier, "step2", archipelago): gpkg_backend.prepare_target_island_nodes(lc_layer, island_layer)
+
+
+def run_benchmark(tiers=DEFAULT_TIERS, nodes_per_island=400, industrial_share=0.05, source_ratio=0.5, seed=0, geometry_max_nodes=10_000, work_dir=None):
+    """모든 규모 단계를 측정하고 BenchmarkRecorder를 반환합니다."""
+    recorder = BenchmarkRecorder()
+    with tempfile.TemporaryDirectory(prefix="gac_bench_") as tmp_dir:
+        work_dir = work_dir or tmp_dir
+        for tier in tiers:
+            print(f"\n=== 규모 {tier:,} 노드 ===")
+            archipelago = generate_archipelago(tier, nodes_per_island, industrial_share, source_ratio, seed)
+            print(f"  섬 {archipelago.n_islands}개, 원본 노드 {archipelago.n_source}개")
+            if tier <= geometry_max_nodes: _bench_geometry(recorder, tier, archipelago, work_dir)
+            with recorder.measure(tier, "step1_classify", archipelago): source_table = archipelago_source_table(archipelago, seed)
+            _bench_allocate(recorder, tier, archipelago, source_table, seed)
+            with recorder.measure(tier, "step2_scoring", archipelago): node_store = score_archipelago(archipelago)
+            with recorder.measure(tier, "grazing_init", archipelago): simulation.update_grazing_fields(node_store)
+            schedule = simulation.phase_schedule(); phase_seconds = 0.0
+            phases = simulation.run_phase_schedule(node_store, source_table, schedule, random.Random(seed))
+            for phase_name, _, _ in schedule:
+                # run_phase_schedule은 Phase 하나를 끝낼 때마다 결과를 내보내므로 next() 한 번 = Phase 하나
+                with recorder.measure(tier, f"phase:{phase_name}", archipelago):
+                    _, _, newly_replaced, newly_demolished = next(phases)
+                recorder.results[-1].update(replaced=len(newly_replaced), demolished=len(newly_demolished)); phase_seconds += recorder.results[-1]["seconds"]
+            recorder.results.append({"tier": tier, "stage": "phase_total", "seconds": phase_seconds, "n_island_nodes": archipelago.n_nodes, "n_islands": archipelago.n_islands, "n_source_nodes": archipelago.n_source})
+    return recorder
+
+
+def benchmark_metadata(args):
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "numpy": np.__version__,
+        "platform": platform.platform(), "cpu_count": os.cpu_count(),
+        "parameters": {"tiers": list(args.tiers), "nodes_per_island": args.nodes_per_island, "industrial_share": args.industrial_share,
+                       "source_ratio": args.source_ratio, "seed": args.seed, "geometry_max_nodes": args.geometry_max_nodes,
+                       "phases": [name for name, _, _ in simulation.phase_schedule()]},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GAC 합성 군도 성능 벤치마크")
+    parser.add_argument("--tiers", type=int, nargs="+", default=list(DEFAULT_TIERS), help="섬 노드 수 규모 단계")
+    parser.add_argument("--nodes-per-island", type=int, default=400)
+    parser.add_argument("--industrial-share", type=float, default=0.05)
+    parser.add_argument("--source-ratio", type=float, default=0.5, help="섬 노드 수 대비 원본 노드 수")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--geometry-max-nodes", type=int, default=10_000, help="이 규모 이하에서만 GeoPackage 작성 + 단계 1/2 전체를 측정")
+    parser.add_argument("--work-dir", default=None, help="합성 GeoPackage를 남길 디렉터리 (기본: 임시 디렉터리)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+    recorder = run_benchmark(args.tiers, args.nodes_per_island, args.industrial_share, args.source_ratio, args.seed, args.geometry_max_nodes, args.work_dir)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"meta": benchmark_metadata(args), "results": recorder.results}, f, indent=2)
+    print(f"\n벤치마크 결과 저장: {args.output} ({len(recorder.results)}개 측정)")
+    return recorder
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Phase 결과의 컬럼형 내보내기 (Arrow IPC / Parquet, 파일 하나에 모든 Phase)
+
+노드 행 순서는 고정이므로 UniqueID·좌표·L3 코드·섬 ID·우선순위·거리 같은 정적 컬럼은 한 번만 쓰고,
+Phase마다 바뀌는 상태/라벨/목축 분류는 '<컬럼>__<Phase 이름>' 이름의 dictionary(uint8 코드) 컬럼으로 덧붙입니다.
+지오메트리는 x / y 좌표 컬럼으로 저장합니다. Arrow IPC 파일은 메모리 매핑으로 열어 필요한 Phase 컬럼만
+복사 없이 읽을 수 있습니다. pyarrow는 이 내보내기를 사용할 때만 필요합니다.
+"""
+import json
+import os
+
+import numpy as np
+
+from . import config
+
+# Phase마다 저장하는 범주 컬럼 (IslandNodeStore 속성 이름 -> 출력 필드 이름)
+PHASE_COLUMNS = {"status": config.FIELD_NODE_STATUS, "label": config.FIELD_NODE_TYPE_LABEL, "is_grazing": config.FIELD_IS_GRAZING, "grazing_type": config.FIELD_GRAZING_TYPE}
+BASE_PHASE_NAME = "Base"
+_PHASE_SEPARATOR = "__"
+_METADATA_KEY = b"gac_phases"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("컬럼형 내보내기에는 pyarrow가 필요합니다 (pip install pyarrow).") from e
+    return pyarrow
+
+
+def phase_column_name(field_name, phase_name):
+    return f"{field_name}{_PHASE_SEPARATOR}{phase_name}"
+
+
+def _format_for(path, fmt=None):
+    """fmt가 없으면 확장자(.parquet / .arrow)로, 그 외에는 config.COLUMNAR_FORMAT으로 정합니다."""
+    if fmt is None: fmt = "parquet" if path.endswith(".parquet") else ("arrow" if path.endswith((".arrow", ".feather")) else config.COLUMNAR_FORMAT)
+    if fmt not in ("arrow", "parquet"): raise ValueError(f"알 수 없는 컬럼형 형식: {fmt}")
+    return fmt
+
+
+class MultiPhaseExport:
+    """
+    Phase 결과 누적기. 생성 시점의 node_store(단계 2 결과)에서 정적 컬럼과 기준 상태를 복사하고,
+    add_phase()마다 범주 컬럼의 uint8 코드만 복사해 둡니다 (Phase당 노드 수 x 4바이트).
+    """
+
+    def __init__(self, node_store):
+        self.codebooks = node_store.codebooks
+        self.static_columns = {
+            config.FIELD_UNIQUE_ID: node_store.unique_id.copy(), "x": node_store.x.copy(), "y": node_store.y.copy(),
+            config.FIELD_L3_CODE: node_store.l3_code.copy(), config.FIELD_ISLAND_ID: list(node_store.island_id.tolist()),
+            config.FIELD_REPLACEMENT_PRIORITY: node_store.priority.copy(),
+            config.FIELD_NEAR_CENTROID_DIST: node_store.near_cen_dist.copy(), config.FIELD_NEAR_INDUSTRIAL_DIST: node_store.near_ind_dist.copy(),
+        }
+        self.phase_names = []; self.phase_codes = []
+        self.add_phase(BASE_PHASE_NAME, node_store)
+
+    def add_phase(self, phase_name, node_store):
+        if phase_name in self.phase_names: raise ValueError(f"이미 추가된 Phase: {phase_name}")
+        self.phase_names.append(phase_name)
+        self.phase_codes.append({column: getattr(node_store, column).copy() for column in PHASE_COLUMNS})
+
+    def to_arrow_table(self):
+        pa = _require_pyarrow()
+
+        def dictionary_column(codes, codebook):
+            return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.uint8()), pa.array(codebook.values, type=pa.string()))
+
+        island_ids = self.static_columns[config.FIELD_ISLAND_ID]
+        is_int = all(isinstance(v, (int, np.integer)) for v in island_ids if v is not None)
+        columns = {}
+        for name, values in self.static_columns.items():
+            if name == config.FIELD_L3_CODE: columns[name] = dictionary_column(values, self.codebooks["l3_code"])
+            elif name == config.FIELD_ISLAND_ID: columns[name] = pa.array([None if v is None or v == "" else (int(v) if is_int else str(v)) for v in values], type=pa.int64() if is_int else pa.string())
+            else: columns[name] = pa.array(values)
+        for phase_name, codes in zip(self.phase_names, self.phase_codes):
+            for column, field_name in PHASE_COLUMNS.items():
+                columns[phase_column_name(field_name, phase_name)] = dictionary_column(codes[column], self.codebooks[column])
+        table = pa.table(columns)
+        return table.replace_schema_metadata({_METADATA_KEY: json.dumps(self.phase_names).encode("utf-8")})
+
+    def write(self, path=None, fmt=None):
+        """Arrow IPC(.arrow) 또는 Parquet 파일 하나로 저장하고 경로를 반환합니다."""
+        pa = _require_pyarrow()
+        path = path or config.COLUMNAR_OUTPUT_PATH; fmt = _format_for(path, fmt)
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = self.to_arrow_table()
+        if fmt == "arrow":
+            # 압축하지 않아야 메모리 매핑으로 복사 없이 읽을 수 있습니다.
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer: writer.write_table(table)
+        else:
+            pa.parquet.write_table(table, path)
+        print(f"  컬럼형 Phase 결과 저장: {path} ({fmt}, 노드 {table.num_rows}개, Phase {len(self.phase_names)}개)")
+        return path
+
+
+def _open_table(path, columns=None, fmt=None):
+    pa = _require_pyarrow()
+    if _format_for(path, fmt) == "arrow":
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        return table.select(columns) if columns is not None else table
+    return pa.parquet.read_table(path, columns=columns, memory_map=True)
+
+
+def _schema(path, fmt=None):
+    pa = _require_pyarrow()
+    return pa.ipc.open_file(pa.memory_map(path, "r")).schema if _format_for(path, fmt) == "arrow" else pa.parquet.read_schema(path)
+
+
+def list_phases(path, fmt=None):
+    """파일에 저장된 Phase 이름 목록 (기준 상태 'Base' 포함)."""
+    return json.loads(_schema(path, fmt).metadata[_METADATA_KEY])
+
+
+def read_phase(path, phase_name, static_columns=None, fmt=None):
+    """
+    한 Phase의 노드 테이블(pyarrow.Table)을 읽습니다. 정적 컬럼 + 해당 Phase 범주 컬럼(접미사 없는 이름)으로 구성됩니다.
+    static_columns로 읽을 정적 컬럼을 줄일 수 있습니다 (기본: 전체).
+    """
+    schema = _schema(path, fmt)
+    if phase_name not in json.loads(schema.metadata[_METADATA_KEY]): raise KeyError(f"Phase 없음: {phase_name}")
+    if static_columns is None: static_columns = [name for name in schema.names if _PHASE_SEPARATOR not in name]
+    phase_columns = [phase_column_name(field_name, phase_name) for field_name in PHASE_COLUMNS.values()]
+    table = _open_table(path, list(static_columns) + phase_columns, fmt)
+    return table.rename_columns(list(static_columns) + list(PHASE_COLUMNS.values()))
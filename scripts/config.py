@@ -11,7 +11,14 @@ touching the core processing logic.
 # Full path to the output Geodatabase (GDB) where results will be stored.
 OUTPUT_GDB = r"C:\path\to\your\project\GIS_Data\MyProject.gdb"
 
-# Layer names as they appear in the ArcGIS Pro 'Contents' pane.
+# Storage backend: "arcpy" (layers from the active ArcGIS Pro map) or
+# "gpkg" (layers read directly from a GeoPackage, no arcpy required).
+BACKEND = "arcpy"
+# GeoPackage input/output used when BACKEND = "gpkg".
+GPKG_PATH = r"data/GAAT_Sample_Data.gpkg"
+OUTPUT_GPKG = r"output/GAAT_Results.gpkg"
+
+# Layer names as they appear in the ArcGIS Pro 'Contents' pane (or in the GeoPackage).
 LC_LAYER_NAME = "Sample_LandCover"
 GB_LAYER_NAME = "Sample_GB_Boundary"
 ISLAND_LAYER_NAME = "Sample_Islands"
@@ -33,9 +40,71 @@ FIELD_ORIG_POLY_FID = "ORIG_FID"
 FIELD_IS_GRAZING = "IsGrazing"
 FIELD_GRAZING_TYPE = "GrazingType"
 
+# Persistent cache of Step 1/Step 2 node tables, keyed by input layer contents and
+# the config values each step depends on. Least recently used entries are evicted
+# once the directory exceeds PREP_CACHE_MAX_BYTES.
+USE_PREP_CACHE = True
+PREP_CACHE_DIR = r"output/prep_cache"
+PREP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Streaming Step 1: read the land-cover layer in chunks of STEP1_CHUNK_ROWS rows and
+# build source nodes chunk by chunk instead of materializing scratch copies. In
+# headless mode the land-cover layer kept for Step 2 is also limited to the island extent.
+STEP1_STREAMING = False
+STEP1_CHUNK_ROWS = 50000
+
+# Tracing: record per-stage spans (1a-1d, 2a-2f, 3A-3D), rows read/written, geoprocessing
+# tool invocations and peak memory, and write them to TRACE_OUTPUT_PATH as a Chrome trace
+# ("chrome", open in chrome://tracing or ui.perfetto.dev) or a plain summary ("json").
+ENABLE_TRACING = False
+TRACE_OUTPUT_PATH = r"output/gac_trace.json"
+TRACE_FORMAT = "chrome"
+# Pause before/after file-GDB cursor passes in the arcpy Steps 2/3 (seconds, 0 disables).
+# Recorded as "settle" spans when tracing is on.
+CURSOR_SETTLE_DELAY = 0.5
+
 # --- 3. Simulation Scenario Parameters ---
 SIMULATION_PHASES_MIGRATION = [0.50, 0.80, 1.0]
 SIMULATION_PHASES_DEMOLITION = [0.50, 0.80, 1.0]
+# Seed for the Step 1 221/222 category draw and the phase source draws of the default
+# scenario (scenario.Scenario.from_config). None = a fresh random stream on every run.
+SCENARIO_SEED = None
+# Plan mode: after Steps 1/2, print the closed-form per-phase projection (expected
+# evolved modules by category, replacement slots, demolitions, sampling std) and skip
+# running the phases. Also written to Result_Phase_Plan.csv next to the outputs.
+PLAN_ONLY = False
+# If True, island nodes are loaded once into an in-memory columnar table and every
+# phase mutates that table instead of copying feature classes back and forth.
+USE_IN_MEMORY_NODE_STORE = True
+# Write a 'Result_Island_Nodes_{phase}' feature class after each in-memory phase.
+PERSIST_PHASE_RESULTS = True
+# Persist each phase as 'Result_Island_Nodes_{phase}_Delta' (changed nodes only) instead
+# of a full copy; full snapshots are then materialized on demand from base + deltas.
+PERSIST_PHASE_AS_DELTA = True
+# Materialize a full snapshot of the last phase after the loop (only used with deltas).
+MATERIALIZE_FINAL_SNAPSHOT = True
+# Columnar export: write all phases into one Arrow IPC ("arrow") or Parquet ("parquet")
+# file. Static node columns are stored once and status/label/grazing columns once per
+# phase, with coordinates as x/y columns. Requires pyarrow and the in-memory node store.
+EXPORT_COLUMNAR = False
+COLUMNAR_FORMAT = "arrow"
+COLUMNAR_OUTPUT_PATH = r"output/GAAT_Phase_Results.arrow"
+# Monte Carlo: run the full phase schedule many times with independent seeded RNG
+# streams and report per-node replace/demolish probabilities.
+RUN_MONTE_CARLO = False
+MONTE_CARLO_REALIZATIONS = 1000
+MONTE_CARLO_SEED = 20240601
+MONTE_CARLO_WORKERS = None  # None = os.cpu_count()
+# Share the prepared node tables with pool workers as read-only memory-mapped .npy
+# column files (written under SHARED_ARRAYS_DIR, None = system temp directory) instead
+# of pickling a full copy into every worker; workers copy only the mutable status columns.
+SHARE_NODE_ARRAYS = True
+SHARED_ARRAYS_DIR = None
+# Step 2e scoring: islands are independent, so large inputs are split into island shards
+# scored on a process pool. 1 = always serial; None = os.cpu_count(). Inputs with fewer
+# than SCORING_PARALLEL_MIN_NODES nodes are scored serially (pool start-up dominates).
+SCORING_WORKERS = 1
+SCORING_PARALLEL_MIN_NODES = 200_000
 
 # --- 4. Land Conversion Logic ---
 COMPRESSION_FACTORS = {
@@ -63,6 +132,13 @@ GRAZING_L3_CODES = [code for code in GRAZING_L3_CODES if code is not None]
 WEIGHT_STATUS = 0.5
 WEIGHT_INV_CEN_DIST = 0.3
 WEIGHT_INV_IND_DIST = 0.2
+# Per-island normalization of the two distance terms before weighting (nearer = 1):
+# "minmax" (range), "rank" (percentile rank), "zscore" (mean ± 3 std) or "robust" (5th-95th percentile).
+SSI_NORMALIZATION = "minmax"
+# Weight sweep: re-score ReplacePriority for every weight triple on a simplex grid
+# (step WEIGHT_SWEEP_STEP, weights summing to 1) and run the phase schedule for each.
+RUN_WEIGHT_SWEEP = False
+WEIGHT_SWEEP_STEP = 0.1
 
 # --- 7. Internal Script Constants ---
 STATUS_REPLACED = "Replaced"
@@ -72,6 +148,7 @@ STATUS_ORIGINAL_HIGH_PRI = "Original_Urban_HighPri"
 STATUS_ORIGINAL_TRANSPORT = "Original_Transport"
 STATUS_ORIGINAL_NONURBAN = "Original_NonUrban_Island"
 DEMOLISHED_LABEL = "Demolished_To_Grazing"
+# Missing distances are NULL/NaN; this value is only recognised as "missing" when reading older outputs.
 DEFAULT_LARGE_DISTANCE = 999999.0
 NODE_TYPE_LABELS = { '111': "URB-Res_Single", '112': "URB-Res_Multi", '121': "URB-Industrial", '131': "URB-Commercial", '132': "URB-Mixed", '141': "URB-Culture", '151': "INFRA-Airport", '152': "INFRA-Harbor", '153': "INFRA-Rail", '154': "INFRA-Road", '155': "INFRA-Other_Trans", '161': "URB-Infra_Env", '162': "URB-Public_EduAdmin", '163': "URB-Public_Other", '211': "AGR-Paddy_Managed", '212': "AGR-Paddy_Unmanaged", '221': "AGR-Field_Managed", '222': "AGR-Field_Unmanaged", '231': "AGR-Facility_Cult", '241': "AGR-Orchard", '251': "AGR-Pasture_Aqua", '311': "FOR-Deciduous", '321': "FOR-Coniferous", '331': "FOR-Mixed", '411': "NGRASS-Natural", '423': "NGRASS-Other", '623': "LAND-Bare_Other"}
 
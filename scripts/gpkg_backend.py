@@ -0,0 +1,698 @@
+# -*- coding: utf-8 -*-
+"""
+arcpy 없이 동작하는 GeoPackage 저장소/지오메트리 백엔드
+
+GeoPackage(SQLite) 파일에서 레이어를 직접 읽고(WKB 지오메트리 + 속성 컬럼),
+단계 1~3에 필요한 연산(위치 기반 선택, FeatureToPoint, Spatial Join, Near, 속성 갱신)을
+NumPy로 제공합니다. 배치 워커, Linux, CI 환경에서 파이프라인을 헤드리스로 실행할 때 사용합니다.
+"""
+import os
+import sqlite3
+import struct
+
+import numpy as np
+
+from . import config
+from . import instrumentation
+from . import scoring
+from . import simulation
+from .node_store import IslandNodeStore, PhaseDelta, SourceNodeTable
+from .scenario import resolve_scenario
+
+# 한 번에 비교할 (점 x 변) 쌍의 최대 개수. 메모리 사용량을 제한합니다.
+_CHUNK_PAIRS = 2_000_000
+# select_by_location의 bbox 격자: 격자 셀 수 상한과 한 번에 처리할 후보 피처 수
+_MAX_GRID_CELLS = 1 << 22
+_SELECT_CHUNK = 100_000
+
+
+# ----------------------------------------------------------------------------
+# WKB / GeoPackage 바이너리 파싱
+# ----------------------------------------------------------------------------
+
+def _parse_wkb(buf, offset=0):
+    """WKB 하나를 파싱하여 (폴리곤 목록, 다음 offset)을 반환. 폴리곤은 링(Nx2 배열)의 목록."""
+    byte_order = '<' if buf[offset] == 1 else '>'
+    geom_type = struct.unpack_from(byte_order + 'I', buf, offset + 1)[0]; offset += 5
+    has_z = False; has_m = False
+    if geom_type & 0x80000000: has_z = True
+    if geom_type & 0x40000000: has_m = True
+    geom_type &= 0x0FFFFFFF
+    if geom_type >= 3000: has_z = True; has_m = True; geom_type -= 3000
+    elif geom_type >= 2000: has_m = True; geom_type -= 2000
+    elif geom_type >= 1000: has_z = True; geom_type -= 1000
+    dims = 2 + int(has_z) + int(has_m)
+
+    def read_points(count, pos):
+        coords = np.frombuffer(buf, dtype=byte_order + 'f8', count=count * dims, offset=pos).reshape(count, dims)[:, :2]
+        return coords.astype(np.float64), pos + count * dims * 8
+
+    if geom_type == 1:
+        pt, offset = read_points(1, offset)
+        return [[pt]], offset
+    if geom_type == 3:
+        num_rings = struct.unpack_from(byte_order + 'I', buf, offset)[0]; offset += 4; rings = []
+        for _ in range(num_rings):
+            num_pts = struct.unpack_from(byte_order + 'I', buf, offset)[0]; offset += 4
+            ring, offset = read_points(num_pts, offset); rings.append(ring)
+        return [rings], offset
+    if geom_type in (4, 6, 7):
+        num_parts = struct.unpack_from(byte_order + 'I', buf, offset)[0]; offset += 4; polygons = []
+        for _ in range(num_parts):
+            parts, offset = _parse_wkb(buf, offset); polygons.extend(parts)
+        return polygons, offset
+    raise ValueError(f"지원하지 않는 WKB 지오메트리 타입: {geom_type}")
+
+
+def parse_gpkg_geometry(blob):
+    """GeoPackage 지오메트리 BLOB(GP 헤더 + WKB)을 Geometry로 변환. 빈 지오메트리는 None."""
+    if blob is None: return None
+    buf = bytes(blob)
+    if buf[:2] != b'GP': raise ValueError("GeoPackage 지오메트리 헤더(GP)가 아닙니다.")
+    flags = buf[3]
+    if flags & 0b10000: return None
+    envelope_size = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 0b111]
+    polygons, _ = _parse_wkb(buf, 8 + envelope_size)
+    return Geometry(polygons)
+
+
+def build_gpkg_point(x, y, srs_id):
+    """점 하나를 GeoPackage 지오메트리 BLOB으로 만듭니다."""
+    return b'GP' + struct.pack('<BBi', 0, 0b00000001, srs_id) + struct.pack('<BIdd', 1, 1, x, y)
+
+
+def build_gpkg_polygon(rings, srs_id):
+    """폴리곤 하나(링 목록, 첫 링이 외곽)를 GeoPackage 지오메트리 BLOB으로 만듭니다."""
+    wkb = [struct.pack('<BII', 1, 3, len(rings))]
+    for ring in rings:
+        ring = np.ascontiguousarray(ring, dtype='<f8').reshape(-1, 2)
+        wkb.append(struct.pack('<I', len(ring))); wkb.append(ring.tobytes())
+    return b'GP' + struct.pack('<BBi', 0, 0b00000001, srs_id) + b''.join(wkb)
+
+
+# ----------------------------------------------------------------------------
+# 지오메트리 및 레이어
+# ----------------------------------------------------------------------------
+
+class Geometry:
+    """(멀티)폴리곤 또는 점. polygons는 [링(Nx2), ...]의 목록입니다."""
+
+    def __init__(self, polygons):
+        self.polygons = polygons
+        all_pts = np.concatenate([ring for rings in polygons for ring in rings]) if polygons else np.empty((0, 2))
+        self.bbox = (all_pts[:, 0].min(), all_pts[:, 1].min(), all_pts[:, 0].max(), all_pts[:, 1].max()) if len(all_pts) else (np.nan,) * 4
+        self._edges = None
+
+    @property
+    def vertices(self):
+        return np.concatenate([ring for rings in self.polygons for ring in rings])
+
+    @property
+    def edges(self):
+        """모든 링의 변을 (x1, y1, x2, y2) 배열로 반환 (캐시)."""
+        if self._edges is None:
+            segs = [np.hstack([ring[:-1], ring[1:]]) for rings in self.polygons for ring in rings if len(ring) > 1]
+            self._edges = np.concatenate(segs) if segs else np.empty((0, 4))
+        return self._edges
+
+    def bbox_intersects(self, other):
+        a = self.bbox; b = other.bbox
+        return not (a[2] < b[0] or b[2] < a[0] or a[3] < b[1] or b[3] < a[1])
+
+
+class GpkgLayer:
+    """GeoPackage에서 읽은 피처 레이어 (속성은 컬럼 목록으로 보관)."""
+
+    def __init__(self, name, fids, attributes, geometries, srs_id=0, source_path=None):
+        self.name = name
+        self.fids = list(fids)
+        self.attributes = attributes
+        self.geometries = geometries
+        self.srs_id = srs_id
+        self.source_path = source_path
+
+    def __len__(self):
+        return len(self.fids)
+
+    @property
+    def field_names(self):
+        return list(self.attributes.keys())
+
+    def find_field(self, field_name):
+        """대소문자를 구분하지 않고 실제 필드 이름을 찾습니다. 없으면 None."""
+        for name in self.attributes:
+            if name.upper() == field_name.upper(): return name
+        return None
+
+    def values(self, field_name):
+        actual = self.find_field(field_name)
+        if actual is None: raise KeyError(f"레이어 '{self.name}'에 필드 '{field_name}' 없음.")
+        return self.attributes[actual]
+
+    def update_attribute(self, field_name, indices, values):
+        """지정한 행들의 속성 값을 갱신합니다. 필드가 없으면 새로 만듭니다."""
+        actual = self.find_field(field_name) or field_name
+        column = self.attributes.setdefault(actual, [None] * len(self.fids))
+        if np.isscalar(values) or values is None: values = [values] * len(indices)
+        for i, v in zip(indices, values): column[i] = v
+
+    def subset(self, indices, name=None):
+        indices = list(indices)
+        return GpkgLayer(name or self.name, [self.fids[i] for i in indices], {k: [v[i] for i in indices] for k, v in self.attributes.items()}, [self.geometries[i] for i in indices], self.srs_id, self.source_path)
+
+
+def list_layers(gpkg_path):
+    """GeoPackage의 피처 레이어 이름 목록."""
+    with sqlite3.connect(gpkg_path) as conn:
+        return [r[0] for r in conn.execute("SELECT table_name FROM gpkg_contents WHERE data_type = 'features'")]
+
+
+def _layer_schema(conn, gpkg_path, layer_name):
+    """(지오메트리 컬럼, srs_id, fid 컬럼, 속성 컬럼 목록)."""
+    row = conn.execute("SELECT column_name, srs_id FROM gpkg_geometry_columns WHERE table_name = ?", (layer_name,)).fetchone()
+    if row is None: raise ValueError(f"GeoPackage에 레이어 '{layer_name}' 없음. (존재: {list_layers(gpkg_path)})")
+    geom_col, srs_id = row
+    table_info = conn.execute(f'PRAGMA table_info("{layer_name}")').fetchall()
+    pk_cols = [c[1] for c in table_info if c[5]]
+    fid_col = pk_cols[0] if pk_cols else "rowid"
+    return geom_col, srs_id, fid_col, [c[1] for c in table_info if c[1] not in (geom_col, fid_col)]
+
+
+def iter_layer_chunks(gpkg_path, layer_name, chunk_rows=50000, where=None, params=()):
+    """
+    레이어를 chunk_rows 행씩 읽어 GpkgLayer 조각으로 내보냅니다. 전체 레이어를 메모리에 올리지 않습니다.
+    where(SQL, ? 파라미터는 params)로 속성 필터를 먼저 적용할 수 있습니다.
+    """
+    if not os.path.exists(gpkg_path): raise ValueError(f"GeoPackage 파일 없음: {gpkg_path}")
+    with sqlite3.connect(gpkg_path) as conn:
+        geom_col, srs_id, fid_col, attr_cols = _layer_schema(conn, gpkg_path, layer_name)
+        select_cols = ", ".join(f'"{c}"' for c in [fid_col, geom_col] + attr_cols)
+        cursor = conn.execute(f'SELECT {select_cols} FROM "{layer_name}"' + (f" WHERE {where}" if where else ""), params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows: break
+            instrumentation.count("rows_read", len(rows))
+            yield GpkgLayer(layer_name, [r[0] for r in rows], {c: [r[2 + i] for r in rows] for i, c in enumerate(attr_cols)}, [parse_gpkg_geometry(r[1]) for r in rows], srs_id, gpkg_path)
+
+
+def read_layer(gpkg_path, layer_name, bbox=None):
+    """
+    GeoPackage 피처 레이어 하나를 GpkgLayer로 읽어 들입니다.
+    bbox (xmin, ymin, xmax, ymax)를 주면 그 범위와 겹치는 피처만 남깁니다 (청크 단위로 읽으며 거름).
+    """
+    fids = []; geometries = []; attributes = None; srs_id = 0
+    for chunk in iter_layer_chunks(gpkg_path, layer_name):
+        keep = range(len(chunk)) if bbox is None else [i for i, g in enumerate(chunk.geometries) if g is not None and not (g.bbox[2] < bbox[0] or bbox[2] < g.bbox[0] or g.bbox[3] < bbox[1] or bbox[3] < g.bbox[1])]
+        if attributes is None: attributes = {c: [] for c in chunk.attributes}
+        fids.extend(chunk.fids[i] for i in keep); geometries.extend(chunk.geometries[i] for i in keep)
+        for c, values in chunk.attributes.items(): attributes[c].extend(values[i] for i in keep)
+        srs_id = chunk.srs_id
+    if attributes is None:
+        with sqlite3.connect(gpkg_path) as conn:
+            _, srs_id, _, attr_cols = _layer_schema(conn, gpkg_path, layer_name)
+        attributes = {c: [] for c in attr_cols}
+    print(f"  GeoPackage 레이어 로드: {layer_name} ({len(fids)}개 피처{'' if bbox is None else ', 범위 필터 적용'})")
+    return GpkgLayer(layer_name, fids, attributes, geometries, srs_id, gpkg_path)
+
+
+def layer_extent(layer):
+    """레이어 전체 지오메트리의 (xmin, ymin, xmax, ymax)."""
+    boxes = np.array([g.bbox for g in layer.geometries if g is not None], dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0: return None
+    return float(boxes[:, 0].min()), float(boxes[:, 1].min()), float(boxes[:, 2].max()), float(boxes[:, 3].max())
+
+
+def _write_feature_layer(gpkg_path, layer_name, geometry_type, blobs, bounds, columns, srs_id):
+    """지오메트리 BLOB 목록과 속성 컬럼으로 피처 레이어를 씁니다. 같은 이름의 레이어가 있으면 덮어씁니다."""
+    conn = sqlite3.connect(gpkg_path)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)")
+        conn.execute("INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', NULL), ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE, description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)")
+        conn.execute("CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL, CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name))")
+        conn.execute(f'DROP TABLE IF EXISTS "{layer_name}"')
+        conn.execute("DELETE FROM gpkg_contents WHERE table_name = ?", (layer_name,))
+        conn.execute("DELETE FROM gpkg_geometry_columns WHERE table_name = ?", (layer_name,))
+        sql_types = {}
+        for name, values in columns.items():
+            sample = next((v for v in values if v is not None), "")
+            sql_types[name] = "INTEGER" if isinstance(sample, (int, np.integer)) and not isinstance(sample, bool) else ("REAL" if isinstance(sample, (float, np.floating)) else "TEXT")
+        col_defs = ", ".join(f'"{name}" {sql_types[name]}' for name in columns)
+        conn.execute(f'CREATE TABLE "{layer_name}" (fid INTEGER PRIMARY KEY AUTOINCREMENT, geom {geometry_type}{", " + col_defs if col_defs else ""})')
+        conn.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, 0, 0)", (layer_name, geometry_type, srs_id))
+        conn.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id) VALUES (?, 'features', ?, ?, ?, ?, ?, ?)", (layer_name, layer_name) + tuple(bounds) + (srs_id,))
+        names = list(columns.keys())
+        placeholders = ", ".join(["?"] * (len(names) + 1))
+        insert_sql = f'INSERT INTO "{layer_name}" (geom{"".join(", " + chr(34) + n + chr(34) for n in names)}) VALUES ({placeholders})'
+
+        def to_sql(v):
+            return v.item() if isinstance(v, np.generic) else v
+        rows = ((blob,) + tuple(to_sql(columns[n][i]) for n in names) for i, blob in enumerate(blobs))
+        instrumentation.count("rows_written", conn.executemany(insert_sql, rows).rowcount)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def write_point_layer(gpkg_path, layer_name, x, y, columns, srs_id=0):
+    """점 레이어를 GeoPackage에 씁니다. 같은 이름의 레이어가 있으면 덮어씁니다."""
+    x = np.asarray(x, dtype=np.float64); y = np.asarray(y, dtype=np.float64)
+    bounds = (float(np.nanmin(x)), float(np.nanmin(y)), float(np.nanmax(x)), float(np.nanmax(y))) if len(x) else (None,) * 4
+    _write_feature_layer(gpkg_path, layer_name, "POINT", (build_gpkg_point(float(x[i]), float(y[i]), srs_id) for i in range(len(x))), bounds, columns, srs_id)
+    print(f"  GeoPackage 레이어 저장: {layer_name} ({len(x)}개 포인트)")
+    return f"{gpkg_path}|{layer_name}"
+
+
+def write_polygon_layer(gpkg_path, layer_name, polygons, columns, srs_id=0):
+    """폴리곤 레이어를 GeoPackage에 씁니다. polygons는 피처마다 링(Nx2) 목록입니다."""
+    points = np.concatenate([np.asarray(ring, dtype=np.float64).reshape(-1, 2) for rings in polygons for ring in rings]) if polygons else np.empty((0, 2))
+    bounds = (float(points[:, 0].min()), float(points[:, 1].min()), float(points[:, 0].max()), float(points[:, 1].max())) if len(points) else (None,) * 4
+    _write_feature_layer(gpkg_path, layer_name, "POLYGON", (build_gpkg_polygon(rings, srs_id) for rings in polygons), bounds, columns, srs_id)
+    print(f"  GeoPackage 레이어 저장: {layer_name} ({len(polygons)}개 폴리곤)")
+    return f"{gpkg_path}|{layer_name}"
+
+
+# ----------------------------------------------------------------------------
+# 지오메트리 연산
+# ----------------------------------------------------------------------------
+
+def points_in_geometry(points_xy, geometry):
+    """점 배열(Nx2)이 (멀티)폴리곤 내부에 있는지 even-odd 규칙으로 판정합니다."""
+    points_xy = np.asarray(points_xy, dtype=np.float64).reshape(-1, 2)
+    inside = np.zeros(len(points_xy), dtype=bool)
+    if geometry is None or len(points_xy) == 0: return inside
+    edges = geometry.edges
+    if len(edges) == 0: return inside
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    chunk = max(1, _CHUNK_PAIRS // len(edges))
+    for start in range(0, len(points_xy), chunk):
+        px = points_xy[start:start + chunk, 0:1]; py = points_xy[start:start + chunk, 1:2]
+        straddle = (y1 > py) != (y2 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+        crossings = np.count_nonzero(straddle & (px < x_cross), axis=1)
+        inside[start:start + chunk] = (crossings % 2) == 1
+    return inside
+
+
+def _segments_intersect(edges_a, edges_b):
+    """두 변 집합 사이에 교차(접촉 포함)하는 쌍이 하나라도 있는지 확인합니다."""
+    if len(edges_a) == 0 or len(edges_b) == 0: return False
+    chunk = max(1, _CHUNK_PAIRS // len(edges_b))
+    bx1, by1, bx2, by2 = edges_b[:, 0], edges_b[:, 1], edges_b[:, 2], edges_b[:, 3]
+    for start in range(0, len(edges_a), chunk):
+        a = edges_a[start:start + chunk]
+        ax1, ay1, ax2, ay2 = a[:, 0:1], a[:, 1:2], a[:, 2:3], a[:, 3:4]
+        d1 = (bx2 - bx1) * (ay1 - by1) - (by2 - by1) * (ax1 - bx1)
+        d2 = (bx2 - bx1) * (ay2 - by1) - (by2 - by1) * (ax2 - bx1)
+        d3 = (ax2 - ax1) * (by1 - ay1) - (ay2 - ay1) * (bx1 - ax1)
+        d4 = (ax2 - ax1) * (by2 - ay1) - (ay2 - ay1) * (bx2 - ax1)
+        boxes_overlap = (np.minimum(ax1, ax2) <= np.maximum(bx1, bx2)) & (np.minimum(bx1, bx2) <= np.maximum(ax1, ax2)) & (np.minimum(ay1, ay2) <= np.maximum(by1, by2)) & (np.minimum(by1, by2) <= np.maximum(ay1, ay2))
+        if np.any((d1 * d2 <= 0) & (d3 * d4 <= 0) & boxes_overlap): return True
+    return False
+
+
+def geometries_intersect(a, b):
+    """두 폴리곤 지오메트리가 교차(접촉 포함)하는지 판정합니다. (arcpy 'INTERSECT'와 동일한 의미)"""
+    if a is None or b is None or not a.bbox_intersects(b): return False
+    if np.any(points_in_geometry(a.vertices[:1], b)) or np.any(points_in_geometry(b.vertices[:1], a)): return True
+    bx0, by0, bx1, by1 = a.bbox
+    eb = b.edges
+    near_b = eb[(np.maximum(eb[:, 0], eb[:, 2]) >= bx0) & (np.minimum(eb[:, 0], eb[:, 2]) <= bx1) & (np.maximum(eb[:, 1], eb[:, 3]) >= by0) & (np.minimum(eb[:, 1], eb[:, 3]) <= by1)]
+    return _segments_intersect(a.edges, near_b)
+
+
+def _bbox_array(geometries, indices=None):
+    """지오메트리 bbox를 (N x 4) 배열로 (지오메트리가 없으면 NaN)."""
+    indices = range(len(geometries)) if indices is None else indices
+    boxes = np.array([geometries[i].bbox if geometries[i] is not None else (np.nan,) * 4 for i in indices], dtype=np.float64)
+    return boxes.reshape(-1, 4)
+
+
+def _expand_cells(boxes, x0, y0, cell_size, nx, ny):
+    """bbox마다 덮는 격자 셀을 펼칩니다. 반환: (bbox 행, 셀 번호). 격자 밖 부분은 잘라냅니다."""
+    cx0 = np.clip(((boxes[:, 0] - x0) // cell_size).astype(np.int64), 0, nx - 1); cx1 = np.clip(((boxes[:, 2] - x0) // cell_size).astype(np.int64), 0, nx - 1)
+    cy0 = np.clip(((boxes[:, 1] - y0) // cell_size).astype(np.int64), 0, ny - 1); cy1 = np.clip(((boxes[:, 3] - y0) // cell_size).astype(np.int64), 0, ny - 1)
+    width = cx1 - cx0 + 1; counts = width * (cy1 - cy0 + 1)
+    rows = np.repeat(np.arange(len(boxes)), counts)
+    local = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, (cy0[rows] + local // width[rows]) * nx + cx0[rows] + local % width[rows]
+
+
+def bbox_overlap_pairs(boxes_a, boxes_b):
+    """
+    bbox가 겹치는 (a 행, b 행) 쌍 전체 (a 행 순, 같은 a 안에서는 b 행 순). NaN bbox는 제외합니다.
+    b의 bbox를 균일 격자(셀 크기: b bbox 긴 변의 중앙값)의 셀마다 등록하고, a의 bbox가 덮는 셀의 b만 비교하므로
+    비교 횟수는 N x M이 아니라 실제로 가까운 쌍의 수에 비례합니다.
+    """
+    valid_b = np.flatnonzero(np.all(np.isfinite(boxes_b), axis=1)); valid_a = np.flatnonzero(np.all(np.isfinite(boxes_a), axis=1))
+    if len(valid_a) == 0 or len(valid_b) == 0: return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    bb = boxes_b[valid_b]
+    x0, y0 = bb[:, 0].min(), bb[:, 1].min(); width, height = bb[:, 2].max() - x0, bb[:, 3].max() - y0
+    cell_size = float(np.median(np.maximum(bb[:, 2] - bb[:, 0], bb[:, 3] - bb[:, 1])))
+    cell_size = max(cell_size, np.sqrt(width * height / _MAX_GRID_CELLS), max(width, height) / _MAX_GRID_CELLS, 1e-9)
+    nx = int(width // cell_size) + 1; ny = int(height // cell_size) + 1
+    b_rows, b_cells = _expand_cells(bb, x0, y0, cell_size, nx, ny)
+    order = np.argsort(b_cells, kind="stable"); b_rows = valid_b[b_rows[order]]; b_cells = b_cells[order]
+    cell_start = np.searchsorted(b_cells, np.arange(nx * ny)); cell_count = np.searchsorted(b_cells, np.arange(nx * ny), side="right") - cell_start
+    pairs_a = []; pairs_b = []
+    for start in range(0, len(valid_a), _SELECT_CHUNK):
+        rows_a = valid_a[start:start + _SELECT_CHUNK]; ba = boxes_a[rows_a]
+        # 격자 범위 밖의 a는 어떤 b와도 겹치지 않습니다.
+        inside = (ba[:, 2] >= x0) & (ba[:, 0] <= x0 + width) & (ba[:, 3] >= y0) & (ba[:, 1] <= y0 + height)
+        rows_a = rows_a[inside]; ba = ba[inside]
+        a_rows, a_cells = _expand_cells(ba, x0, y0, cell_size, nx, ny)
+        counts = cell_count[a_cells]
+        pa = np.repeat(a_rows, counts)
+        pb = b_rows[np.repeat(cell_start[a_cells], counts) + np.arange(len(pa)) - np.repeat(np.cumsum(counts) - counts, counts)]
+        box_a = ba[pa]; box_b = boxes_b[pb]
+        keep = (box_a[:, 0] <= box_b[:, 2]) & (box_b[:, 0] <= box_a[:, 2]) & (box_a[:, 1] <= box_b[:, 3]) & (box_b[:, 1] <= box_a[:, 3])
+        # 여러 셀에 함께 걸친 쌍은 한 번만 남깁니다.
+        pair_keys = np.unique(rows_a[pa[keep]] * len(boxes_b) + pb[keep])
+        pairs_a.append(pair_keys // len(boxes_b)); pairs_b.append(pair_keys % len(boxes_b))
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def select_by_location(layer, select_layer, candidates=None):
+    """
+    layer에서 select_layer의 피처 중 하나라도 교차하는 피처의 인덱스 목록 (SelectLayerByLocation 'INTERSECT').
+    bbox가 겹치는 쌍만 bbox_overlap_pairs로 고른 뒤, 후보의 첫 꼭짓점이 select 피처 안에 있는 쌍을
+    select 피처별 점-폴리곤 판정 한 번으로 먼저 확정하고, 남은 경계 쌍만 geometries_intersect로 판정합니다.
+    """
+    candidates = np.arange(len(layer)) if candidates is None else np.asarray(candidates, dtype=np.int64)
+    pair_a, pair_b = bbox_overlap_pairs(_bbox_array(layer.geometries, candidates), _bbox_array(select_layer.geometries))
+    if len(pair_a) == 0: return []
+    first_vertex = np.array([layer.geometries[candidates[a]].polygons[0][0][0] for a in np.unique(pair_a).tolist()]).reshape(-1, 2)
+    vertex_row = np.searchsorted(np.unique(pair_a), pair_a)
+    hit = np.zeros(len(pair_a), dtype=bool)
+    order = np.argsort(pair_b, kind="stable"); b_values, b_start = np.unique(pair_b[order], return_index=True)
+    for b, rows in zip(b_values.tolist(), np.split(order, b_start[1:])):
+        hit[rows] = points_in_geometry(first_vertex[vertex_row[rows]], select_layer.geometries[b])
+    is_selected = np.zeros(len(candidates), dtype=bool); is_selected[pair_a[hit]] = True
+    for a, b in zip(pair_a[~hit].tolist(), pair_b[~hit].tolist()):
+        if not is_selected[a] and geometries_intersect(layer.geometries[candidates[a]], select_layer.geometries[b]): is_selected[a] = True
+    return candidates[is_selected].tolist()
+
+
+def _scanline_inside_point(rings):
+    """파트 하나(링 목록)의 중간 높이 수평선에서 가장 넓은 내부 구간의 중점. 오목하거나 구멍이 있는 폴리곤용."""
+    part = Geometry([rings])
+    y_mid = (part.bbox[1] + part.bbox[3]) / 2.0
+    e = part.edges
+    straddle = (e[:, 1] > y_mid) != (e[:, 3] > y_mid)
+    e = e[straddle]
+    if len(e) < 2: return float(part.vertices[0, 0]), float(part.vertices[0, 1])
+    xs = np.sort(e[:, 0] + (y_mid - e[:, 1]) * (e[:, 2] - e[:, 0]) / (e[:, 3] - e[:, 1]))
+    widths = xs[1::2] - xs[0::2][:len(xs[1::2])]
+    k = int(np.argmax(widths))
+    return float((xs[2 * k] + xs[2 * k + 1]) / 2.0), float(y_mid)
+
+
+def polygon_label_points(geometries):
+    """
+    (멀티)폴리곤 목록의 면적 가중 중심과 내부 보장점(FeatureToPoint 'INSIDE')을 한 번에 계산합니다.
+    모든 링의 꼭짓점을 하나의 배열로 이어 붙여 링·파트·피처별 면적과 모멘트를 bincount로 합산하고,
+    중심의 내부 여부도 전체 변 배열에 대한 even-odd 판정 한 번으로 확인합니다.
+    중심이 폴리곤 밖에 있는 피처(오목, 구멍)만 가장 큰 파트의 수평 주사선으로 내부점을 다시 찾습니다.
+    반환: (centroids Nx2, inside_points Nx2) — 지오메트리가 없으면 NaN, 면적이 0이면 중심만 NaN
+    """
+    n = len(geometries)
+    centroids = np.full((n, 2), np.nan); inside = np.full((n, 2), np.nan)
+    ring_arrays = []; ring_feature = []; ring_part = []; ring_is_outer = []; part_rings = []
+    for f, geom in enumerate(geometries):
+        if geom is None: continue
+        if len(geom.polygons) == 1 and len(geom.polygons[0]) == 1 and len(geom.polygons[0][0]) == 1:
+            centroids[f] = inside[f] = geom.polygons[0][0][0]; continue
+        for rings in geom.polygons:
+            for k, ring in enumerate(rings):
+                if len(ring) == 0: continue
+                ring_arrays.append(ring); ring_feature.append(f); ring_part.append(len(part_rings)); ring_is_outer.append(k == 0)
+            part_rings.append(rings)
+    if not ring_arrays: return centroids, inside
+    ring_feature = np.array(ring_feature, dtype=np.int64); ring_part = np.array(ring_part, dtype=np.int64); ring_is_outer = np.array(ring_is_outer, dtype=bool)
+    ring_len = np.array([len(ring) for ring in ring_arrays], dtype=np.int64)
+    vertices = np.concatenate(ring_arrays)
+    # 변 = 링 안에서 연속한 두 꼭짓점 (각 링의 마지막 꼭짓점에서 시작하는 변은 없음)
+    is_edge_start = np.ones(len(vertices), dtype=bool); is_edge_start[np.cumsum(ring_len) - 1] = False
+    start = np.flatnonzero(is_edge_start)
+    x1 = vertices[start, 0]; y1 = vertices[start, 1]; x2 = vertices[start + 1, 0]; y2 = vertices[start + 1, 1]
+    edge_ring = np.repeat(np.arange(len(ring_len)), ring_len - 1); edge_feature = ring_feature[edge_ring]
+
+    cross = x1 * y2 - x2 * y1
+    ring_area = np.bincount(edge_ring, cross, len(ring_len)) / 2.0
+    degenerate = np.abs(ring_area) < 1e-12
+    safe_area = np.where(degenerate, 1.0, ring_area)
+    ring_cx = np.bincount(edge_ring, (x1 + x2) * cross, len(ring_len)) / (6.0 * safe_area)
+    ring_cy = np.bincount(edge_ring, (y1 + y2) * cross, len(ring_len)) / (6.0 * safe_area)
+    # 외곽 링과 구멍의 방향이 서로 반대라는 가정 없이, 외곽 링 기준으로 부호를 맞춥니다.
+    signed = np.where(degenerate, 0.0, np.where(ring_is_outer, np.abs(ring_area), -np.abs(ring_area)))
+    part_area = np.bincount(ring_part, signed, len(part_rings))
+    total_area = np.bincount(ring_feature, signed, n)
+    has_area = np.abs(total_area) > 1e-12
+    safe_total = np.where(has_area, total_area, 1.0)
+    centroids[has_area, 0] = (np.bincount(ring_feature, signed * ring_cx, n) / safe_total)[has_area]
+    centroids[has_area, 1] = (np.bincount(ring_feature, signed * ring_cy, n) / safe_total)[has_area]
+
+    # 각 피처의 중심을 자기 피처의 변들에 대해서만 even-odd 판정
+    px = centroids[edge_feature, 0]; py = centroids[edge_feature, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+        crossing = ((y1 > py) != (y2 > py)) & (px < x_cross)
+    centroid_inside = has_area & (np.bincount(edge_feature[crossing], minlength=n) % 2 == 1)
+    inside[centroid_inside] = centroids[centroid_inside]
+
+    # 나머지 피처: 면적이 가장 큰 파트(동률이면 앞 파트)에서 주사선으로 내부점 계산
+    part_feature = np.zeros(len(part_rings), dtype=np.int64); part_feature[ring_part] = ring_feature
+    for f in np.flatnonzero(~centroid_inside & np.isin(np.arange(n), ring_feature)).tolist():
+        parts = np.flatnonzero(part_feature == f)
+        inside[f] = _scanline_inside_point(part_rings[parts[int(np.argmax(part_area[parts]))]])
+    return centroids, inside
+
+
+def inside_point(geometry):
+    """폴리곤 내부에 반드시 놓이는 점 (FeatureToPoint 'INSIDE'). 여러 피처는 polygon_label_points로 한 번에 계산합니다."""
+    x, y = polygon_label_points([geometry])[1][0]
+    return float(x), float(y)
+
+
+def feature_to_point(layer, indices=None):
+    """선택한 피처들의 내부 점 좌표(Nx2)를 계산합니다."""
+    indices = range(len(layer)) if indices is None else indices
+    return polygon_label_points([layer.geometries[i] for i in indices])[1].reshape(-1, 2)
+
+
+def island_label_points(island_ids, geometries):
+    """
+    섬 폴리곤별 면적 가중 중심과 내부 보장점. island_ids와 같은 순서의 (ids, centroids Nx2, inside_points Nx2)를 반환합니다.
+    지오메트리가 없는 섬은 제외합니다.
+    """
+    centroids, inside = polygon_label_points(geometries)
+    keep = [i for i, geom in enumerate(geometries) if geom is not None]
+    return [island_ids[i] for i in keep], centroids[keep], inside[keep]
+
+
+def parse_wkb_geometry(wkb):
+    """WKB(arcpy 'SHAPE@WKB' 등)를 Geometry로 변환합니다. 비어 있으면 None."""
+    if wkb is None: return None
+    polygons, _ = _parse_wkb(bytes(wkb))
+    return Geometry(polygons) if polygons else None
+
+
+def spatial_join(points_xy, polygon_layer, join_field):
+    """각 점을 포함하는 첫 번째 폴리곤의 join_field 값을 반환 (JOIN_ONE_TO_ONE, KEEP_ALL, 'First')."""
+    points_xy = np.asarray(points_xy, dtype=np.float64).reshape(-1, 2)
+    values = polygon_layer.values(join_field)
+    result = [None] * len(points_xy); unassigned = np.ones(len(points_xy), dtype=bool)
+    for geom, value in zip(polygon_layer.geometries, values):
+        if geom is None or not unassigned.any(): continue
+        x0, y0, x1, y1 = geom.bbox
+        cand = np.flatnonzero(unassigned & (points_xy[:, 0] >= x0) & (points_xy[:, 0] <= x1) & (points_xy[:, 1] >= y0) & (points_xy[:, 1] <= y1))
+        if len(cand) == 0: continue
+        hit = cand[points_in_geometry(points_xy[cand], geom)]
+        for i in hit: result[i] = value
+        unassigned[hit] = False
+    return result
+
+
+def near(from_xy, to_xy, from_ids=None, to_ids=None):
+    """
+    각 from 점에서 가장 가까운 to 점까지의 거리와 인덱스 (Near, PLANAR).
+    from_ids/to_ids가 주어지면 같은 ID끼리는 제외합니다 (같은 데이터셋에 대한 Near와 동일). 대상이 없으면 거리 -1.
+    """
+    from_xy = np.asarray(from_xy, dtype=np.float64).reshape(-1, 2); to_xy = np.asarray(to_xy, dtype=np.float64).reshape(-1, 2)
+    dist = np.full(len(from_xy), -1.0); nearest = np.full(len(from_xy), -1, dtype=np.int64)
+    if len(from_xy) == 0 or len(to_xy) == 0: return dist, nearest
+    chunk = max(1, _CHUNK_PAIRS // len(to_xy))
+    for start in range(0, len(from_xy), chunk):
+        block = from_xy[start:start + chunk]
+        d2 = (block[:, 0:1] - to_xy[:, 0]) ** 2 + (block[:, 1:2] - to_xy[:, 1]) ** 2
+        if from_ids is not None and to_ids is not None:
+            d2[np.asarray(from_ids)[start:start + chunk, None] == np.asarray(to_ids)[None, :]] = np.inf
+        k = np.argmin(d2, axis=1); best = d2[np.arange(len(block)), k]
+        ok = np.isfinite(best)
+        dist[start:start + chunk][ok] = np.sqrt(best[ok]); nearest[start:start + chunk][ok] = k[ok]
+    return dist, nearest
+
+
+# ----------------------------------------------------------------------------
+# 단계 1~2 (헤드리스)
+# ----------------------------------------------------------------------------
+
+def prepare_source_greenbelt_nodes(lc_layer, gb_layer, island_layer, scenario=None):
+    """[단계 1] GeoPackage 레이어로 '자원(Source)' 노드를 준비합니다. (SourceNodeTable, ID 목록) 반환."""
+    scenario = resolve_scenario(scenario)
+    print("단계 1 (GeoPackage): 원본 그린벨트 노드 준비 시작..."); stages = instrumentation.stages("step1")
+    stages.next("1a_select"); print("  1a. 영역 선택...")
+    in_gb = select_by_location(lc_layer, gb_layer)
+    in_islands = set(select_by_location(lc_layer, island_layer, candidates=in_gb))
+    selected = [i for i in in_gb if i not in in_islands]
+    print(f"  선택된 폴리곤 수: {len(selected)}")
+    if not selected: raise Exception("그린벨트 내, 섬 외부 폴리곤 없음.")
+    stages.next("1b_filter"); print("  1b. 원천 유형 필터링...")
+    codes_all = lc_layer.values(config.FIELD_L3_CODE)
+    selected = [i for i in selected if codes_all[i] is not None and str(codes_all[i]).strip() in scenario.source_codes]
+    print(f"  필터링 후 폴리곤 수: {len(selected)}")
+    if not selected: raise Exception("필터링 후 남은 원본 그린벨트 폴리곤 없음.")
+    stages.next("1c_feature_to_point"); print("  1c. 폴리곤을 노드로 변환...")
+    xy = feature_to_point(lc_layer, selected)
+    stages.next("1d_classify"); print("  1d. EvolvedCategory / CompressionFactor 계산...")
+    codes = np.array([str(codes_all[i]).strip() for i in selected], dtype=object)
+    category_idx, factors = simulation.classify_source_codes(codes, scenario=scenario)
+    keep = np.flatnonzero(category_idx >= 0)  # 유효하지 않은 행은 마스크로 제외 (UniqueID는 선택 순번 유지, 스트리밍 모드와 같음)
+    dropped = len(selected) - len(keep)
+    if dropped: print(f"  경고: 유효하지 않은 노드 {dropped}개 삭제.")
+    table = SourceNodeTable(keep + 1, np.array(scenario.evolved_categories, dtype=object)[category_idx[keep]], factors[keep], codes[keep], x=xy[keep, 0], y=xy[keep, 1])
+    stages.close(); print(f"단계 1 완료. 최종 원본 노드 수: {len(table)}")
+    if len(table) == 0: print("  치명적 경고: 단계 1 결과 유효한 원본 노드가 없습니다.")
+    return table, table.unique_id.tolist()
+
+
+def prepare_source_greenbelt_nodes_streaming(lc_layer, gb_layer, island_layer, chunk_rows=None, scenario=None):
+    """
+    [단계 1, 스트리밍] 토지피복 원본 테이블을 청크 단위로 읽어 원천 코드 필터 -> 위치 선택 -> 내부점 ->
+    EvolvedCategory 계산을 청크마다 끝내고, 결과는 코드 인덱스(uint8)와 좌표 배열로만 누적합니다.
+    lc_layer는 원본 위치(source_path, name)만 사용하므로 범위 필터로 줄여 읽은 레이어여도 됩니다.
+    UniqueID는 비스트리밍 모드와 같이 선택된 원천 폴리곤의 순번(1부터, 유효하지 않은 행의 번호는 비워 둠)입니다.
+    """
+    chunk_rows = chunk_rows or config.STEP1_CHUNK_ROWS; scenario = resolve_scenario(scenario)
+    print(f"단계 1 (GeoPackage, 스트리밍 {chunk_rows}행 단위): 원본 그린벨트 노드 준비 시작...")
+    with sqlite3.connect(lc_layer.source_path) as conn:
+        attr_cols = _layer_schema(conn, lc_layer.source_path, lc_layer.name)[3]
+    code_col = next((c for c in attr_cols if c.upper() == config.FIELD_L3_CODE.upper()), None)
+    if code_col is None: raise ValueError(f"레이어 '{lc_layer.name}'에 필드 '{config.FIELD_L3_CODE}' 없음.")
+    source_codes = sorted(scenario.source_codes)
+    # 원천 코드 필터는 SQL에서 먼저 적용 (코드 목록은 설정값이라 길이가 고정됨)
+    where = f'TRIM(CAST("{code_col}" AS TEXT)) IN ({", ".join("?" * len(source_codes))})'
+    categories = list(scenario.evolved_categories); sorted_source_codes = np.array(source_codes, dtype=str)
+    # 221/222 추첨 난수는 청크 사이에 이어서 뽑습니다 (청크마다 같은 시드로 다시 시작하지 않음)
+    draw_rng = np.random.default_rng(scenario.seed)
+    xs = [np.zeros(0)]; ys = [np.zeros(0)]; ids = [np.zeros(0, dtype=np.int64)]; code_idx = [np.zeros(0, dtype=np.uint8)]; category_idx = [np.zeros(0, dtype=np.uint8)]; factors = [np.zeros(0, dtype=np.int64)]
+    n_read = 0; n_selected = 0; n_valid = 0
+    for chunk in iter_layer_chunks(lc_layer.source_path, lc_layer.name, chunk_rows, where, source_codes):
+        with instrumentation.span("step1.chunk", rows=len(chunk)):
+            n_read += len(chunk)
+            in_gb = select_by_location(chunk, gb_layer)
+            in_islands = set(select_by_location(chunk, island_layer, candidates=in_gb))
+            selected = [i for i in in_gb if i not in in_islands]
+            chunk_ids = np.arange(n_selected + 1, n_selected + len(selected) + 1, dtype=np.int64); n_selected += len(selected)
+            if not selected: continue
+            xy = feature_to_point(chunk, selected)
+            all_codes = chunk.values(code_col)
+            codes = np.array([str(all_codes[i]).strip() for i in selected], dtype=object)
+            chunk_category_idx, chunk_factors = simulation.classify_source_codes(codes, draw_rng, scenario)
+            keep = chunk_category_idx >= 0
+            xs.append(xy[keep, 0]); ys.append(xy[keep, 1]); ids.append(chunk_ids[keep]); factors.append(chunk_factors[keep]); category_idx.append(chunk_category_idx[keep].astype(np.uint8))
+            code_idx.append(np.searchsorted(sorted_source_codes, codes[keep].astype(str)).astype(np.uint8))
+            n_valid += int(np.count_nonzero(keep))
+            print(f"  청크 처리: 읽음 {n_read}개, 선택 {n_selected}개, 유효 노드 {n_valid}개")
+    if n_selected == 0: raise Exception("그린벨트 내, 섬 외부 원천 유형 폴리곤 없음.")
+    code_idx = np.concatenate(code_idx); category_idx = np.concatenate(category_idx)
+    dropped = n_selected - n_valid
+    if dropped: print(f"  경고: 유효하지 않은 노드 {dropped}개 제외.")
+    unique_ids = np.concatenate(ids)
+    table = SourceNodeTable(unique_ids, np.array(categories, dtype=object)[category_idx], np.concatenate(factors), sorted_source_codes.astype(object)[code_idx], x=np.concatenate(xs), y=np.concatenate(ys))
+    print(f"단계 1 완료. 최종 원본 노드 수: {len(table)}")
+    if len(table) == 0: print("  치명적 경고: 단계 1 결과 유효한 원본 노드가 없습니다.")
+    return table, table.unique_id
+
+
+def prepare_target_island_nodes(lc_layer, island_layer, scenario=None):
+    """[단계 2] GeoPackage 레이어로 '대상(Target)' 노드를 준비하고 섬별 우선순위를 계산합니다."""
+    scenario = resolve_scenario(scenario)
+    print("단계 2 (GeoPackage): 대체 대상 섬 노드 준비 및 섬별 우선순위 계산 시작...")
+    island_id_field = island_layer.find_field(config.FIELD_ISLAND_ID_IN_POLYGONS)
+    if island_id_field is None: raise ValueError(f"오류: 섬 폴리곤 ID 필드 '{config.FIELD_ISLAND_ID_IN_POLYGONS}' 없음.")
+    stages = instrumentation.stages("step2"); stages.next("2b_select_feature_to_point"); print("  2b. 모든 섬 내부 토지피복 선택 및 노드 생성...")
+    selected = select_by_location(lc_layer, island_layer)
+    if not selected: raise Exception("섬 내 토지피복 폴리곤 없음.")
+    xy = feature_to_point(lc_layer, selected)
+    codes_all = lc_layer.values(config.FIELD_L3_CODE)
+    codes = [None if codes_all[i] is None else str(codes_all[i]).strip() for i in selected]
+    print(f"    생성된 총 섬 노드 수: {len(selected)}")
+    stages.next("2c_status_labels"); print("  2c. 초기 필드 추가 (UniqueID, Status, Label)...")
+    unique_ids = np.arange(1, len(selected) + 1, dtype=np.int64)
+    status_label = [simulation.classify_island_code(code, scenario) for code in codes]
+    statuses = [s for s, _ in status_label]; labels = [l for _, l in status_label]
+    replaceable = np.array([s in (config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI) for s in statuses], dtype=bool)
+    total_original_replaceable_count = int(np.count_nonzero(replaceable))
+    print(f"    초기 대체 가능 도시 노드 총 수 (Low+High, 임야 제외): {total_original_replaceable_count}")
+    stages.next("2d_spatial_join"); print(f"  2d. 각 노드에 섬 ID ({config.FIELD_ISLAND_ID}) 할당 (Spatial Join)...")
+    island_ids = spatial_join(xy, island_layer, island_id_field)
+    null_count = sum(1 for v in island_ids if v is None or v == '')
+    if null_count > 0: print(f"    경고: {null_count}개 노드에 섬 ID 할당 안됨.")
+    stages.next("2e_near_scoring"); print("  2e. 섬별 우선순위 계산 (거리:중심, 거리:공업, 전체 섬 일괄)...")
+    label_ids, _, label_xy = island_label_points(island_layer.values(island_id_field), island_layer.geometries)
+    cen_dist, ind_dist, priority = scoring.score_island_nodes(unique_ids, xy[:, 0], xy[:, 1], island_ids, statuses, codes, label_ids, label_xy[:, 0], label_xy[:, 1], scenario=scenario)
+    stages.next("2f_rank"); print("\n  2f. 전역 우선순위 목록 생성...")
+    store = IslandNodeStore(unique_ids, statuses, labels, codes, priority, island_ids, x=xy[:, 0], y=xy[:, 1], near_cen_dist=cen_dist, near_ind_dist=ind_dist)
+    simulation.update_grazing_fields(store, scenario=scenario)
+    rep_idx = np.flatnonzero(replaceable)
+    prioritized_target_node_ids_global = unique_ids[rep_idx[np.argsort(-priority[rep_idx], kind="stable")]].tolist()
+    stages.close(); print(f"단계 2 (GeoPackage) 완료. 대상 ID 수: {len(prioritized_target_node_ids_global)}")
+    return store, prioritized_target_node_ids_global, total_original_replaceable_count
+
+
+def write_island_node_store(node_store, gpkg_path, layer_name, srs_id=0):
+    """섬 노드 메모리 테이블을 GeoPackage 점 레이어로 저장합니다."""
+    columns = {
+        config.FIELD_UNIQUE_ID: node_store.unique_id.tolist(),
+        config.FIELD_L3_CODE: node_store.decode("l3_code").tolist(),
+        config.FIELD_NODE_STATUS: node_store.decode("status").tolist(),
+        config.FIELD_NODE_TYPE_LABEL: node_store.decode("label").tolist(),
+        config.FIELD_ISLAND_ID: node_store.island_id.tolist(),
+        config.FIELD_REPLACEMENT_PRIORITY: node_store.priority.tolist(),
+        config.FIELD_IS_GRAZING: node_store.decode("is_grazing").tolist(),
+        config.FIELD_GRAZING_TYPE: node_store.decode("grazing_type").tolist(),
+    }
+    return write_point_layer(gpkg_path, layer_name, node_store.x, node_store.y, columns, srs_id)
+
+
+def write_phase_delta(delta, node_store, gpkg_path, layer_name, srs_id=0):
+    """Phase 변경분(바뀐 노드만)을 GeoPackage 점 레이어로 저장합니다. 좌표는 node_store에서 가져옵니다."""
+    rows = node_store.index_of(delta.unique_id)
+    columns = {
+        config.FIELD_UNIQUE_ID: delta.unique_id.tolist(),
+        config.FIELD_NODE_STATUS: delta.status.tolist(),
+        config.FIELD_NODE_TYPE_LABEL: delta.label.tolist(),
+        config.FIELD_IS_GRAZING: delta.is_grazing.tolist(),
+        config.FIELD_GRAZING_TYPE: delta.grazing_type.tolist(),
+    }
+    return write_point_layer(gpkg_path, layer_name, node_store.x[rows], node_store.y[rows], columns, srs_id)
+
+
+def read_phase_delta(gpkg_path, layer_name, phase_name=None):
+    """write_phase_delta로 저장한 레이어를 PhaseDelta로 읽어 들입니다."""
+    layer = read_layer(gpkg_path, layer_name)
+    return PhaseDelta(phase_name or layer_name, layer.values(config.FIELD_UNIQUE_ID), layer.values(config.FIELD_NODE_STATUS), layer.values(config.FIELD_NODE_TYPE_LABEL), layer.values(config.FIELD_IS_GRAZING), layer.values(config.FIELD_GRAZING_TYPE))
+
+
+def write_source_node_table(source_table, gpkg_path, layer_name, srs_id=0, mask=None):
+    """원본 노드 메모리 테이블(또는 mask로 선택한 일부)을 GeoPackage 점 레이어로 저장합니다."""
+    idx = np.arange(len(source_table)) if mask is None else np.flatnonzero(mask)
+    columns = {
+        config.FIELD_UNIQUE_ID: source_table.unique_id[idx].tolist(),
+        config.FIELD_ORIG_SOURCE_CODE: source_table.decode("orig_l3_code", idx).tolist(),
+        config.FIELD_EVOLVED_CATEGORY: source_table.decode("evolved_category", idx).tolist(),
+        config.FIELD_COMPRESSION_FACTOR: source_table.compression_factor[idx].astype(np.int64).tolist(),
+    }
+    return write_point_layer(gpkg_path, layer_name, source_table.x[idx], source_table.y[idx], columns, srs_id)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+파이프라인 계측 (구간 span, 카운터, 지오프로세싱 도구 호출, 최대 메모리)
+
+config.ENABLE_TRACING이 켜져 있을 때만 기록하며, 꺼져 있으면 span/count 호출은 플래그 확인 한 번으로 끝납니다.
+결과는 구간·카운터 요약 JSON 또는 Chrome trace 형식(chrome://tracing, ui.perfetto.dev)으로 저장합니다.
+install_arcpy_hooks()는 arcpy.management/analysis/conversion 도구와 arcpy.da 커서를 감싸
+도구별 호출 수·소요 시간과 읽기/쓰기 행 수를 자동으로 셉니다.
+"""
+try:
+    import resource
+except ImportError:  # Windows (ArcGIS Pro)
+    resource = None
+try:
+    import psutil
+except ImportError:  # 선택 의존성
+    psutil = None
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from . import config
+
+# install_arcpy_hooks가 감싸는 arcpy 도구 모듈
+_GP_TOOL_MODULES = ("management", "analysis", "conversion")
+_CURSOR_NAMES = ("SearchCursor", "UpdateCursor", "InsertCursor")
+
+
+def peak_memory_bytes():
+    """현재 프로세스의 최대 상주 메모리(바이트). 측정할 수 없으면 None."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Linux는 KB 단위
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+class Tracer:
+    """구간(span)과 카운터를 모으는 기록기. 프로세스당 하나(TRACER)를 공유합니다."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.spans = []; self.counters = defaultdict(float); self.peak_memory = None
+        self._origin = time.perf_counter(); self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None: stack = self._local.stack = []
+        return stack
+
+    def sample_memory(self):
+        peak = peak_memory_bytes()
+        if peak is not None: self.peak_memory = max(self.peak_memory or 0, peak)
+        return peak
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """name 구간의 시작·소요 시간, 부모 구간, 종료 시점 최대 메모리를 기록합니다."""
+        if not self.enabled:
+            yield; return
+        stack = self._stack(); parent = stack[-1] if stack else None
+        stack.append(name); start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter(); stack.pop()
+            self.spans.append({"name": name, "start": start - self._origin, "duration": end - start, "parent": parent, "depth": len(stack),
+                               "pid": os.getpid(), "tid": threading.get_ident(), "peak_memory_bytes": self.sample_memory(), "attrs": attrs})
+
+    def count(self, name, n=1):
+        if self.enabled: self.counters[name] += n
+
+    def stages(self, prefix):
+        return StageSpans(self, prefix)
+
+    def summary(self):
+        """구간 이름별 {calls, total_seconds, max_seconds}."""
+        totals = {}
+        for s in self.spans:
+            entry = totals.setdefault(s["name"], {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            entry["calls"] += 1; entry["total_seconds"] += s["duration"]; entry["max_seconds"] = max(entry["max_seconds"], s["duration"])
+        return totals
+
+    def to_json(self):
+        self.sample_memory()
+        return {"spans": self.spans, "summary": self.summary(), "counters": dict(self.counters), "peak_memory_bytes": self.peak_memory}
+
+    def to_chrome_trace(self):
+        """Chrome trace 이벤트 형식: 구간은 완료 이벤트("X"), 카운터와 최대 메모리는 카운터 이벤트("C"), 단위 µs."""
+        self.sample_memory()
+        events = [{"name": s["name"], "ph": "X", "ts": s["start"] * 1e6, "dur": s["duration"] * 1e6, "pid": s["pid"], "tid": s["tid"],
+                   "args": dict(s["attrs"], peak_memory_bytes=s["peak_memory_bytes"])} for s in self.spans]
+        end_ts = max((e["ts"] + e["dur"] for e in events), default=0.0)
+        events.extend({"name": name, "ph": "C", "ts": end_ts, "pid": os.getpid(), "args": {"value": value}} for name, value in sorted(self.counters.items()))
+        if self.peak_memory is not None: events.append({"name": "peak_memory_bytes", "ph": "C", "ts": end_ts, "pid": os.getpid(), "args": {"value": self.peak_memory}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path=None, fmt=None):
+        """기록을 path에 저장하고 경로를 반환합니다. fmt: "chrome" 또는 "json"."""
+        path = path or config.TRACE_OUTPUT_PATH; fmt = fmt or config.TRACE_FORMAT
+        if fmt not in ("chrome", "json"): raise ValueError(f"알 수 없는 trace 형식: {fmt}")
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace() if fmt == "chrome" else self.to_json(), f, ensure_ascii=False, default=str)
+        return path
+
+
+class StageSpans:
+    """
+    연속된 하위 단계 구간. next(name)은 이전 하위 구간을 닫고 새 구간을 엽니다.
+    '  1a. ...' 출력으로 나뉜 평평한 함수 본문을 들여쓰기 변경 없이 구간으로 나눌 때 사용하며, finally에서 close()합니다.
+    """
+
+    def __init__(self, tracer, prefix):
+        self._tracer = tracer; self._prefix = prefix; self._current = None
+
+    def next(self, name, **attrs):
+        self.close()
+        if self._tracer.enabled:
+            self._current = self._tracer.span(f"{self._prefix}.{name}", **attrs); self._current.__enter__()
+
+    def close(self):
+        if self._current is not None:
+            current, self._current = self._current, None
+            current.__exit__(None, None, None)
+
+
+TRACER = Tracer()
+
+
+def enable(enabled=True):
+    TRACER.enabled = enabled
+
+
+def span(name, **attrs):
+    return TRACER.span(name, **attrs)
+
+
+def count(name, n=1):
+    TRACER.count(name, n)
+
+
+def stages(prefix):
+    return TRACER.stages(prefix)
+
+
+def write_trace(path=None, fmt=None):
+    return TRACER.write(path, fmt)
+
+
+def settle(reason="cursor"):
+    """
+    파일 GDB 스키마 잠금이 풀리기를 기다리는 대기 (config.CURSOR_SETTLE_DELAY초, 0이면 생략).
+    대기 시간은 'settle' 구간과 settle_seconds 카운터로 기록되어 병목 여부를 확인할 수 있습니다.
+    """
+    delay = config.CURSOR_SETTLE_DELAY
+    if delay <= 0: return
+    with TRACER.span("settle", reason=reason):
+        time.sleep(delay)
+    TRACER.count("settle_seconds", delay)
+
+
+# ----------------------------------------------------------------------------
+# arcpy 도구 / 커서 계측
+# ----------------------------------------------------------------------------
+
+def _wrap_tool(tool_name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not TRACER.enabled: return func(*args, **kwargs)
+        TRACER.count(f"gp_calls:{tool_name}")
+        with TRACER.span(f"gp:{tool_name}"):
+            return func(*args, **kwargs)
+    wrapper._gac_instrumented = True
+    return wrapper
+
+
+class _CountingCursor:
+    """arcpy.da 커서 프록시. 읽은 행은 rows_read, updateRow/insertRow/deleteRow는 rows_written/rows_deleted로 셉니다."""
+
+    def __init__(self, cursor, kind):
+        self._cursor = cursor; self._kind = kind
+
+    def __iter__(self):
+        for row in self._cursor:
+            TRACER.count("rows_read"); yield row
+
+    def __next__(self):
+        row = next(self._cursor); TRACER.count("rows_read")
+        return row
+
+    def updateRow(self, row):
+        TRACER.count("rows_written"); return self._cursor.updateRow(row)
+
+    def insertRow(self, row):
+        TRACER.count("rows_written"); return self._cursor.insertRow(row)
+
+    def deleteRow(self):
+        TRACER.count("rows_deleted"); return self._cursor.deleteRow()
+
+    def __enter__(self):
+        self._cursor.__enter__(); return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _wrap_cursor(kind, cursor_class):
+    @functools.wraps(cursor_class)
+    def factory(*args, **kwargs):
+        cursor = cursor_class(*args, **kwargs)
+        if not TRACER.enabled: return cursor
+        TRACER.count(f"cursors:{kind}")
+        return _CountingCursor(cursor, kind)
+    factory._gac_instrumented = True
+    return factory
+
+
+def install_arcpy_hooks(arcpy_module):
+    """arcpy 도구와 arcpy.da 커서를 계측용 래퍼로 바꿉니다. 여러 번 호출해도 한 번만 적용됩니다."""
+    if arcpy_module is None or getattr(arcpy_module, "_gac_instrumented", False): return
+    for module_name in _GP_TOOL_MODULES:
+        module = getattr(arcpy_module, module_name, None)
+        if module is None: continue
+        for name in dir(module):
+            func = getattr(module, name, None)
+            if name[:1].isupper() and callable(func) and not isinstance(func, type) and not getattr(func, "_gac_instrumented", False):
+                setattr(module, name, _wrap_tool(f"{module_name}.{name}", func))
+    da = getattr(arcpy_module, "da", None)
+    for name in _CURSOR_NAMES:
+        cursor_class = getattr(da, name, None)
+        if cursor_class is not None and not getattr(cursor_class, "_gac_instrumented", False): setattr(da, name, _wrap_cursor(name, cursor_class))
+    arcpy_module._gac_instrumented = True
@@ -3,74 +3,181 @@
 Green Archipelago Consolidation (GAC) 시스템의 메인 실행 스크립트
 """
 
-import arcpy
+try:
+    import arcpy
+except ImportError:  # arcpy 없는 환경에서는 config.BACKEND = "gpkg" 로만 실행 가능
+    arcpy = None
 import os
 import time
 import traceback
-import config
-import processing
+from . import columnar_export
+from . import config
+from . import gpkg_backend
+from . import instrumentation
+from . import monte_carlo
+from . import prep_cache
+from . import processing
+from . import projection
+from . import simulation
+from . import weight_sweep
+from .scenario import Scenario
+
+_ARCPY_ERRORS = (arcpy.ExecuteError,) if arcpy is not None else ()
+
+def setup_arcpy_workspace():
+    """arcpy 작업 공간(config.OUTPUT_GDB)과 스크래치 GDB를 설정합니다."""
+    arcpy.env.workspace = config.OUTPUT_GDB
+    arcpy.env.overwriteOutput = True
+    
+    # 스크래치 GDB 설정 (v37 원본 로직)
+    if not arcpy.env.scratchGDB or not arcpy.Exists(arcpy.env.scratchGDB):
+        scratch_folder = os.path.dirname(config.OUTPUT_GDB); scratch_gdb_name = "scratch.gdb"; default_scratch_gdb = os.path.join(scratch_folder, scratch_gdb_name)
+        print(f"스크래치 GDB 설정/생성: {default_scratch_gdb}");
+        if not arcpy.Exists(default_scratch_gdb):
+            try: arcpy.management.CreateFileGDB(scratch_folder, scratch_gdb_name); print("스크래치 GDB 생성됨.")
+            except Exception as e: print(f"스크래치 GDB 생성 실패: {e}"); default_scratch_gdb = arcpy.env.scratchGDB
+        arcpy.env.scratchWorkspace = default_scratch_gdb
+    else: arcpy.env.scratchWorkspace = arcpy.env.scratchGDB
+    print(f"임시 작업 공간: {arcpy.env.scratchWorkspace}")
+
+def load_arcpy_layers():
+    """arcpy 작업 공간을 설정하고 활성 Map에서 필수 레이어를 가져옵니다."""
+    setup_arcpy_workspace()
+    print("현재 ArcGIS Pro 프로젝트 및 활성 Map 로드 중...")
+    aprx = arcpy.mp.ArcGISProject("CURRENT")
+    active_map = aprx.activeMap
+    if not active_map:
+        raise Exception("활성된 Map이 없습니다.")
+
+    # [수정됨] config 파일에서 레이어 이름을 가져와 로드합니다.
+    lc_layer = active_map.listLayers(config.LC_LAYER_NAME)[0] if active_map.listLayers(config.LC_LAYER_NAME) else None
+    gb_layer = active_map.listLayers(config.GB_LAYER_NAME)[0] if active_map.listLayers(config.GB_LAYER_NAME) else None
+    island_layer = active_map.listLayers(config.ISLAND_LAYER_NAME)[0] if active_map.listLayers(config.ISLAND_LAYER_NAME) else None
+
+    if not all([lc_layer, gb_layer, island_layer]):
+        missing = [name for name, layer in zip([config.LC_LAYER_NAME, config.GB_LAYER_NAME, config.ISLAND_LAYER_NAME], [lc_layer, gb_layer, island_layer]) if not layer]
+        raise Exception(f"필수 레이어를 Map에서 찾을 수 없습니다: {', '.join(missing)}. config.py의 레이어 이름을 확인하세요.")
+    print("필수 Map 레이어 확인 완료.")
+    return lc_layer, gb_layer, island_layer
+
+def load_gpkg_layers():
+    """GeoPackage에서 필수 레이어를 직접 읽어 옵니다 (arcpy 불필요)."""
+    print(f"GeoPackage 레이어 로드 중: {config.GPKG_PATH}")
+    output_dir = os.path.dirname(config.OUTPUT_GPKG)
+    if output_dir: os.makedirs(output_dir, exist_ok=True)
+    gb_layer = gpkg_backend.read_layer(config.GPKG_PATH, config.GB_LAYER_NAME); island_layer = gpkg_backend.read_layer(config.GPKG_PATH, config.ISLAND_LAYER_NAME)
+    # 스트리밍 단계 1은 원본 테이블을 직접 청크로 읽으므로, 메모리에는 단계 2가 쓰는 섬 범위의 토지피복만 올립니다.
+    bbox = gpkg_backend.layer_extent(island_layer) if config.STEP1_STREAMING else None
+    lc_layer = gpkg_backend.read_layer(config.GPKG_PATH, config.LC_LAYER_NAME, bbox=bbox)
+    return lc_layer, gb_layer, island_layer
+
+def export_outer_grazing_sources(source_table, source_nodes_path, srs_id, headless, scenario=None):
+    """(v37의 '섬 외부 그린벨트 내 목축 소스 노드 추출' 로직) LS / NGRASS_Grazing 원본 노드를 별도 레이어로 저장합니다."""
+    print("\n--- 섬 외부 그린벨트 내 목축 소스 노드 추출 중 ---")
+    scenario = scenario or Scenario.from_config()
+    outer_grazing_source_nodes_fc = os.path.join(scenario.output_gdb, "Result_Outer_Grazing_Source_Nodes")
+    outer_grazing_candidate_categories = [cat for cat in scenario.evolved_categories if cat == "LS" or cat == "NGRASS_Grazing"]
+    if outer_grazing_candidate_categories and headless:
+        grazing_mask = source_table.mask("evolved_category", *outer_grazing_candidate_categories)
+        gpkg_backend.write_source_node_table(source_table, scenario.output_gpkg, "Result_Outer_Grazing_Source_Nodes", srs_id, mask=grazing_mask)
+    elif outer_grazing_candidate_categories:
+        quoted_grazing_evolved = [f"'{cat}'" for cat in outer_grazing_candidate_categories]
+        where_outer_grazing = f"{config.FIELD_EVOLVED_CATEGORY} IN ({','.join(quoted_grazing_evolved)})"
+        if arcpy.Exists(source_nodes_path):
+            try:
+                if arcpy.Exists(outer_grazing_source_nodes_fc): arcpy.management.Delete(outer_grazing_source_nodes_fc)
+                arcpy.Select_analysis(source_nodes_path, outer_grazing_source_nodes_fc, where_outer_grazing)
+                print(f"  섬 외부 목축 소스 노드 저장: {outer_grazing_source_nodes_fc} ({arcpy.management.GetCount(outer_grazing_source_nodes_fc)}개)")
+            except Exception as e_outer_grazing: print(f"  오류: 섬 외부 목축 소스 노드 추출 실패 - {e_outer_grazing}")
+        else: print(f"  경고: 원본 소스 노드 파일({source_nodes_path})이 없어 섬 외부 목축 소스 추출 불가.")
+    else: print("  경고: evolved_categories 목록에 목축 관련 유형(LS, NGRASS_Grazing)이 정의되지 않아 섬 외부 목축 소스 추출 불가.")
 
 def main():
     """전체 시뮬레이션을 실행하는 메인 함수"""
     main_start_time = time.time()
     print("GAC 시스템 시뮬레이션을 시작합니다...")
     print("-" * 50)
+    stages = instrumentation.stages("main")
 
     try:
-        # --- 환경 설정 ---
-        arcpy.env.workspace = config.OUTPUT_GDB
-        arcpy.env.overwriteOutput = True
-        
-        # 스크래치 GDB 설정 (v37 원본 로직)
-        if not arcpy.env.scratchGDB or not arcpy.Exists(arcpy.env.scratchGDB):
-            scratch_folder = os.path.dirname(config.OUTPUT_GDB); scratch_gdb_name = "scratch.gdb"; default_scratch_gdb = os.path.join(scratch_folder, scratch_gdb_name)
-            print(f"스크래치 GDB 설정/생성: {default_scratch_gdb}");
-            if not arcpy.Exists(default_scratch_gdb):
-                try: arcpy.management.CreateFileGDB(scratch_folder, scratch_gdb_name); print("스크래치 GDB 생성됨.")
-                except Exception as e: print(f"스크래치 GDB 생성 실패: {e}"); default_scratch_gdb = arcpy.env.scratchGDB
-            arcpy.env.scratchWorkspace = default_scratch_gdb
-        else: arcpy.env.scratchWorkspace = arcpy.env.scratchGDB
-        print(f"임시 작업 공간: {arcpy.env.scratchWorkspace}")
-
-
-        print("현재 ArcGIS Pro 프로젝트 및 활성 Map 로드 중...")
-        aprx = arcpy.mp.ArcGISProject("CURRENT")
-        active_map = aprx.activeMap
-        if not active_map:
-            raise Exception("활성된 Map이 없습니다.")
-
-        # [수정됨] config 파일에서 레이어 이름을 가져와 로드합니다.
-        lc_layer = active_map.listLayers(config.LC_LAYER_NAME)[0] if active_map.listLayers(config.LC_LAYER_NAME) else None
-        gb_layer = active_map.listLayers(config.GB_LAYER_NAME)[0] if active_map.listLayers(config.GB_LAYER_NAME) else None
-        island_layer = active_map.listLayers(config.ISLAND_LAYER_NAME)[0] if active_map.listLayers(config.ISLAND_LAYER_NAME) else None
-
-        if not all([lc_layer, gb_layer, island_layer]):
-            missing = [name for name, layer in zip([config.LC_LAYER_NAME, config.GB_LAYER_NAME, config.ISLAND_LAYER_NAME], [lc_layer, gb_layer, island_layer]) if not layer]
-            raise Exception(f"필수 레이어를 Map에서 찾을 수 없습니다: {', '.join(missing)}. config.py의 레이어 이름을 확인하세요.")
-        print("필수 Map 레이어 확인 완료.")
-
-        # --- 단계 1 & 2 실행 ---
-        source_nodes_path, all_source_ids = processing.prepare_source_greenbelt_nodes(lc_layer, gb_layer, island_layer)
+        headless = config.BACKEND == "gpkg"
+        if not headless and arcpy is None: raise Exception("arcpy를 불러올 수 없습니다. config.BACKEND = 'gpkg' 로 설정하세요.")
+        if config.ENABLE_TRACING: instrumentation.enable(); instrumentation.install_arcpy_hooks(arcpy)
+        # 시나리오 값(가중치, Phase 일정, 코드 집합, 출력 대상, 시드)은 여기서 한 번 읽어 모든 단계에 명시적으로 넘깁니다.
+        scenario = Scenario.from_config(); output_dir = os.path.dirname(scenario.output_gpkg) if headless else os.path.dirname(scenario.output_gdb)
+        stages.next("load_layers")
+        lc_layer, gb_layer, island_layer = load_gpkg_layers() if headless else load_arcpy_layers()
+
+        # --- 단계 1 & 2 실행 (입력 레이어와 관련 설정이 같으면 캐시된 결과 재사용) ---
+        in_memory = headless or config.USE_IN_MEMORY_NODE_STORE
+        stages.next("prep_cache_lookup")
+        cache = prep_cache.PrepCache() if in_memory and config.USE_PREP_CACHE else None
+        cached_step1 = cached_step2 = None
+        if cache is not None:
+            lc_hash, gb_hash, island_hash = (prep_cache.layer_fingerprint(layer) for layer in (lc_layer, gb_layer, island_layer))
+            # 시드가 없으면 221/222 추첨이 실행마다 달라야 하므로 단계 1은 캐시하지 않습니다.
+            step1_key = prep_cache.stage_key("step1", [lc_hash, gb_hash, island_hash], prep_cache.STEP1_CONFIG_KEYS, scenario, prep_cache.STEP1_SCENARIO_FIELDS) if scenario.seed is not None else None
+            step2_key = prep_cache.stage_key("step2", [lc_hash, island_hash], prep_cache.STEP2_CONFIG_KEYS, scenario, prep_cache.STEP2_SCENARIO_FIELDS)
+            if step1_key is None: print("단계 1: SCENARIO_SEED가 없어 캐시를 사용하지 않습니다 (221/222 추첨을 매 실행 새로 함).")
+            else: cached_step1 = prep_cache.load_step1(cache, step1_key)
+            cached_step2 = prep_cache.load_step2(cache, step2_key, scenario)
+
+        source_table = None; stages.next("step1", cached=cached_step1 is not None)
+        if cached_step1 is not None:
+            source_nodes_path, all_source_ids, source_table = cached_step1
+            print(f"단계 1: 캐시된 결과 사용 ({step1_key}), 원본 노드 {len(source_table)}개")
+        else:
+            source_nodes_path, all_source_ids = processing.prepare_source_greenbelt_nodes(lc_layer, gb_layer, island_layer, scenario)
+            # GeoPackage 백엔드는 단계 1, 2 결과를 메모리 테이블로 바로 반환합니다.
+            if headless: source_table, source_nodes_path = source_nodes_path, None
+            elif in_memory: source_table = processing.load_source_node_table(source_nodes_path)
+            if cache is not None and step1_key is not None: prep_cache.save_step1(cache, step1_key, source_nodes_path, all_source_ids, source_table)
         total_source_count = len(all_source_ids)
         if total_source_count == 0:
             print("경고: 단계 1 결과 유효한 원본 노드가 없습니다. 시뮬레이션이 '대체'를 수행하지 않을 수 있습니다.")
 
-        island_nodes_path, prioritized_target_ids, total_replaceable_count = processing.prepare_target_island_nodes(lc_layer, island_layer)
+        node_store = None; stages.next("step2", cached=cached_step2 is not None)
+        if cached_step2 is not None:
+            island_nodes_path, prioritized_target_ids, total_replaceable_count, node_store = cached_step2
+            print(f"단계 2: 캐시된 결과 사용 ({step2_key}), 섬 노드 {len(node_store)}개")
+        else:
+            island_nodes_path, prioritized_target_ids, total_replaceable_count = processing.prepare_target_island_nodes(lc_layer, island_layer, scenario)
+            if headless: node_store, island_nodes_path = island_nodes_path, None
+            elif in_memory: node_store = processing.load_island_node_store(island_nodes_path)
+            if cache is not None: prep_cache.save_step2(cache, step2_key, island_nodes_path, prioritized_target_ids, total_replaceable_count, node_store, scenario)
         if total_replaceable_count == 0:
              print("경고: 단계 2 결과 대체 가능한 도시 노드가 없습니다. 시뮬레이션이 '철거' 또는 '대체'를 수행하지 않을 수 있습니다.")
 
+        if config.PLAN_ONLY:
+            stages.next("plan"); print("\n--- Phase 일정 예측 (plan 모드, Phase 실행 생략) ---")
+            plan_source_table = source_table if source_table is not None else processing.load_source_node_table(source_nodes_path)
+            plan = projection.plan_schedule(projection.SourceAggregates.from_table(plan_source_table, scenario), total_replaceable_count, simulation.phase_schedule(scenario=scenario))
+            plan.print_summary()
+            plan.write_csv(os.path.join(output_dir, "Result_Phase_Plan.csv"))
+            return
+
         # --- 단계 3: 시나리오별 시뮬레이션 실행 ---
         previous_result_path = island_nodes_path
         processed_source_ids = set()
         previous_migration_ratio = 0.0
         previous_demolition_ratio = 0.0
+        # 변경분 저장/몬테카를로 모두 Phase 적용 전 기준 테이블이 필요합니다.
+        delta_mode = node_store is not None and config.PERSIST_PHASE_RESULTS and config.PERSIST_PHASE_AS_DELTA
+        base_node_store = node_store.copy() if node_store is not None and (config.RUN_MONTE_CARLO or config.RUN_WEIGHT_SWEEP or delta_mode) else None
+        phase_deltas = []
+        # 우선순위는 단계 2 이후 고정이므로 후보 힙을 한 번만 만들어 모든 Phase에서 재사용합니다.
+        candidate_queues = simulation.CandidateQueues(node_store) if node_store is not None else None
+        # 원본 노드 추출 순열과 카테고리/잠재력 배열도 한 번만 만들어 Phase마다 O(k)로 꺼냅니다.
+        source_pool = None; rng = scenario.rng()
+        if total_source_count > 0: source_pool = simulation.SourcePool(source_table if source_table is not None else processing.load_source_node_table(source_nodes_path), rng, scenario=scenario)
+        phase_export = columnar_export.MultiPhaseExport(node_store) if config.EXPORT_COLUMNAR and node_store is not None else None
+        if config.EXPORT_COLUMNAR and node_store is None: print("경고: 컬럼형 내보내기에는 메모리 노드 테이블이 필요합니다 (USE_IN_MEMORY_NODE_STORE = True).")
+        if delta_mode and headless:
+            gpkg_backend.write_island_node_store(node_store, scenario.output_gpkg, "Result_Island_Nodes_Base", island_layer.srs_id)
 
-        for i in range(len(config.SIMULATION_PHASES_MIGRATION)):
-            current_migration_ratio = config.SIMULATION_PHASES_MIGRATION[i]
-            current_demolition_ratio = config.SIMULATION_PHASES_DEMOLITION[i]
-            phase_name = f"Phase_{i+1}_{int(current_migration_ratio*100)}pct"
-            
-            print(f"\n===== 시나리오 실행 중: {phase_name} ({current_migration_ratio*100}% 배치) =====")
+        for phase_name, current_migration_ratio, current_demolition_ratio in simulation.phase_schedule(scenario=scenario):
+
+            stages.next(phase_name); print(f"\n===== 시나리오 실행 중: {phase_name} ({current_migration_ratio*100}% 배치) =====")
             
             # processing 함수에 필요한 모든 파라미터를 딕셔너리로 묶어서 전달
             params = {
@@ -81,39 +188,61 @@ def main():
                 'total_source_nodes_count': total_source_count,
                 'total_original_replaceable_count': total_replaceable_count,
                 'processed_source_node_ids': processed_source_ids,
+                'source_pool': source_pool,
+                'scenario': scenario,
+                'rng': rng,
                 'p_cumulative_migration_ratio_curr': current_migration_ratio,
                 'p_cumulative_demolition_ratio_curr': current_demolition_ratio,
                 'p_cumulative_migration_ratio_prev': previous_migration_ratio,
                 'p_cumulative_demolition_ratio_prev': previous_demolition_ratio
             }
             
-            yearly_result_path, processed_source_ids = processing.execute_scenario_phase(**params)
+            if node_store is not None:
+                yearly_result_path, processed_source_ids = processing.execute_scenario_phase_in_memory(node_store=node_store, source_table=source_table, persist=config.PERSIST_PHASE_RESULTS, base_feature_class=island_nodes_path, phase_deltas=phase_deltas, candidate_queues=candidate_queues, srs_id=getattr(island_layer, 'srs_id', 0), **params)
+                if phase_export is not None: phase_export.add_phase(phase_name, node_store)
+            else:
+                yearly_result_path, processed_source_ids = processing.execute_scenario_phase(**params)
             
             # 다음 루프를 위해 현재 결과 경로와 비율을 저장
-            previous_result_path = yearly_result_path
+            previous_result_path = yearly_result_path or previous_result_path
             previous_migration_ratio = current_migration_ratio
             previous_demolition_ratio = current_demolition_ratio
 
-        print("\n----- 모든 시뮬레이션이 성공적으로 완료되었습니다. -----")
+        stages.close(); print("\n----- 모든 시뮬레이션이 성공적으로 완료되었습니다. -----")
+
+        if phase_export is not None:
+            stages.next("columnar_export"); print("\n--- 컬럼형 Phase 결과 내보내기 ---")
+            phase_export.write()
+
+        if delta_mode and phase_deltas and config.MATERIALIZE_FINAL_SNAPSHOT:
+            stages.next("materialize_snapshot"); print(f"\n--- 최종 Phase 전체 스냅샷 생성 (기준 + 변경분 {len(phase_deltas)}개) ---")
+            processing.materialize_phase_snapshot(phase_deltas[-1].phase_name, base_node_store, phase_deltas, island_nodes_path, getattr(island_layer, 'srs_id', 0), scenario)
+
+        if config.RUN_MONTE_CARLO and base_node_store is not None:
+            stages.next("monte_carlo"); print("\n--- 몬테카를로 시나리오 실행 ---")
+            mc_result = monte_carlo.run_monte_carlo(base_node_store, source_table, scenario=scenario)
+            for phase_name, summary in mc_result.count_percentiles().items():
+                print(f"  {phase_name}: " + ", ".join(f"{name} p5/p50/p95={v[5]:.0f}/{v[50]:.0f}/{v[95]:.0f}" for name, v in summary.items()))
+            if headless:
+                gpkg_backend.write_point_layer(scenario.output_gpkg, "Result_MonteCarlo_Node_Probabilities", base_node_store.x, base_node_store.y, mc_result.probability_columns(), island_layer.srs_id)
+            else:
+                processing.write_monte_carlo_probabilities(mc_result, island_nodes_path, os.path.join(scenario.output_gdb, "Result_MonteCarlo_Node_Probabilities"))
+        elif config.RUN_MONTE_CARLO: print("\n경고: 몬테카를로 실행에는 메모리 노드 테이블이 필요합니다 (USE_IN_MEMORY_NODE_STORE = True).")
+
+        if config.RUN_WEIGHT_SWEEP and base_node_store is not None:
+            stages.next("weight_sweep"); print("\n--- SSI 가중치 스윕 실행 ---")
+            sweep_result = weight_sweep.run_weight_sweep(base_node_store, source_table, weight_sweep.weight_grid(config.WEIGHT_SWEEP_STEP), scenario=scenario)
+            final_phase = sweep_result.phase_names[-1]
+            for row in sweep_result.summary_rows():
+                if row["phase"] == final_phase: print(f"  w=({row['w_status']:.2f}, {row['w_center']:.2f}, {row['w_industry']:.2f}) {final_phase}: 대체 {row['replaced']}개, 철거 {row['demolished']}개")
+            weight_sweep.write_sweep_csv(sweep_result, os.path.join(output_dir, "Result_Weight_Sweep.csv"))
+        elif config.RUN_WEIGHT_SWEEP: print("\n경고: 가중치 스윕에는 메모리 노드 테이블이 필요합니다 (USE_IN_MEMORY_NODE_STORE = True).")
         
-        # (v37의 '섬 외부 그린벨트 내 목축 소스 노드 추출' 로직 추가)
-        print("\n--- 섬 외부 그린벨트 내 목축 소스 노드 추출 중 ---")
-        outer_grazing_source_nodes_fc = os.path.join(config.OUTPUT_GDB, "Result_Outer_Grazing_Source_Nodes")
-        outer_grazing_candidate_categories = [cat for cat in config.EVOLVED_CATEGORIES if cat == "LS" or cat == "NGRASS_Grazing"]
-        if outer_grazing_candidate_categories:
-            quoted_grazing_evolved = [f"'{cat}'" for cat in outer_grazing_candidate_categories]
-            where_outer_grazing = f"{config.FIELD_EVOLVED_CATEGORY} IN ({','.join(quoted_grazing_evolved)})"
-            if arcpy.Exists(source_nodes_path):
-                try:
-                    if arcpy.Exists(outer_grazing_source_nodes_fc): arcpy.management.Delete(outer_grazing_source_nodes_fc)
-                    arcpy.Select_analysis(source_nodes_path, outer_grazing_source_nodes_fc, where_outer_grazing)
-                    print(f"  섬 외부 목축 소스 노드 저장: {outer_grazing_source_nodes_fc} ({arcpy.management.GetCount(outer_grazing_source_nodes_fc)}개)")
-                except Exception as e_outer_grazing: print(f"  오류: 섬 외부 목축 소스 노드 추출 실패 - {e_outer_grazing}")
-            else: print(f"  경고: 원본 소스 노드 파일({source_nodes_path})이 없어 섬 외부 목축 소스 추출 불가.")
-        else: print("  경고: evolved_categories 목록에 목축 관련 유형(LS, NGRASS_Grazing)이 정의되지 않아 섬 외부 목축 소스 추출 불가.")
-
-
-    except arcpy.ExecuteError:
+        stages.next("outer_grazing_sources")
+        export_outer_grazing_sources(source_table, source_nodes_path, getattr(lc_layer, 'srs_id', 0), headless, scenario)
+
+
+    except _ARCPY_ERRORS:
         print(f"\n----- 치명적인 ArcGIS 오류가 발생했습니다 -----")
         print(arcpy.GetMessages(2))
         traceback.print_exc()
@@ -123,6 +252,8 @@ def main():
         print(f"오류 메시지: {e}")
         traceback.print_exc()
     finally:
+        stages.close()
+        if config.ENABLE_TRACING: print(f"\n계측 결과 저장: {instrumentation.write_trace()}")
         main_end_time = time.time()
         total_time = main_end_time - main_start_time
         print(f"\n총 실행 시간: {time.strftime('%H:%M:%S', time.gmtime(total_time))}")
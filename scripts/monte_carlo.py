@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+몬테카를로 시나리오 실행기
+
+단계 1, 2에서 준비한 노드 테이블을 읽기 전용으로 공유하고, 전체 Phase 일정
+(SIMULATION_PHASES_MIGRATION / SIMULATION_PHASES_DEMOLITION)을 N번 독립적으로 실현합니다.
+각 실현은 SeedSequence에서 파생된 고유 시드를 사용하므로 실행 순서·작업자 수와 무관하게 재현됩니다.
+결과는 노드별·Phase별 대체/철거 확률과 Phase별 노드 수 백분위로 집계됩니다.
+"""
+import contextlib
+import io
+import os
+import random
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import config
+from . import simulation
+from .node_store import open_arrays, save_arrays
+from .scenario import resolve_scenario
+
+# 221/222 원본 코드는 실현마다 AG-LV / AG-FC를 다시 추첨합니다.
+_REDRAW_SOURCE_CODES = ('221', '222')
+# 작업자 프로세스가 공유하는 읽기 전용 입력 (initializer에서 한 번만 설정)
+_SHARED = {}
+
+
+def realization_seeds(n_realizations, seed=None):
+    """실현별 독립 시드 스트림 (numpy SeedSequence.spawn)."""
+    return np.random.SeedSequence(seed).spawn(n_realizations)
+
+
+def redraw_evolved_categories(source_table, rng, scenario=None):
+    """221/222 원본 노드의 EvolvedCategory / CompressionFactor를 rng로 다시 추첨한 복사본을 반환합니다."""
+    table = source_table.copy(writable=("evolved_category", "compression_factor"))
+    rows = np.flatnonzero(table.mask("orig_l3_code", *_REDRAW_SOURCE_CODES))
+    category_idx, factors = simulation.classify_source_codes(table.decode("orig_l3_code", rows), rng, scenario)
+    # 시나리오 카테고리 인덱스 -> 사전 코드 (config 기본 시나리오에서는 같은 값, 221/222는 항상 유효한 카테고리)
+    codebook = table.codebooks["evolved_category"]
+    category_codes = np.array([codebook.code(c) for c in resolve_scenario(scenario).evolved_categories], dtype=np.uint8)
+    table.evolved_category[rows] = category_codes[category_idx]; table.compression_factor[rows] = factors
+    return table
+
+
+def _init_worker(node_store, source_table, schedule, scenario=None):
+    # 경로가 전달되면 save_arrays로 저장한 배열을 읽기 전용 메모리 매핑으로 엽니다 (작업자 간 페이지 공유).
+    if isinstance(node_store, str): node_store = open_arrays(node_store)
+    if isinstance(source_table, str): source_table = open_arrays(source_table)
+    _SHARED['node_store'] = node_store; _SHARED['source_table'] = source_table; _SHARED['schedule'] = schedule; _SHARED['scenario'] = scenario
+
+
+def run_realization(seed_sequence):
+    """
+    하나의 실현을 수행합니다. 공유 노드 테이블은 복사 후 갱신하므로 원본은 바뀌지 않습니다.
+    반환: (Phase별 대체 비트마스크, Phase별 철거 비트마스크, Phase별 [대체, 철거, 목축, 처리 원본] 수)
+    """
+    rng = random.Random(int(seed_sequence.generate_state(1, np.uint64)[0]))
+    node_store = _SHARED['node_store'].copy(); schedule = _SHARED['schedule']
+    replaced_code = node_store.code("status", config.STATUS_REPLACED); demolished_code = node_store.code("status", config.STATUS_DEMOLISHED); grazing_code = node_store.code("is_grazing", "Yes")
+    scenario = _SHARED.get('scenario'); source_table = redraw_evolved_categories(_SHARED['source_table'], rng, scenario)
+    replaced_bits = []; demolished_bits = []; counts = np.zeros((len(schedule), 4), dtype=np.int64)
+    # 실현 수천 번의 단계별 로그는 의미가 없으므로 표준 출력을 버립니다.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for p, (_, processed_source_ids, _, _) in enumerate(simulation.run_phase_schedule(node_store, source_table, schedule, rng, scenario)):
+            replaced = node_store.status == replaced_code; demolished = node_store.status == demolished_code
+            replaced_bits.append(np.packbits(replaced)); demolished_bits.append(np.packbits(demolished))
+            counts[p] = (np.count_nonzero(replaced), np.count_nonzero(demolished), np.count_nonzero(node_store.is_grazing == grazing_code), len(processed_source_ids))
+    return np.stack(replaced_bits), np.stack(demolished_bits), counts
+
+
+class MonteCarloResult:
+    """몬테카를로 집계 결과. 확률 배열의 열 순서는 node_store.unique_id와 같습니다."""
+
+    COUNT_NAMES = ("replaced", "demolished", "grazing", "processed_source")
+
+    def __init__(self, unique_ids, phase_names, replace_hits, demolish_hits, counts):
+        self.unique_id = unique_ids
+        self.phase_names = phase_names
+        self.n_realizations = len(counts)
+        self.replace_probability = replace_hits / max(self.n_realizations, 1)
+        self.demolish_probability = demolish_hits / max(self.n_realizations, 1)
+        self.counts = counts  # (실현, Phase, COUNT_NAMES)
+
+    def count_percentiles(self, percentiles=(5, 50, 95)):
+        """Phase별 노드 수 백분위: {phase_name: {count_name: {percentile: value}}}."""
+        summary = {}
+        for p, phase_name in enumerate(self.phase_names):
+            values = np.percentile(self.counts[:, p, :], percentiles, axis=0) if self.n_realizations else np.zeros((len(percentiles), len(self.COUNT_NAMES)))
+            summary[phase_name] = {name: {q: float(values[j, c]) for j, q in enumerate(percentiles)} for c, name in enumerate(self.COUNT_NAMES)}
+        return summary
+
+    def probability_columns(self):
+        """노드별 확률 컬럼 (레이어 저장용)."""
+        columns = {config.FIELD_UNIQUE_ID: self.unique_id}
+        for p, phase_name in enumerate(self.phase_names):
+            columns[f"ReplaceProb_{phase_name}"] = self.replace_probability[p]
+            columns[f"DemolishProb_{phase_name}"] = self.demolish_probability[p]
+        return columns
+
+
+def run_monte_carlo(node_store, source_table, n_realizations=None, seed=None, max_workers=None, scenario=None):
+    """
+    전체 Phase 일정(scenario, 기본: config)을 n_realizations번 실행하고 MonteCarloResult를 반환합니다.
+    max_workers가 1이면 현재 프로세스에서 순차 실행, 그 외에는 프로세스 풀을 사용합니다.
+    """
+    n_realizations = config.MONTE_CARLO_REALIZATIONS if n_realizations is None else n_realizations
+    seed = config.MONTE_CARLO_SEED if seed is None else seed
+    max_workers = (config.MONTE_CARLO_WORKERS or os.cpu_count() or 1) if max_workers is None else max_workers
+    schedule = simulation.phase_schedule(scenario=scenario); n = len(node_store)
+    seeds = realization_seeds(n_realizations, seed)
+    print(f"몬테카를로 실행: 실현 {n_realizations}회, Phase {len(schedule)}개, 노드 {n}개, 작업자 {max_workers}개 (seed={seed})")
+
+    replace_hits = np.zeros((len(schedule), n), dtype=np.int64); demolish_hits = np.zeros((len(schedule), n), dtype=np.int64)
+    counts = np.zeros((n_realizations, len(schedule), len(MonteCarloResult.COUNT_NAMES)), dtype=np.int64)
+
+    def accumulate(r, result):
+        replaced_bits, demolished_bits, realization_counts = result
+        replace_hits[:] += np.unpackbits(replaced_bits, axis=1, count=n); demolish_hits[:] += np.unpackbits(demolished_bits, axis=1, count=n)
+        counts[r] = realization_counts
+        if (r + 1) % max(1, n_realizations // 10) == 0: print(f"  실현 {r + 1}/{n_realizations} 완료")
+
+    if max_workers <= 1:
+        _init_worker(node_store, source_table, schedule, scenario)
+        try:
+            for r, seed_sequence in enumerate(seeds): accumulate(r, run_realization(seed_sequence))
+        finally: _SHARED.clear()
+    else:
+        # 노드 테이블은 initializer로 작업자당 한 번만 전달되고, 작업 단위로는 시드만 전송됩니다.
+        # SHARE_NODE_ARRAYS이면 테이블 대신 메모리 매핑 파일 경로를 전달하여, 작업자는 갱신되는 상태 컬럼만 복사합니다.
+        chunksize = max(1, n_realizations // (max_workers * 4))
+        shared_dir = None
+        try:
+            if config.SHARE_NODE_ARRAYS:
+                if config.SHARED_ARRAYS_DIR: os.makedirs(config.SHARED_ARRAYS_DIR, exist_ok=True)
+                shared_dir = tempfile.mkdtemp(prefix="gac_mc_", dir=config.SHARED_ARRAYS_DIR)
+                initargs = (save_arrays(node_store, os.path.join(shared_dir, "island_nodes")), save_arrays(source_table, os.path.join(shared_dir, "source_nodes")), schedule, scenario)
+            else: initargs = (node_store, source_table, schedule, scenario)
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as executor:
+                for r, result in enumerate(executor.map(run_realization, seeds, chunksize=chunksize)): accumulate(r, result)
+        finally:
+            if shared_dir: shutil.rmtree(shared_dir, ignore_errors=True)
+
+    return MonteCarloResult(node_store.unique_id.copy(), [name for name, _, _ in schedule], replace_hits, demolish_hits, counts)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+섬 노드 / 원본(Source) 노드를 메모리에 보관하는 NumPy 기반 컬럼형 테이블
+
+단계 2의 섬 노드 결과를 한 번만 읽어 들인 뒤, 모든 시뮬레이션 단계(Phase)가
+이 테이블을 메모리에서 직접 갱신합니다. 피처 클래스는 저장이 요청될 때만 씁니다.
+상태·라벨·L3 코드·EvolvedCategory·목축 분류 컬럼은 uint8 코드로 보관하고,
+문자열은 저장(내보내기) 시에만 Codebook으로 복원합니다.
+save_arrays / open_arrays는 테이블을 컬럼별 고정 형식 .npy 파일로 저장하고 읽기 전용 메모리 매핑으로 엽니다.
+"""
+import json
+import os
+
+import numpy as np
+
+from . import config
+
+# classify_grazing이 내는 값 (코드 순서 고정용)
+IS_GRAZING_VALUES = ("No", "Yes")
+GRAZING_TYPE_VALUES = ("NonGrazing", "OriginalForest", "OriginalGrazing", "EvolvedToGrazing", "EvolvedToForest", "DemolishedToGrazing")
+_ARRAYS_FORMAT_VERSION = 1
+_MANIFEST_NAME = "manifest.json"
+
+
+def _as_text_array(values):
+    """문자열 컬럼을 object 배열로 변환 (None은 빈 문자열로)."""
+    return np.array(["" if v is None else str(v).strip() for v in values], dtype=object)
+
+
+class Codebook:
+    """
+    범주형 문자열 <-> uint8 코드 사전. 초기 어휘는 config에서 만들고, 처음 보는 값은 뒤에 추가됩니다.
+    기존 코드는 바뀌지 않으므로 복사본끼리 공유해도 안전합니다.
+    """
+    __slots__ = ("values", "_index")
+
+    def __init__(self, values=()):
+        self.values = []; self._index = {}
+        for value in values: self.code(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        """값 하나의 코드 (없으면 추가)."""
+        value = "" if value is None else str(value).strip()
+        code = self._index.get(value)
+        if code is None:
+            if len(self.values) > np.iinfo(np.uint8).max: raise ValueError(f"범주 값이 너무 많습니다 (최대 256개): {value!r}")
+            code = self._index[value] = len(self.values); self.values.append(value)
+        return code
+
+    def codes(self, *values):
+        return np.array([self.code(v) for v in values], dtype=np.uint8)
+
+    def encode(self, values):
+        """문자열 배열 -> uint8 코드 배열. 고유값마다 한 번만 조회합니다."""
+        text = _as_text_array(values)
+        if len(text) == 0: return np.zeros(0, dtype=np.uint8)
+        unique_values, inverse = np.unique(text.astype(str), return_inverse=True)
+        return self.codes(*unique_values.tolist())[inverse]
+
+    def decode(self, codes):
+        """uint8 코드 배열 -> 문자열(object) 배열."""
+        return np.array(self.values, dtype=object)[np.asarray(codes, dtype=np.intp)]
+
+
+def island_codebooks():
+    """섬 노드 범주 컬럼의 기본 사전 (NODE_TYPE_LABELS, EVOLVED_CATEGORIES, STATUS_* 기반)."""
+    statuses = (config.STATUS_ORIGINAL_NONURBAN, config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI, config.STATUS_ORIGINAL_TRANSPORT, config.STATUS_REPLACED, config.STATUS_DEMOLISHED)
+    labels = list(config.NODE_TYPE_LABELS.values()) + list(config.EVOLVED_CATEGORIES) + [config.DEMOLISHED_LABEL]
+    return {
+        "status": Codebook(statuses), "label": Codebook(dict.fromkeys(labels)), "l3_code": Codebook(sorted(config.NODE_TYPE_LABELS)),
+        "is_grazing": Codebook(IS_GRAZING_VALUES), "grazing_type": Codebook(GRAZING_TYPE_VALUES),
+    }
+
+
+def source_codebooks():
+    """원본 노드 범주 컬럼의 기본 사전. evolved_category 코드는 config.EVOLVED_CATEGORIES 인덱스와 같습니다."""
+    return {"evolved_category": Codebook(config.EVOLVED_CATEGORIES), "orig_l3_code": Codebook(sorted(config.SOURCE_L3_CODES))}
+
+
+class _CodedColumns:
+    """codebooks를 가진 테이블의 범주 컬럼 공통 연산."""
+
+    # copy()가 읽기 전용(메모리 매핑) 테이블에서도 항상 새 배열로 복사하는 컬럼 (Phase 실행이 갱신하는 컬럼)
+    MUTABLE_COLUMNS = ()
+
+    def code(self, column, value):
+        """범주 값 하나의 코드 (비교용)."""
+        return self.codebooks[column].code(value)
+
+    def mask(self, column, *values):
+        """column 값이 values 중 하나인 행의 불리언 마스크."""
+        codes = self.codebooks[column].codes(*values)
+        column_codes = getattr(self, column)
+        return column_codes == codes[0] if len(codes) == 1 else np.isin(column_codes, codes)
+
+    def value_counts(self, column):
+        """범주 컬럼의 값별 행 수 (0개인 값 제외)."""
+        book = self.codebooks[column]
+        counts = np.bincount(getattr(self, column), minlength=len(book))
+        return {value: int(counts[code]) for code, value in enumerate(book.values) if counts[code]}
+
+    def decode(self, column, rows=None):
+        """범주 컬럼(rows를 주면 해당 행만)을 문자열 배열로 복원합니다 (내보내기용)."""
+        codes = getattr(self, column)
+        return self.codebooks[column].decode(codes if rows is None else codes[rows])
+
+    def assign(self, column, rows, values):
+        """문자열 값(하나 또는 행마다)을 코드로 바꿔 rows에 씁니다."""
+        book = self.codebooks[column]
+        getattr(self, column)[rows] = book.code(values) if isinstance(values, str) else book.encode(values)
+
+    def copy(self, writable=()):
+        """
+        독립적으로 갱신 가능한 복사본을 만듭니다 (사전은 추가 전용이므로 공유).
+        읽기 전용 배열(open_arrays의 메모리 매핑)은 MUTABLE_COLUMNS와 writable 컬럼만 복사하고 나머지는 공유합니다.
+        """
+        clone = object.__new__(type(self))
+        for name, value in vars(self).items():
+            shared = isinstance(value, np.ndarray) and not value.flags.writeable and name not in self.MUTABLE_COLUMNS and name not in writable
+            setattr(clone, name, value if shared else value.copy())
+        return clone
+
+
+class IslandNodeStore(_CodedColumns):
+    """섬 노드 컬럼형 테이블. 행은 UniqueID 오름차순으로 정렬되어 있습니다."""
+
+    CATEGORICAL_COLUMNS = ("status", "label", "l3_code", "is_grazing", "grazing_type")
+    MUTABLE_COLUMNS = ("status", "label", "is_grazing", "grazing_type")
+
+    def __init__(self, unique_ids, statuses, labels, l3_codes, priorities, island_ids, is_grazing=None, grazing_types=None, x=None, y=None, near_cen_dist=None, near_ind_dist=None):
+        unique_ids = np.asarray(unique_ids, dtype=np.int64)
+        order = np.argsort(unique_ids, kind="stable")
+        n = len(unique_ids)
+        self.codebooks = island_codebooks()
+        self.unique_id = unique_ids[order]
+        self.status = self.codebooks["status"].encode(statuses)[order]
+        self.label = self.codebooks["label"].encode(labels)[order]
+        self.l3_code = self.codebooks["l3_code"].encode(l3_codes)[order]
+        self.priority = np.asarray(priorities, dtype=np.float64)[order]
+        self.island_id = np.asarray(island_ids, dtype=object)[order]
+        self.is_grazing = self.codebooks["is_grazing"].encode(is_grazing)[order] if is_grazing is not None else np.full(n, self.code("is_grazing", "No"), dtype=np.uint8)
+        self.grazing_type = self.codebooks["grazing_type"].encode(grazing_types)[order] if grazing_types is not None else np.full(n, self.code("grazing_type", "NonGrazing"), dtype=np.uint8)
+        self.x = np.asarray(x, dtype=np.float64)[order] if x is not None else np.full(n, np.nan)
+        self.y = np.asarray(y, dtype=np.float64)[order] if y is not None else np.full(n, np.nan)
+        # 거리가 없으면 NaN (scoring은 유효 마스크로 제외)
+        self.near_cen_dist = np.asarray(near_cen_dist, dtype=np.float64)[order] if near_cen_dist is not None else np.full(n, np.nan)
+        self.near_ind_dist = np.asarray(near_ind_dist, dtype=np.float64)[order] if near_ind_dist is not None else np.full(n, np.nan)
+
+    def __len__(self):
+        return len(self.unique_id)
+
+    def index_of(self, ids):
+        """UniqueID 목록을 행 인덱스 배열로 변환합니다. 없는 ID가 있으면 KeyError."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        idx = np.searchsorted(self.unique_id, ids)
+        idx_clipped = np.minimum(idx, max(len(self.unique_id) - 1, 0))
+        if len(ids) and (len(self.unique_id) == 0 or np.any(self.unique_id[idx_clipped] != ids)):
+            missing = ids[(idx >= len(self.unique_id)) | (self.unique_id[idx_clipped] != ids)]
+            raise KeyError(f"노드 테이블에 없는 UniqueID: {missing[:10].tolist()}")
+        return idx
+
+    def apply_delta(self, delta):
+        """PhaseDelta의 변경 행을 제자리에서 반영합니다."""
+        idx = self.index_of(delta.unique_id)
+        self.assign("status", idx, delta.status); self.assign("label", idx, delta.label)
+        self.assign("is_grazing", idx, delta.is_grazing); self.assign("grazing_type", idx, delta.grazing_type)
+
+    def status_counts(self):
+        """NodeStatus별 노드 수."""
+        return self.value_counts("status")
+
+
+class SourceNodeTable(_CodedColumns):
+    """단계 1 원본 노드의 컬럼형 테이블 (UniqueID 오름차순)."""
+
+    CATEGORICAL_COLUMNS = ("evolved_category", "orig_l3_code")
+
+    def __init__(self, unique_ids, evolved_categories, compression_factors, orig_l3_codes, x=None, y=None):
+        unique_ids = np.asarray(unique_ids, dtype=np.int64)
+        order = np.argsort(unique_ids, kind="stable")
+        self.codebooks = source_codebooks()
+        self.unique_id = unique_ids[order]
+        self.evolved_category = self.codebooks["evolved_category"].encode(evolved_categories)[order]
+        self.compression_factor = np.array([0 if f is None else f for f in compression_factors], dtype=np.float64)[order]
+        self.orig_l3_code = self.codebooks["orig_l3_code"].encode(orig_l3_codes)[order]
+        n = len(self.unique_id)
+        self.x = np.asarray(x, dtype=np.float64)[order] if x is not None else np.full(n, np.nan)
+        self.y = np.asarray(y, dtype=np.float64)[order] if y is not None else np.full(n, np.nan)
+
+    def __len__(self):
+        return len(self.unique_id)
+
+    def index_of(self, ids):
+        """UniqueID 목록을 행 인덱스 배열로 변환합니다."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        idx = np.searchsorted(self.unique_id, ids)
+        if len(ids) and (np.any(idx >= len(self.unique_id)) or np.any(self.unique_id[np.minimum(idx, len(self.unique_id) - 1)] != ids)):
+            raise KeyError("원본 노드 테이블에 없는 UniqueID가 포함되어 있습니다.")
+        return idx
+
+
+class PhaseDelta:
+    """한 Phase에서 상태가 바뀐 노드 행만 담은 변경분 (UniqueID 오름차순)."""
+
+    def __init__(self, phase_name, unique_ids, statuses, labels, is_grazing, grazing_types):
+        unique_ids = np.asarray(unique_ids, dtype=np.int64)
+        order = np.argsort(unique_ids, kind="stable")
+        self.phase_name = phase_name
+        self.unique_id = unique_ids[order]
+        self.status = _as_text_array(statuses)[order]
+        self.label = _as_text_array(labels)[order]
+        self.is_grazing = _as_text_array(is_grazing)[order]
+        self.grazing_type = _as_text_array(grazing_types)[order]
+
+    @classmethod
+    def from_store(cls, phase_name, node_store, rows):
+        """node_store의 지정 행(rows) 현재 값으로 변경분을 만듭니다 (변경분은 문자열로 보관)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return cls(phase_name, node_store.unique_id[rows], *(node_store.decode(column, rows) for column in ("status", "label", "is_grazing", "grazing_type")))
+
+    def __len__(self):
+        return len(self.unique_id)
+
+
+def save_arrays(table, directory):
+    """
+    IslandNodeStore / SourceNodeTable을 directory에 컬럼별 .npy 파일과 manifest.json으로 저장합니다.
+    문자열 섬 ID는 정수 코드 + manifest의 값 목록으로 저장합니다. manifest는 마지막에 쓰므로 있으면 완전한 저장본입니다.
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = {}; meta = {}
+    for name, value in vars(table).items():
+        if name == "codebooks": continue
+        if value.dtype == object:  # island_id
+            is_int = all(isinstance(v, (int, np.integer)) for v in value.tolist())
+            if is_int: value = value.astype(np.int64); meta[name] = {"kind": "int"}
+            else:
+                book = Codebook(); value = np.array([book.code(v) for v in value.tolist()] if len(value) else [], dtype=np.int32)
+                meta[name] = {"kind": "str", "values": [None if v == "" else v for v in book.values]}
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(value), allow_pickle=False)
+        columns[name] = {"dtype": value.dtype.str, "shape": list(value.shape)}
+    manifest = {"version": _ARRAYS_FORMAT_VERSION, "table": type(table).__name__, "rows": len(table), "columns": columns, "object_columns": meta,
+                "codebooks": {name: book.values for name, book in table.codebooks.items()}}
+    tmp_path = os.path.join(directory, _MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(directory, _MANIFEST_NAME))
+    return directory
+
+
+def open_arrays(directory):
+    """
+    save_arrays로 저장한 테이블을 읽기 전용 메모리 매핑으로 엽니다 (복사 없음, 페이지는 프로세스 간 공유).
+    갱신하려면 copy()로 MUTABLE_COLUMNS만 복사한 테이블을 만듭니다.
+    """
+    with open(os.path.join(directory, _MANIFEST_NAME), encoding="utf-8") as f: manifest = json.load(f)
+    if manifest["version"] != _ARRAYS_FORMAT_VERSION: raise ValueError(f"지원하지 않는 배열 저장 형식: {manifest['version']}")
+    table = object.__new__({"IslandNodeStore": IslandNodeStore, "SourceNodeTable": SourceNodeTable}[manifest["table"]])
+    table.codebooks = {name: Codebook(values) for name, values in manifest["codebooks"].items()}
+    for name in manifest["columns"]:
+        value = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r", allow_pickle=False).view(np.ndarray)
+        object_meta = manifest["object_columns"].get(name)
+        if object_meta is not None:
+            # 섬 ID는 파이썬 객체 배열로 복원 (정수 ID는 int64 배열을 그대로 공유)
+            value = value if object_meta["kind"] == "int" else np.array(object_meta["values"], dtype=object)[value]
+        setattr(table, name, value)
+    return table
+
+
+def materialize_snapshot(base_store, deltas):
+    """기준 테이블에 변경분을 순서대로 적용한 전체 스냅샷 (base_store는 바뀌지 않음)."""
+    snapshot = base_store.copy()
+    for delta in deltas: snapshot.apply_delta(delta)
+    return snapshot
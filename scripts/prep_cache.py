@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+단계 1, 2 결과의 영구 캐시 (내용 주소 방식)
+
+키는 입력 레이어 내용의 해시 + 해당 단계에 영향을 주는 config 값(시나리오를 주면 시나리오 필드 digest 포함)의 해시입니다.
+값은 준비된 노드 테이블을 압축 .npz 한 파일로 저장하며, 디렉터리 전체 크기가
+PREP_CACHE_MAX_BYTES를 넘으면 가장 오래 사용하지 않은 항목부터 삭제합니다 (LRU, 파일 mtime 기준).
+단계 2 키에는 SSI 가중치가 들어가지 않습니다. 항목에 가중치와 무관한 거리를 저장해 두므로, 가중치만 바꾼 재실행은
+캐시를 그대로 쓰고 우선순위와 대상 순서만 다시 계산합니다.
+단계 1의 221/222 추첨은 시나리오 시드로 정해지므로, 시드가 없는 실행(SCENARIO_SEED = None)은 단계 1을 캐시하지 않습니다.
+arcpy 모드의 단계 결과 피처 클래스는 실행마다 같은 경로에 덮어쓰므로, 저장 시점의 피처 클래스 내용 해시를
+항목에 함께 기록하고 조회할 때 다시 비교합니다 (다른 설정의 실행이 덮어쓴 경우 캐시 미스).
+"""
+try:
+    import arcpy
+except ImportError:  # GeoPackage 백엔드만 사용하는 환경
+    arcpy = None
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+from . import config
+from . import weight_sweep
+from .node_store import IslandNodeStore, SourceNodeTable
+from .scenario import resolve_scenario
+
+_CACHE_FORMAT_VERSION = 3
+
+# 단계별로 결과에 영향을 주는 config 항목
+STEP1_CONFIG_KEYS = (
+    "BACKEND", "FIELD_L3_CODE", "FIELD_UNIQUE_ID", "FIELD_ORIG_SOURCE_CODE", "FIELD_EVOLVED_CATEGORY", "FIELD_COMPRESSION_FACTOR",
+    "SOURCE_L3_CODES", "FOREST_L3_CODES", "COMPRESSION_FACTORS",
+)
+STEP2_CONFIG_KEYS = (
+    "BACKEND", "FIELD_L3_CODE", "FIELD_UNIQUE_ID", "FIELD_NODE_STATUS", "FIELD_NODE_TYPE_LABEL", "FIELD_REPLACEMENT_PRIORITY",
+    "FIELD_NEAR_CENTROID_DIST", "FIELD_NEAR_INDUSTRIAL_DIST", "FIELD_ISLAND_ID", "FIELD_ISLAND_ID_IN_POLYGONS",
+    "NODE_TYPE_LABELS", "FOREST_L3_CODES", "LOW_PRIORITY_URBAN_CODES", "HIGH_PRIORITY_URBAN_CODES", "TRANSPORT_L3_CODES",
+    "INDUSTRIAL_L3_CODES", "BASE_GRAZING_CODES", "GRAZING_L3_CODES", "EVOLVED_TO_L3_MAPPING",
+    "SSI_NORMALIZATION",
+    "STATUS_ORIGINAL_LOW_PRI", "STATUS_ORIGINAL_HIGH_PRI", "STATUS_ORIGINAL_TRANSPORT", "STATUS_ORIGINAL_NONURBAN",
+)
+# 단계별로 결과에 영향을 주는 Scenario 필드 (Phase 일정·GeoPackage 출력 경로는 단계 1, 2와 무관)
+STEP1_SCENARIO_FIELDS = ("compression_factors", "source_codes", "forest_codes", "seed", "output_gdb")
+STEP2_SCENARIO_FIELDS = ("normalization", "evolved_to_l3", "low_priority_urban_codes", "high_priority_urban_codes", "industrial_codes", "transport_codes",
+                         "forest_codes", "base_grazing_codes", "grazing_codes", "output_gdb")
+
+
+# ----------------------------------------------------------------------------
+# 키 계산
+# ----------------------------------------------------------------------------
+
+def _hash_value(h, value):
+    if isinstance(value, (bytes, bytearray, memoryview)): h.update(b"b"); h.update(bytes(value))
+    else: h.update(repr(value).encode("utf-8"))
+    h.update(b"\x1f")
+
+
+def layer_fingerprint(layer):
+    """레이어 내용(지오메트리 + 모든 속성)의 SHA-256. GpkgLayer는 원본 테이블을, arcpy 레이어는 커서를 읽습니다."""
+    h = hashlib.sha256()
+    source_path = getattr(layer, "source_path", None)
+    if source_path is not None:
+        with sqlite3.connect(source_path) as conn:
+            for row in conn.execute(f'SELECT * FROM "{layer.name}" ORDER BY 1'):
+                for value in row: _hash_value(h, value)
+    else:
+        fields = ["OID@", "SHAPE@WKB"] + sorted(f.name for f in arcpy.ListFields(layer) if f.type not in ("OID", "Geometry"))
+        h.update(repr(fields).encode("utf-8"))
+        with arcpy.da.SearchCursor(layer, fields) as cursor:
+            for row in cursor:
+                for value in row: _hash_value(h, value)
+    return h.hexdigest()
+
+
+def _normalize_setting(value):
+    # 코드 목록은 순서가 의미 없으며, GRAZING_L3_CODES처럼 set에서 만든 목록은 실행마다 순서가 바뀝니다.
+    if isinstance(value, (list, tuple, set, frozenset)): return sorted(value, key=repr)
+    return value
+
+
+def stage_key(stage, layer_fingerprints, config_keys, scenario=None, scenario_fields=()):
+    """단계 이름 + 입력 레이어 해시 + config 값(+ scenario의 scenario_fields digest)으로 캐시 키를 만듭니다."""
+    settings = {name: _normalize_setting(getattr(config, name, None)) for name in config_keys}
+    payload = {"version": _CACHE_FORMAT_VERSION, "stage": stage, "layers": list(layer_fingerprints), "config": settings}
+    if scenario is not None: payload["scenario"] = scenario.digest(scenario_fields)
+    payload = json.dumps(payload, sort_keys=True, default=str)
+    return f"{stage}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+
+# ----------------------------------------------------------------------------
+# 테이블 <-> 배열 변환 (allow_pickle 없이 저장 가능한 형태)
+# ----------------------------------------------------------------------------
+
+def _text(values):
+    return np.array([str(v) for v in values], dtype=str)
+
+
+def _pack_island_ids(island_ids):
+    is_int = all(isinstance(v, (int, np.integer)) for v in island_ids)
+    return (np.asarray(island_ids, dtype=np.int64) if is_int else _text("" if v is None else v for v in island_ids)), "int" if is_int else "str"
+
+
+def _pack_island_store(store):
+    island_ids, island_id_kind = _pack_island_ids(store.island_id.tolist())
+    arrays = {
+        "unique_id": store.unique_id, "status": _text(store.decode("status")), "label": _text(store.decode("label")), "l3_code": _text(store.decode("l3_code")),
+        "priority": store.priority, "island_id": island_ids, "is_grazing": _text(store.decode("is_grazing")), "grazing_type": _text(store.decode("grazing_type")),
+        "x": store.x, "y": store.y, "near_cen_dist": store.near_cen_dist, "near_ind_dist": store.near_ind_dist,
+    }
+    return arrays, {"island_id_kind": island_id_kind}
+
+
+def _unpack_island_store(arrays, meta):
+    island_ids = arrays["island_id"].tolist()
+    if meta["island_id_kind"] == "str": island_ids = [None if v == "" else v for v in island_ids]
+    return IslandNodeStore(arrays["unique_id"], arrays["status"], arrays["label"], arrays["l3_code"], arrays["priority"], island_ids,
+                           is_grazing=arrays["is_grazing"], grazing_types=arrays["grazing_type"], x=arrays["x"], y=arrays["y"],
+                           near_cen_dist=arrays["near_cen_dist"], near_ind_dist=arrays["near_ind_dist"])
+
+
+def _pack_source_table(table):
+    return {"unique_id": table.unique_id, "evolved_category": _text(table.decode("evolved_category")), "compression_factor": table.compression_factor,
+            "orig_l3_code": _text(table.decode("orig_l3_code")), "x": table.x, "y": table.y}, {}
+
+
+def _unpack_source_table(arrays, meta):
+    return SourceNodeTable(arrays["unique_id"], arrays["evolved_category"], arrays["compression_factor"], arrays["orig_l3_code"], x=arrays["x"], y=arrays["y"])
+
+
+# ----------------------------------------------------------------------------
+# 디스크 저장소
+# ----------------------------------------------------------------------------
+
+class PrepCache:
+    """캐시 디렉터리 하나를 관리합니다. 항목 하나 = <key>.npz 파일 하나."""
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or config.PREP_CACHE_DIR
+        self.max_bytes = config.PREP_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """(arrays, meta) 또는 None. 읽은 항목은 최근 사용으로 표시합니다."""
+        path = self._path(key)
+        if not os.path.exists(path): return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files if name != "__meta__"}
+                meta = json.loads(str(data["__meta__"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"  경고: 손상된 캐시 항목 삭제 ({os.path.basename(path)}): {e}")
+            os.remove(path); return None
+        os.utime(path)
+        return arrays, meta
+
+    def put(self, key, arrays, meta):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key); tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, __meta__=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """전체 크기가 max_bytes 이하가 될 때까지 가장 오래 사용하지 않은 항목부터 삭제합니다."""
+        if not os.path.isdir(self.cache_dir): return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                path = os.path.join(self.cache_dir, name); stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            if path == keep: continue
+            os.remove(path); total -= size
+            print(f"  캐시 항목 삭제 (LRU): {os.path.basename(path)}")
+
+
+# ----------------------------------------------------------------------------
+# 단계 1 / 2 캐시 조회·저장
+# ----------------------------------------------------------------------------
+
+def _output_meta(output_path):
+    """arcpy 모드의 출력 피처 클래스 경로와 저장 시점 내용 해시 (GeoPackage 모드는 경로 없음)."""
+    if not isinstance(output_path, str) or arcpy is None: return {"output_path": None, "output_fingerprint": None}
+    return {"output_path": output_path, "output_fingerprint": layer_fingerprint(output_path)}
+
+
+def _output_matches(meta):
+    """
+    arcpy 모드에서는 캐시된 피처 클래스가 아직 있고 내용이 저장 시점과 같아야 재사용할 수 있습니다.
+    다른 키의 실행이 같은 경로를 덮어썼다면 이후 Phase 출력이 그 피처 클래스를 기준으로 복사되므로 미스로 처리합니다.
+    """
+    path = meta.get("output_path")
+    if not path or arcpy is None: return True
+    if not arcpy.Exists(path): return False
+    if layer_fingerprint(path) != meta.get("output_fingerprint"):
+        print(f"  캐시 미스: {path} 내용이 캐시 저장 이후 바뀌었습니다 (다른 설정의 실행이 덮어씀).")
+        return False
+    return True
+
+
+def load_step1(cache, key):
+    """캐시 적중 시 (source_nodes_path, all_source_ids, source_table), 아니면 None."""
+    entry = cache.get(key)
+    if entry is None or not _output_matches(entry[1]): return None
+    arrays, meta = entry
+    table = _unpack_source_table(arrays, meta)
+    return meta.get("output_path"), meta["all_source_ids"], table
+
+
+def save_step1(cache, key, output_path, all_source_ids, table):
+    arrays, meta = _pack_source_table(table)
+    meta.update(_output_meta(output_path), all_source_ids=[int(v) for v in all_source_ids])
+    return cache.put(key, arrays, meta)
+
+
+def _rescore(store, prioritized_ids, weights, scenario):
+    """저장된 거리로 우선순위만 다시 계산하고 대상 ID를 새 우선순위 내림차순으로 다시 정렬합니다 (동점은 UniqueID 순)."""
+    rows, components = weight_sweep.component_matrix(store, scenario)
+    w_status, w_cen, w_ind = weights
+    # compute_replace_priority와 같은 순서로 더해 새로 계산한 단계 2와 같은 값을 얻습니다.
+    store.priority[rows] = w_status * components[:, 0] + w_cen * components[:, 1] + w_ind * components[:, 2]
+    target_rows = np.sort(store.index_of(prioritized_ids))
+    return store.unique_id[target_rows[np.argsort(-store.priority[target_rows], kind="stable")]].tolist()
+
+
+def _write_priority(output_path, store):
+    """arcpy 모드: 다시 계산한 우선순위를 단계 2 피처 클래스에 씁니다 (Phase 출력이 이 피처 클래스를 복사함)."""
+    priority = dict(zip(store.unique_id.tolist(), store.priority.tolist()))
+    with arcpy.da.UpdateCursor(output_path, [config.FIELD_UNIQUE_ID, config.FIELD_REPLACEMENT_PRIORITY]) as cursor:
+        for row in cursor:
+            if row[0] in priority: cursor.updateRow([row[0], priority[row[0]]])
+
+
+def load_step2(cache, key, scenario=None):
+    """
+    캐시 적중 시 (island_nodes_path, prioritized_ids, total_replaceable, node_store), 아니면 None.
+    항목의 가중치가 scenario(기본: config)의 가중치와 다르면 우선순위와 대상 순서를 다시 계산합니다.
+    arcpy 모드에서는 피처 클래스도 갱신하고 항목을 다시 저장합니다 (내용 해시가 바뀌므로).
+    """
+    scenario = resolve_scenario(scenario)
+    entry = cache.get(key)
+    if entry is None or not _output_matches(entry[1]): return None
+    arrays, meta = entry
+    store = _unpack_island_store(arrays, meta); prioritized_ids = meta["prioritized_ids"]; output_path = meta.get("output_path")
+    if tuple(meta["weights"]) != scenario.weights:
+        print(f"  단계 2 캐시: 가중치 {tuple(meta['weights'])} -> {scenario.weights}, 저장된 거리로 우선순위만 다시 계산합니다.")
+        prioritized_ids = _rescore(store, prioritized_ids, scenario.weights, scenario)
+        if output_path: _write_priority(output_path, store); save_step2(cache, key, output_path, prioritized_ids, meta["total_replaceable"], store, scenario)
+    return output_path, prioritized_ids, meta["total_replaceable"], store
+
+
+def save_step2(cache, key, output_path, prioritized_ids, total_replaceable, store, scenario=None):
+    arrays, meta = _pack_island_store(store)
+    meta.update(_output_meta(output_path), prioritized_ids=[int(v) for v in prioritized_ids], total_replaceable=int(total_replaceable),
+                weights=list(resolve_scenario(scenario).weights))
+    return cache.put(key, arrays, meta)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Phase 일정의 닫힌 형태(해석적) 예측 (plan 모드)
+
+원본 노드 추출은 비복원 균등 추출이므로, 한 Phase에서 새로 처리하는 m개 원본의 카테고리별 잠재력
+(1/CompressionFactor) 합의 기댓값은 m/N x 카테고리 총 잠재력이고, 분산은 유한 모집단 보정을 포함한
+m (N-m)/(N-1) x 모집단 분산입니다. 단계 1 결과의 카테고리별 합·제곱합과 단계 2의 대체 가능 노드 수만으로
+Phase별 진화 노드 수(allocate_integer_counts 배분), 소비되는 대체 슬롯, 철거 수를 계산하므로
+피처 클래스나 커서 없이 일정 하나를 수 밀리초에 평가합니다.
+"""
+import csv
+import math
+import random
+
+import numpy as np
+
+from . import simulation
+from .scenario import resolve_scenario
+
+
+class SourceAggregates:
+    """원본 노드 집계: 전체 수와 EvolvedCategory별 잠재력 합 / 제곱합 (무효 카테고리·압축계수 행은 잠재력 0)."""
+
+    def __init__(self, n_sources, category_sums, category_square_sums):
+        self.n_sources = int(n_sources)
+        self.category_sums = dict(category_sums)
+        self.category_square_sums = dict(category_square_sums)
+
+    @classmethod
+    def from_table(cls, source_table, scenario=None):
+        factors = source_table.compression_factor; evolved_categories = resolve_scenario(scenario).evolved_categories
+        valid = source_table.mask("evolved_category", *evolved_categories) & (factors > 0)
+        potential = np.divide(1.0, factors, out=np.zeros(len(factors)), where=valid)
+        codebook = source_table.codebooks["evolved_category"]; codes = source_table.evolved_category[valid]
+        sums = np.bincount(codes, weights=potential[valid], minlength=len(codebook))
+        square_sums = np.bincount(codes, weights=potential[valid] ** 2, minlength=len(codebook))
+        categories = [c for c in evolved_categories if sums[codebook.code(c)] > 0]
+        return cls(len(source_table), {c: float(sums[codebook.code(c)]) for c in categories}, {c: float(square_sums[codebook.code(c)]) for c in categories})
+
+    @property
+    def total_potential(self):
+        """README의 '새 모듈 수' (모든 원본 노드의 1/CompressionFactor 합)."""
+        return sum(self.category_sums.values())
+
+    def sample_variance(self, m, category=None):
+        """
+        N개 중 m개 비복원 균등 추출 시 잠재력 합의 분산 (category가 없으면 전체 카테고리 합).
+        Var = m (N-m)/(N-1) x sigma^2,  sigma^2 = sum(v^2)/N - (sum(v)/N)^2.
+        """
+        n = self.n_sources
+        if m <= 0 or m >= n or n <= 1: return 0.0
+        if category is None: total = self.total_potential; square_total = sum(self.category_square_sums.values())
+        else: total = self.category_sums.get(category, 0.0); square_total = self.category_square_sums.get(category, 0.0)
+        population_variance = max(square_total / n - (total / n) ** 2, 0.0)
+        return m * (n - m) / (n - 1) * population_variance
+
+
+class SchedulePlan:
+    """Phase별 예측. phases[i]는 Phase 하나의 기댓값/표준편차 dict입니다."""
+
+    def __init__(self, aggregates, total_replaceable_count, phases):
+        self.aggregates = aggregates
+        self.total_replaceable_count = total_replaceable_count
+        self.phases = phases
+
+    def summary_rows(self):
+        """Phase별 주요 수치 (출력/CSV용)."""
+        return [{key: phase[key] for key in ("phase", "migration_ratio", "demolition_ratio", "sources_this_phase", "expected_potential", "potential_std",
+                                             "evolved_nodes", "replaceable_slots", "replaced", "slot_limited", "demolished", "demolished_total", "remaining_urban")}
+                for phase in self.phases]
+
+    def print_summary(self):
+        print(f"  원본 노드 {self.aggregates.n_sources}개, 총 잠재력(새 모듈 수) {self.aggregates.total_potential:.2f}, 대체 가능 노드 {self.total_replaceable_count}개")
+        for phase in self.phases:
+            print(f"  {phase['phase']}: 원본 {phase['sources_this_phase']}개 -> 진화 노드 {phase['evolved_nodes']}개 (잠재력 {phase['expected_potential']:.2f} ± {phase['potential_std']:.2f}), "
+                  f"슬롯 {phase['replaceable_slots']}개 중 대체 {phase['replaced']}개{' (슬롯 부족)' if phase['slot_limited'] else ''}, 철거 {phase['demolished']}개 (누적 {phase['demolished_total']}개)")
+            print(f"      카테고리별 할당량: {phase['category_counts']}")
+
+    def write_csv(self, csv_path):
+        rows = self.summary_rows()
+        categories = list(self.aggregates.category_sums)
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(list(rows[0]) + [f"count_{c}" for c in categories] + [f"std_{c}" for c in categories] if rows else [])
+            for row, phase in zip(rows, self.phases):
+                writer.writerow(list(row.values()) + [phase["category_counts"].get(c, 0) for c in categories] + [phase["category_std"].get(c, 0.0) for c in categories])
+        print(f"  Phase 예측 저장: {csv_path} (Phase {len(rows)}개)")
+        return csv_path
+
+
+def plan_schedule(aggregates, total_replaceable_count, schedule=None):
+    """
+    Phase 일정 [(phase_name, 누적 이전 비율, 누적 철거 비율)]의 Phase별 기댓값을 계산합니다 (기본: config 일정).
+    run_scenario_phase와 같은 목표 반올림·슬롯·철거 규칙을 노드 수로만 따라갑니다.
+    대체는 우선순위가 높은 노드부터 고르고 철거는 낮은 노드부터 고르므로, 남은 원래 도시 노드가
+    철거되어 비어 있는 슬롯보다 먼저 대체된다고 봅니다.
+    """
+    schedule = schedule if schedule is not None else simulation.phase_schedule()
+    n_sources = aggregates.n_sources; rng = random.Random(0)
+    remaining_urban = total_replaceable_count; demolished_slots = 0; processed = 0; phases = []
+    for phase_name, migration_ratio, demolition_ratio in schedule:
+        # --- 3A. 원본 추출과 진화 노드 수 ---
+        sources_this_phase = min(max(0, round(n_sources * migration_ratio) - processed), n_sources - processed) if n_sources else 0
+        share = sources_this_phase / n_sources if n_sources else 0.0
+        category_potential = {c: total * share for c, total in aggregates.category_sums.items()}
+        expected_potential = sum(category_potential.values())
+        evolved_nodes = round(expected_potential) if sources_this_phase else 0
+        category_counts = dict(simulation.allocate_integer_counts(category_potential, evolved_nodes, rng)) if evolved_nodes > 0 else {}
+        processed += sources_this_phase
+        replaceable_slots = remaining_urban + demolished_slots
+        replaced = min(evolved_nodes, replaceable_slots)
+        from_urban = min(replaced, remaining_urban); remaining_urban -= from_urban; demolished_slots -= replaced - from_urban
+        # --- 3B. 철거 (누적 목표 - 현재 철거 상태 노드 수) ---
+        target_demolished = min(round(total_replaceable_count * demolition_ratio), total_replaceable_count)
+        if demolition_ratio >= 1.0: target_demolished = total_replaceable_count
+        demolished = min(max(0, target_demolished - demolished_slots), remaining_urban)
+        remaining_urban -= demolished; demolished_slots += demolished
+        phases.append({
+            "phase": phase_name, "migration_ratio": migration_ratio, "demolition_ratio": demolition_ratio,
+            "sources_this_phase": sources_this_phase, "sources_cumulative": processed,
+            "expected_potential": expected_potential, "potential_std": math.sqrt(aggregates.sample_variance(sources_this_phase)),
+            "category_potential": category_potential, "category_std": {c: math.sqrt(aggregates.sample_variance(sources_this_phase, c)) for c in aggregates.category_sums},
+            "category_counts": category_counts, "evolved_nodes": evolved_nodes,
+            "replaceable_slots": replaceable_slots, "replaced": replaced, "replaced_from_demolished": replaced - from_urban, "slot_limited": evolved_nodes > replaceable_slots,
+            "demolished": demolished, "demolished_total": demolished_slots, "remaining_urban": remaining_urban,
+        })
+    return SchedulePlan(aggregates, total_replaceable_count, phases)
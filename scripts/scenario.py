@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+시나리오 설정 객체
+
+단계 1~3이 읽는 시나리오 값(SSI 가중치와 정규화 방식, Phase 일정, 압축계수, L3 코드 집합, 출력 대상, 난수 시드)을
+불변·해시 가능한 Scenario 하나로 묶어 prepare_* / execute_scenario_phase에 명시적으로 넘깁니다.
+모듈 전역 config를 바꾸지 않고도 서로 다른 시나리오를 한 프로세스(스레드 풀)에서 동시에 실행할 수 있고,
+digest()로 시나리오별 결과를 캐시할 수 있습니다. 코드 목록은 생성 시 frozenset으로 만들어 두므로
+'code in 목록' 검사는 집합 조회 한 번입니다. 필드 이름·상태 문자열·노드 라벨은 config에 그대로 둡니다.
+"""
+import hashlib
+import random
+import types
+
+from . import config
+
+# 코드 집합 필드 -> config 이름
+_CODE_SET_FIELDS = {
+    "source_codes": "SOURCE_L3_CODES", "low_priority_urban_codes": "LOW_PRIORITY_URBAN_CODES", "high_priority_urban_codes": "HIGH_PRIORITY_URBAN_CODES",
+    "industrial_codes": "INDUSTRIAL_L3_CODES", "transport_codes": "TRANSPORT_L3_CODES", "forest_codes": "FOREST_L3_CODES",
+    "base_grazing_codes": "BASE_GRAZING_CODES", "grazing_codes": "GRAZING_L3_CODES",
+}
+# 동일성·해시·digest에 쓰는 필드 (이 순서로 정규화)
+FIELDS = ("weights", "normalization", "migration_ratios", "demolition_ratios", "compression_factors", "evolved_to_l3") + tuple(_CODE_SET_FIELDS) + ("output_gdb", "output_gpkg", "seed")
+
+
+class Scenario:
+    """
+    불변 시나리오 설정. 값 필드는 모두 튜플/frozenset/문자열/숫자이며, 조회용 사전은 읽기 전용 뷰입니다.
+    compression_factors는 (EvolvedCategory, CompressionFactor) 쌍의 튜플이고 그 순서가 evolved_categories입니다.
+    seed가 None이면 실행마다 다른 난수를 사용합니다 (기존 동작).
+    """
+    __slots__ = FIELDS + ("evolved_categories", "replaceable_urban_codes", "compression_lookup", "evolved_to_l3_lookup", "_key")
+
+    def __init__(self, weights, migration_ratios, demolition_ratios, compression_factors, evolved_to_l3, source_codes, low_priority_urban_codes,
+                 high_priority_urban_codes, industrial_codes, transport_codes, forest_codes, base_grazing_codes, grazing_codes,
+                 output_gdb=None, output_gpkg=None, seed=None, normalization="minmax"):
+        weights = tuple(float(w) for w in weights)
+        if len(weights) != 3: raise ValueError(f"가중치는 (w_status, w_center, w_industry) 3개여야 합니다: {weights}")
+        migration_ratios = tuple(float(r) for r in migration_ratios); demolition_ratios = tuple(float(r) for r in demolition_ratios)
+        if len(migration_ratios) != len(demolition_ratios): raise ValueError(f"Phase 이전/철거 비율 개수가 다릅니다: {len(migration_ratios)} != {len(demolition_ratios)}")
+        compression_factors = tuple((str(c), int(f)) for c, f in (compression_factors.items() if isinstance(compression_factors, dict) else compression_factors))
+        evolved_to_l3 = tuple(sorted((str(c), str(code)) for c, code in (evolved_to_l3.items() if isinstance(evolved_to_l3, dict) else evolved_to_l3)))
+        values = {"weights": weights, "normalization": str(normalization), "migration_ratios": migration_ratios, "demolition_ratios": demolition_ratios, "compression_factors": compression_factors,
+                  "evolved_to_l3": evolved_to_l3, "source_codes": source_codes, "low_priority_urban_codes": low_priority_urban_codes,
+                  "high_priority_urban_codes": high_priority_urban_codes, "industrial_codes": industrial_codes, "transport_codes": transport_codes,
+                  "forest_codes": forest_codes, "base_grazing_codes": base_grazing_codes, "grazing_codes": grazing_codes,
+                  "output_gdb": output_gdb, "output_gpkg": output_gpkg, "seed": None if seed is None else int(seed)}
+        for name in _CODE_SET_FIELDS: values[name] = frozenset(str(code) for code in values[name] if code is not None)
+        for name, value in values.items(): object.__setattr__(self, name, value)
+        object.__setattr__(self, "evolved_categories", tuple(c for c, _ in compression_factors))
+        object.__setattr__(self, "replaceable_urban_codes", values["low_priority_urban_codes"] | values["high_priority_urban_codes"])
+        object.__setattr__(self, "compression_lookup", types.MappingProxyType(dict(compression_factors)))
+        object.__setattr__(self, "evolved_to_l3_lookup", types.MappingProxyType(dict(evolved_to_l3)))
+        object.__setattr__(self, "_key", tuple(values[name] for name in FIELDS))
+
+    @classmethod
+    def from_config(cls, **overrides):
+        """현재 config 값으로 시나리오를 만듭니다. overrides로 일부 필드만 바꿀 수 있습니다."""
+        values = {"weights": (config.WEIGHT_STATUS, config.WEIGHT_INV_CEN_DIST, config.WEIGHT_INV_IND_DIST), "normalization": config.SSI_NORMALIZATION,
+                  "migration_ratios": config.SIMULATION_PHASES_MIGRATION, "demolition_ratios": config.SIMULATION_PHASES_DEMOLITION,
+                  "compression_factors": config.COMPRESSION_FACTORS, "evolved_to_l3": config.EVOLVED_TO_L3_MAPPING,
+                  "output_gdb": config.OUTPUT_GDB, "output_gpkg": config.OUTPUT_GPKG, "seed": config.SCENARIO_SEED}
+        values.update({name: getattr(config, config_name) for name, config_name in _CODE_SET_FIELDS.items()})
+        unknown = set(overrides) - set(FIELDS)
+        if unknown: raise TypeError(f"알 수 없는 시나리오 필드: {sorted(unknown)}")
+        values.update(overrides)
+        return cls(**values)
+
+    def replace(self, **changes):
+        """일부 필드만 바꾼 새 시나리오 (원본은 그대로)."""
+        unknown = set(changes) - set(FIELDS)
+        if unknown: raise TypeError(f"알 수 없는 시나리오 필드: {sorted(unknown)}")
+        values = {name: getattr(self, name) for name in FIELDS}; values.update(changes)
+        return type(self)(**values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Scenario는 변경할 수 없습니다 (replace() 사용): {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Scenario는 변경할 수 없습니다: {name}")
+
+    def __eq__(self, other):
+        return isinstance(other, Scenario) and self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __reduce__(self):
+        return (_from_fields, (self._key,))
+
+    def __repr__(self):
+        return f"Scenario(weights={self.weights}, normalization={self.normalization}, phases={len(self.migration_ratios)}, seed={self.seed}, digest={self.digest()[:12]})"
+
+    def digest(self, fields=FIELDS):
+        """
+        fields 값의 SHA-1 (프로세스가 달라도 같은 값이면 같은 문자열). 결과 캐시 키용이며,
+        hash()와 달리 문자열 해시 무작위화의 영향을 받지 않습니다.
+        """
+        canonical = [(name, sorted(value) if isinstance(value, frozenset) else value) for name, value in ((name, getattr(self, name)) for name in fields)]
+        return hashlib.sha1(repr(canonical).encode("utf-8")).hexdigest()
+
+    def compression_factor(self, category, default=1):
+        return self.compression_lookup.get(category, default)
+
+    def rng(self):
+        """Phase 추출용 random.Random (seed가 None이면 시스템 난수로 초기화)."""
+        return random.Random(self.seed)
+
+
+def _from_fields(key):
+    return Scenario(**dict(zip(FIELDS, key)))
+
+
+# 마지막으로 만든 config 기본 시나리오. config 값이 바뀌면 다시 만듭니다.
+_DEFAULT = [None]
+
+
+def default_scenario():
+    """현재 config 값의 시나리오 (config가 그대로면 같은 객체를 재사용)."""
+    scenario = Scenario.from_config()
+    if scenario != _DEFAULT[0]: _DEFAULT[0] = scenario
+    return _DEFAULT[0]
+
+
+def resolve_scenario(scenario=None):
+    """scenario가 없으면 config 기본 시나리오."""
+    return scenario if scenario is not None else default_scenario()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+섬 ID 그룹 단위의 벡터화 SSI(ReplacePriority) 점수 계산 모듈
+
+단계 2의 섬별 루프(FeatureToPoint / Near x2 / CalculateField x2 / 커서 2회)를
+좌표 배열 위의 group-by 연산으로 대체합니다. 계산량은 섬 수가 아니라 노드 수에 비례합니다.
+섬끼리는 서로 독립이므로 큰 입력은 섬 묶음으로 나누어 프로세스 풀에서 계산할 수 있습니다.
+"""
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import config
+from . import spatial_index
+from .scenario import resolve_scenario
+
+# 한 번에 만들 (노드, 후보) 거리 쌍의 최대 개수. 메모리 사용량을 제한합니다.
+_MAX_PAIRS_PER_CHUNK = 4_000_000
+# 병렬 점수 계산에서 작업자당 묶음 수 (섬 크기 편차에 따른 부하 불균형 완화)
+_SHARDS_PER_WORKER = 4
+# 작업자 프로세스가 공유하는 읽기 전용 입력 (initializer에서 한 번만 설정)
+_SHARED = {}
+# 섬 안의 거리 분포 폭이 이 값 이하이면 '평탄'(flat_value)으로 봅니다.
+_FLAT_SPAN = 1e-6
+# zscore 정규화: 섬 평균 ±3 표준편차를 [0, 1]의 양 끝으로 사용 (바깥은 잘라냄)
+_ZSCORE_CLIP = 3.0
+# robust 정규화: 섬 안 5% / 95% 분위수를 [0, 1]의 양 끝으로 사용 (이상치의 영향을 줄임)
+_ROBUST_QUANTILES = (0.05, 0.95)
+
+
+def encode_groups(values, keys=None):
+    """
+    섬 ID 값을 정수 그룹 코드로 변환합니다. None/빈 문자열은 -1.
+    keys(기존 그룹 목록)가 주어지면 같은 코드 체계를 사용하고, 없는 값은 -1이 됩니다.
+    """
+    if keys is None:
+        keys = sorted({v for v in values if v is not None and v != ''}, key=lambda v: (str(type(v)), v))
+    lookup = {k: i for i, k in enumerate(keys)}
+    codes = np.fromiter((lookup.get(v, -1) if v is not None and v != '' else -1 for v in values), dtype=np.int64, count=len(values))
+    return codes, list(keys)
+
+
+def grouped_nearest(from_xy, from_group, to_xy, to_group, from_ids=None, to_ids=None):
+    """
+    각 from 점에서 같은 그룹의 to 점 중 가장 가까운 점까지의 거리 (Near, PLANAR).
+    from_ids/to_ids가 주어지면 자기 자신(같은 ID)은 제외합니다. 후보가 없으면 NaN.
+    """
+    from_xy = np.asarray(from_xy, dtype=np.float64).reshape(-1, 2); to_xy = np.asarray(to_xy, dtype=np.float64).reshape(-1, 2)
+    from_group = np.asarray(from_group, dtype=np.int64); to_group = np.asarray(to_group, dtype=np.int64)
+    result = np.full(len(from_xy), np.nan)
+    valid_to = np.flatnonzero(to_group >= 0)
+    if len(from_xy) == 0 or len(valid_to) == 0: return result
+    order = valid_to[np.argsort(to_group[valid_to], kind="stable")]
+    sorted_groups = to_group[order]
+    starts = np.searchsorted(sorted_groups, from_group, side="left")
+    counts = np.searchsorted(sorted_groups, from_group, side="right") - starts
+    counts[from_group < 0] = 0
+    # 거리 쌍 개수가 한도를 넘지 않도록 from 행을 나누어 처리
+    cum = np.cumsum(counts)
+    chunk_start = 0
+    while chunk_start < len(from_xy):
+        base = cum[chunk_start - 1] if chunk_start > 0 else 0
+        chunk_end = max(chunk_start + 1, int(np.searchsorted(cum, base + _MAX_PAIRS_PER_CHUNK, side="right")))
+        chunk_end = min(chunk_end, len(from_xy))
+        c = counts[chunk_start:chunk_end]; total = int(c.sum())
+        if total > 0:
+            rows = np.repeat(np.arange(chunk_start, chunk_end), c)
+            offsets = np.arange(total) - np.repeat(np.cumsum(c) - c, c)
+            cand = order[np.repeat(starts[chunk_start:chunk_end], c) + offsets]
+            d2 = (from_xy[rows, 0] - to_xy[cand, 0]) ** 2 + (from_xy[rows, 1] - to_xy[cand, 1]) ** 2
+            if from_ids is not None and to_ids is not None:
+                d2[np.asarray(from_ids)[rows] == np.asarray(to_ids)[cand]] = np.inf
+            has = np.flatnonzero(c > 0)
+            seg_starts = (np.cumsum(c) - c)[has]
+            best = np.minimum.reduceat(d2, seg_starts)
+            ok = np.isfinite(best)
+            result[chunk_start + has[ok]] = np.sqrt(best[ok])
+        chunk_start = chunk_end
+    return result
+
+
+class GroupedStats:
+    """
+    섬 그룹별 거리 통계. 유효한 행(거리가 유한하고 그룹이 있는 행)을 (그룹, 값) 순으로 한 번 정렬해
+    그룹별 개수·최솟값·최댓값·분위수, 평균·표준편차, 행별 그룹 내 순위를 모두 구합니다.
+    거리가 없는 행은 NaN으로 두고 valid 마스크로 제외합니다 (큰 값 대용치를 쓰지 않음).
+    """
+
+    def __init__(self, values, group, n_groups):
+        self.values = np.asarray(values, dtype=np.float64); group = np.asarray(group, dtype=np.int64)
+        self.valid = np.isfinite(self.values) & (group >= 0)
+        self.g = np.where(group >= 0, group, 0)
+        rows = np.flatnonzero(self.valid)
+        order = rows[np.lexsort((self.values[rows], group[rows]))]
+        self._sorted = self.values[order]; sorted_group = group[order]
+        self.count = np.bincount(sorted_group, minlength=n_groups)
+        self.start = np.cumsum(self.count) - self.count
+        safe_count = np.maximum(self.count, 1)
+        self.mean = np.bincount(sorted_group, weights=self._sorted, minlength=n_groups) / safe_count
+        self.std = np.sqrt(np.bincount(sorted_group, weights=(self._sorted - self.mean[sorted_group]) ** 2, minlength=n_groups) / safe_count)
+        # 그룹 내 순위(0부터). 같은 값끼리는 평균 순위를 받습니다.
+        self.rank = np.full(len(self.values), np.nan)
+        if len(order):
+            new_block = np.r_[True, (sorted_group[1:] != sorted_group[:-1]) | (self._sorted[1:] != self._sorted[:-1])]
+            block_id = np.cumsum(new_block) - 1; block_start = np.flatnonzero(new_block); block_last = np.r_[block_start[1:], len(order)] - 1
+            self.rank[order] = (block_start[block_id] + block_last[block_id]) / 2.0 - self.start[sorted_group]
+
+    def quantile(self, q):
+        """그룹별 q 분위수 (정렬 위치 사이 선형 보간, 유효한 값이 없는 그룹은 NaN). q=0 / 1은 최솟값 / 최댓값."""
+        result = np.full(len(self.count), np.nan); has = np.flatnonzero(self.count > 0)
+        position = self.start[has] + q * (self.count[has] - 1)
+        below = np.floor(position).astype(np.int64); above = np.minimum(below + 1, self.start[has] + self.count[has] - 1)
+        fraction = position - below
+        result[has] = self._sorted[below] + fraction * (self._sorted[above] - self._sorted[below])
+        return result
+
+
+# 정규화 방식: GroupedStats -> (행별 반전 점수, 행별 분포 폭). 폭이 _FLAT_SPAN 이하인 섬은 flat_value를 받습니다.
+def _minmax_inverse(stats):
+    lo = stats.quantile(0.0)[stats.g]; span = stats.quantile(1.0)[stats.g] - lo
+    return 1.0 - (stats.values - lo) / span, span
+
+
+def _rank_inverse(stats):
+    # 백분위 순위: 섬에서 가장 가까운 노드 1, 가장 먼 노드 0 (거리 값의 크기와 무관)
+    span = stats.quantile(1.0)[stats.g] - stats.quantile(0.0)[stats.g]
+    return 1.0 - stats.rank / (stats.count[stats.g] - 1), span
+
+
+def _zscore_inverse(stats):
+    std = stats.std[stats.g]
+    return 0.5 - (stats.values - stats.mean[stats.g]) / (2.0 * _ZSCORE_CLIP * std), std
+
+
+def _robust_inverse(stats):
+    lo = stats.quantile(_ROBUST_QUANTILES[0])[stats.g]; span = stats.quantile(_ROBUST_QUANTILES[1])[stats.g] - lo
+    return 1.0 - (stats.values - lo) / span, span
+
+
+NORMALIZERS = {"minmax": _minmax_inverse, "rank": _rank_inverse, "zscore": _zscore_inverse, "robust": _robust_inverse}
+
+
+def normalize_inverse_distance(dist, group, n_groups, missing_value, flat_value, method=None, stats=None, scenario=None):
+    """
+    섬 내 정규화 후 반전(가까울수록 1). method는 NORMALIZERS의 이름이며 기본은 scenario(기본: config)의 정규화 방식입니다.
+    거리가 없는(NaN) 노드는 missing_value, 섬 안의 분포 폭이 1e-6 이하이면 flat_value를 사용합니다.
+    stats(GroupedStats)를 주면 정렬/집계를 다시 하지 않습니다 (여러 방식을 비교할 때).
+    """
+    method = method or resolve_scenario(scenario).normalization
+    if method not in NORMALIZERS: raise ValueError(f"알 수 없는 SSI 정규화 방식: {method} (사용 가능: {', '.join(NORMALIZERS)})")
+    stats = stats if stats is not None else GroupedStats(dist, group, n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"): score, spread = NORMALIZERS[method](stats)
+    scaled = np.full(len(stats.values), missing_value)
+    wide = stats.valid & (spread > _FLAT_SPAN)
+    scaled[wide] = score[wide]
+    scaled[stats.valid & ~wide] = flat_value
+    return np.clip(scaled, 0.0, 1.0)
+
+
+def score_components(is_high_priority, cen_dist, ind_dist, group, n_groups, normalization=None, stats=None, scenario=None):
+    """
+    가중치와 무관한 SSI 구성 요소 행렬 (n x 3): [status, inv_cen, inv_ind].
+    ReplacePriority = score_components(...) @ (w_status, w_center, w_industry)
+    stats는 (중심거리, 공업거리)의 GroupedStats 쌍이며, 없으면 여기서 만듭니다. normalization이 없으면 scenario의 정규화 방식을 씁니다.
+    """
+    normalization = normalization or resolve_scenario(scenario).normalization
+    cen_stats, ind_stats = stats if stats is not None else (GroupedStats(cen_dist, group, n_groups), GroupedStats(ind_dist, group, n_groups))
+    status_score = np.where(is_high_priority, 1.0, 0.1)
+    # 중심거리: 값이 없거나 범위가 0이면 0.5 / 공업거리: 값이 없으면 0, 범위가 0이면 0.5 (기존 규칙과 동일)
+    norm_inv_cen = normalize_inverse_distance(cen_dist, group, n_groups, missing_value=0.5, flat_value=0.5, method=normalization, stats=cen_stats)
+    norm_inv_ind = normalize_inverse_distance(ind_dist, group, n_groups, missing_value=0.0, flat_value=0.5, method=normalization, stats=ind_stats)
+    return np.column_stack([status_score, norm_inv_cen, norm_inv_ind])
+
+
+def normalization_variants(is_high_priority, cen_dist, ind_dist, group, n_groups, methods=None):
+    """정규화 방식별 구성 요소 행렬 {방식: (n x 3)}. 거리 정렬/집계는 거리 종류마다 한 번만 합니다."""
+    stats = (GroupedStats(cen_dist, group, n_groups), GroupedStats(ind_dist, group, n_groups))
+    return {method: score_components(is_high_priority, cen_dist, ind_dist, group, n_groups, method, stats) for method in (methods or NORMALIZERS)}
+
+
+def compute_replace_priority(is_high_priority, cen_dist, ind_dist, group, n_groups, weights=None, normalization=None, scenario=None):
+    """
+    SSI = w_status * status + w_center * inv_cen + w_industry * inv_ind 를 한 번에 계산합니다.
+    weights / normalization이 없으면 scenario(기본: config)의 값을 사용합니다.
+    반환: (priority, status_score, norm_inv_cen, norm_inv_ind)
+    """
+    scenario = resolve_scenario(scenario)
+    w_status, w_cen, w_ind = scenario.weights if weights is None else weights
+    components = score_components(is_high_priority, cen_dist, ind_dist, group, n_groups, normalization or scenario.normalization)
+    status_score, norm_inv_cen, norm_inv_ind = components.T
+    priority = (w_status * status_score) + (w_cen * norm_inv_cen) + (w_ind * norm_inv_ind)
+    return priority, status_score, norm_inv_cen, norm_inv_ind
+
+
+def _score_groups(unique_ids, xy, group, n_groups, is_high_priority, calc, industrial, centroid_xy, centroid_group, weights=None, normalization=None):
+    """
+    점수 계산 핵심부. group은 섬 그룹 코드, calc는 계산 대상 노드 마스크.
+    모든 연산이 섬 그룹 안에서만 이루어지므로 섬 단위로 나눈 부분 집합에 적용해도 결과가 같습니다.
+    반환: (calc_idx, cen, ind, priority) — 거리가 없으면 NaN
+    """
+    calc_idx = np.flatnonzero(calc)
+    cen = grouped_nearest(xy[calc_idx], group[calc_idx], centroid_xy, centroid_group)
+    # 공업 노드는 섬별로 분할된 격자 인덱스로 검색 (섬 내 공업 노드 수에 비례하는 쌍 생성을 피함)
+    ind_idx = np.flatnonzero(industrial & (group >= 0))
+    ind_index = spatial_index.SpatialIndex(xy[ind_idx, 0], xy[ind_idx, 1], groups=group[ind_idx], ids=unique_ids[ind_idx])
+    ind = ind_index.nearest(xy[calc_idx, 0], xy[calc_idx, 1], groups=group[calc_idx], query_ids=unique_ids[calc_idx])[0]
+    priority = compute_replace_priority(is_high_priority[calc_idx], cen, ind, group[calc_idx], n_groups, weights, normalization)[0]
+    return calc_idx, cen, ind, priority
+
+
+def partition_islands(group, n_groups, n_shards):
+    """
+    섬 그룹을 노드 수가 비슷한 n_shards개 묶음으로 나눕니다 (큰 섬부터 가장 가벼운 묶음에 배정).
+    반환: 그룹별 묶음 번호 배열 (길이 n_groups)
+    """
+    sizes = np.bincount(group[group >= 0], minlength=n_groups)
+    shard_of_group = np.zeros(n_groups, dtype=np.int64); loads = [(0, k) for k in range(n_shards)]
+    for g in np.argsort(-sizes, kind="stable").tolist():
+        load, k = heapq.heappop(loads); shard_of_group[g] = k; heapq.heappush(loads, (load + int(sizes[g]), k))
+    return shard_of_group
+
+
+def _init_worker(arrays, weights, normalization):
+    _SHARED.update(arrays); _SHARED['weights'] = weights; _SHARED['normalization'] = normalization
+
+
+def _score_shard(shard):
+    """작업자: 공유 배열에서 shard의 노드/중심점 행만 골라 점수를 계산하고 (전역 행 번호, cen, ind, priority)를 반환합니다."""
+    rows, centroid_rows = shard
+    a = _SHARED
+    calc_idx, cen, ind, priority = _score_groups(a['unique_ids'][rows], a['xy'][rows], a['group'][rows], a['n_groups'], a['is_high'][rows], a['calc'][rows],
+                                                 a['industrial'][rows], a['centroid_xy'][centroid_rows], a['centroid_group'][centroid_rows], a['weights'], a['normalization'])
+    return rows[calc_idx], cen, ind, priority
+
+
+def _score_groups_partitioned(arrays, weights, normalization, max_workers):
+    """섬 단위로 나눈 묶음을 프로세스 풀에서 점수 계산하고 전역 행 순서로 합칩니다."""
+    group = arrays['group']; centroid_group = arrays['centroid_group']
+    n_shards = max_workers * _SHARDS_PER_WORKER
+    shard_of_group = partition_islands(group, arrays['n_groups'], n_shards)
+    node_shard = np.where(group >= 0, shard_of_group[np.where(group >= 0, group, 0)], -1)
+    centroid_shard = np.where(centroid_group >= 0, shard_of_group[np.where(centroid_group >= 0, centroid_group, 0)], -1)
+    node_order = np.argsort(node_shard, kind="stable"); node_bounds = np.searchsorted(node_shard[node_order], np.arange(n_shards + 1))
+    centroid_order = np.argsort(centroid_shard, kind="stable"); centroid_bounds = np.searchsorted(centroid_shard[centroid_order], np.arange(n_shards + 1))
+    shards = [(node_order[node_bounds[k]:node_bounds[k + 1]], centroid_order[centroid_bounds[k]:centroid_bounds[k + 1]]) for k in range(n_shards) if node_bounds[k + 1] > node_bounds[k]]
+    # 공유 배열은 initializer로 작업자당 한 번만 전달되고, 작업 단위로는 행 번호만 전송됩니다.
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(arrays, weights, normalization)) as executor:
+        results = list(executor.map(_score_shard, shards))
+    if not results: return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), np.zeros(0)
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def score_island_nodes(unique_ids, x, y, island_ids, statuses, l3_codes, centroid_island_ids, centroid_x, centroid_y, weights=None, max_workers=None, scenario=None):
+    """
+    [단계 2e] 모든 섬의 대체 가능 노드에 대해 중심거리, 공업거리, ReplacePriority를 한 번에 계산합니다.
+    centroid_*는 섬 폴리곤 내부점 (같은 섬 ID가 여러 개면 가장 가까운 점 사용).
+    max_workers(기본 config.SCORING_WORKERS)가 1보다 크고 노드 수가 SCORING_PARALLEL_MIN_NODES 이상이면
+    섬 단위로 나누어 프로세스 풀에서 계산합니다 (결과는 순차 계산과 같음).
+    scenario(기본: config)의 공업 코드 집합과 정규화 방식을 쓰고, weights가 없으면 scenario.weights를 사용합니다.
+    반환: (near_cen_dist, near_ind_dist, priority) — 거리가 없거나 계산 대상이 아닌 노드는 NaN, 우선순위는 -1.0
+    """
+    scenario = resolve_scenario(scenario); weights = scenario.weights if weights is None else weights
+    unique_ids = np.asarray(unique_ids, dtype=np.int64)
+    xy = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    group, keys = encode_groups(list(island_ids))
+    centroid_group, _ = encode_groups(list(centroid_island_ids), keys)
+    statuses = np.asarray(statuses, dtype=object); l3_codes = np.asarray(l3_codes, dtype=object)
+    replaceable = (statuses == config.STATUS_ORIGINAL_LOW_PRI) | (statuses == config.STATUS_ORIGINAL_HIGH_PRI)
+    industrial = np.fromiter((code in scenario.industrial_codes for code in l3_codes), dtype=bool, count=len(l3_codes))
+    # 폴리곤(중심점)이 없는 섬의 노드는 기존과 같이 계산에서 제외
+    has_centroid = np.zeros(len(keys), dtype=bool); has_centroid[centroid_group[centroid_group >= 0]] = True
+    calc = replaceable & (group >= 0) & has_centroid[np.where(group >= 0, group, 0)]
+    is_high = statuses == config.STATUS_ORIGINAL_HIGH_PRI
+    centroid_xy = np.column_stack([np.asarray(centroid_x, dtype=np.float64), np.asarray(centroid_y, dtype=np.float64)])
+    max_workers = (config.SCORING_WORKERS or os.cpu_count() or 1) if max_workers is None else max_workers
+    parallel = max_workers > 1 and len(keys) > 1 and len(unique_ids) >= config.SCORING_PARALLEL_MIN_NODES
+    print(f"    점수 계산 대상 노드 {int(np.count_nonzero(calc))}개, 섬 {int(has_centroid.sum())}개" + (f", 작업자 {max_workers}개" if parallel else ""))
+
+    if parallel:
+        arrays = {'unique_ids': unique_ids, 'xy': xy, 'group': group, 'n_groups': len(keys), 'is_high': is_high, 'calc': calc, 'industrial': industrial,
+                  'centroid_xy': centroid_xy, 'centroid_group': centroid_group}
+        calc_idx, cen, ind, priority_calc = _score_groups_partitioned(arrays, weights, scenario.normalization, max_workers)
+    else:
+        calc_idx, cen, ind, priority_calc = _score_groups(unique_ids, xy, group, len(keys), is_high, calc, industrial, centroid_xy, centroid_group, weights, scenario.normalization)
+
+    near_cen_dist = np.full(len(unique_ids), np.nan); near_ind_dist = np.full(len(unique_ids), np.nan); priority = np.full(len(unique_ids), -1.0)
+    near_cen_dist[calc_idx] = cen; near_ind_dist[calc_idx] = ind; priority[calc_idx] = priority_calc
+    return near_cen_dist, near_ind_dist, priority
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+메모리 내 시뮬레이션 엔진 (단계 3)
+
+processing.execute_scenario_phase 와 동일한 규칙(3A 대체 -> 3B 철거 -> 3C 목축지 분류)을
+IslandNodeStore 컬럼 배열 위에서 수행합니다. arcpy 없이 동작합니다.
+"""
+import heapq
+import random
+
+import numpy as np
+
+from . import config
+from . import instrumentation
+from .node_store import island_codebooks
+from .scenario import resolve_scenario
+
+
+def allocate_integer_counts(category_potentials, total_target_count, rng=None):
+    """Calculates integer allocation based on fractional potentials."""
+    rng = rng or random
+    integer_counts = {cat: 0 for cat in category_potentials}; remainders = {}; current_total = 0; potential_sum = sum(category_potentials.values());
+    if potential_sum <= 1e-9: print("  경고: 총 진화 잠재력이 0."); return integer_counts
+    total_target_count = int(round(total_target_count))
+    if total_target_count == 0: return integer_counts
+    for category, potential in category_potentials.items():
+        if potential_sum > 1e-9: scaled_potential = potential * (total_target_count / potential_sum)
+        else: scaled_potential = 0
+        integer_part = int(scaled_potential); remainder = scaled_potential - integer_part; integer_counts[category] = integer_part; remainders[category] = remainder; current_total += integer_part
+    remaining_to_allocate = total_target_count - current_total; sorted_remainders = sorted(remainders.items(), key=lambda item: item[1], reverse=True)
+    for i in range(remaining_to_allocate):
+        if i < len(sorted_remainders): integer_counts[sorted_remainders[i][0]] += 1
+        else: print(f"Warning: Allocation shortfall during remainder distribution."); break
+    final_sum = sum(integer_counts.values())
+    if final_sum != total_target_count:
+        print(f"Warning: Allocation mismatch after remainder ({final_sum} vs {total_target_count}). Adjusting...")
+        diff = total_target_count - final_sum
+        if diff > 0:
+            indices = list(range(len(sorted_remainders))); rng.shuffle(indices); add_count = 0
+            while add_count < diff and indices: idx = indices.pop(0); cat_to_add = sorted_remainders[idx][0]; integer_counts[cat_to_add] += 1; add_count += 1
+            while add_count < diff: cat_to_add = rng.choice(list(integer_counts.keys())); integer_counts[cat_to_add] += 1; add_count += 1
+        elif diff < 0:
+            sorted_remainders_asc = sorted(remainders.items(), key=lambda item: item[1]); indices = list(range(len(sorted_remainders_asc))); rng.shuffle(indices)
+            remove_count = 0; processed_indices = set()
+            while remove_count < abs(diff) and len(processed_indices) < len(indices):
+                found_idx_to_process = -1
+                for idx in indices:
+                    if idx not in processed_indices: found_idx_to_process = idx; break
+                if found_idx_to_process == -1: break
+                cat_to_remove = sorted_remainders_asc[found_idx_to_process][0]; processed_indices.add(found_idx_to_process)
+                if integer_counts[cat_to_remove] > 0: integer_counts[cat_to_remove] -= 1; remove_count += 1
+            while remove_count < abs(diff):
+                possible_cats = [c for c, v in integer_counts.items() if v > 0]
+                if not possible_cats: break
+                cat_to_remove = rng.choice(possible_cats); integer_counts[cat_to_remove] -= 1; remove_count += 1
+        final_sum = sum(integer_counts.values())
+        if final_sum != total_target_count: print(f"ERROR: Adjustment failed! Final sum still {final_sum}")
+    return integer_counts
+
+
+# 원본 L3 코드 -> EvolvedCategory 규칙. FOREST_L3_CODES는 "FR", 221/222는 추첨 대상입니다.
+_SOURCE_CATEGORY_RULES = {
+    '211': "AG-FC", '212': "AG-FC", '241': "AG-FV", '231': "AG-LV", '251': "LS",
+    '411': "NGRASS_Grazing", '423': "NGRASS_Grazing", '623': "NGRASS_Grazing",
+}
+_SPLIT_SOURCE_CODES = ('221', '222')
+_SPLIT_AG_LV_PROBABILITY = 0.7  # 221/222 -> AG-LV (나머지는 AG-FC)
+_SPLIT = -2  # 조회표에서 '추첨 필요'를 뜻하는 값
+
+
+def _source_category(code, forest_codes):
+    """추첨 없는 규칙 조회. 221/222는 None, 규칙이 없으면 ""."""
+    if code in _SPLIT_SOURCE_CODES: return None
+    if code in _SOURCE_CATEGORY_RULES: return _SOURCE_CATEGORY_RULES[code]
+    if code in forest_codes: return "FR"
+    return ""
+
+
+def _uniform_draws(rng, n):
+    """난수 n개를 한 번에 뽑습니다. numpy Generator는 한 번의 호출, random.Random은 행 순서대로 같은 값을 재현합니다."""
+    if hasattr(rng, "bit_generator"): return rng.random(n)
+    return np.fromiter((rng.random() for _ in range(n)), dtype=np.float64, count=n)
+
+
+def classify_source_codes(codes, rng=None, scenario=None):
+    """
+    단계 1 원본 L3 코드 배열을 한 번에 분류합니다.
+    반환: (category_idx, factors). category_idx는 scenario.evolved_categories 인덱스(int8)이며
+    유효하지 않은 행(규칙 없음, 목록 밖 카테고리, factor <= 0)은 -1입니다. 221/222 추첨은 한 번에 뽑습니다
+    (rng가 없으면 scenario.seed로 만든 numpy Generator).
+    """
+    scenario = resolve_scenario(scenario)
+    codes = np.array(["" if c is None else str(c).strip() for c in codes], dtype=object)
+    n = len(codes)
+    if n == 0: return np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int64)
+    category_index = {c: i for i, c in enumerate(scenario.evolved_categories)}
+    cat_factor = np.array([scenario.compression_factor(c) for c in scenario.evolved_categories], dtype=np.int64)
+
+    def to_index(category):
+        idx = category_index.get(category, -1)
+        return idx if idx >= 0 and cat_factor[idx] > 0 else -1
+
+    # 고유 코드마다 한 번만 규칙 조회 -> 조회표 (코드 인덱스 -> 카테고리 인덱스)
+    unique_codes, inverse = np.unique(codes.astype(str), return_inverse=True)
+    code_counts = np.bincount(inverse, minlength=len(unique_codes))
+    lookup = np.full(len(unique_codes), -1, dtype=np.int8); unknown = []
+    for u, code in enumerate(unique_codes.tolist()):
+        category = _source_category(code, scenario.forest_codes) if code else ""
+        if category is None: lookup[u] = _SPLIT
+        elif category: lookup[u] = to_index(category)
+        elif code: unknown.append(f"{code}({code_counts[u]}개)")
+    # 행마다 경고하지 않고 코드별로 한 번만 출력
+    if unknown: print(f"      경고: EvolvedCategory 규칙이 없는 소스 코드: {', '.join(unknown)}")
+    category_idx = lookup[inverse]
+    split_rows = np.flatnonzero(category_idx == _SPLIT)
+    if len(split_rows):
+        draws = _uniform_draws(rng if rng is not None else np.random.default_rng(scenario.seed), len(split_rows))
+        category_idx[split_rows] = np.where(draws < _SPLIT_AG_LV_PROBABILITY, to_index("AG-LV"), to_index("AG-FC"))
+    factors = np.where(category_idx >= 0, cat_factor[np.maximum(category_idx, 0)], 0)
+    return category_idx, factors
+
+
+def classify_island_code(code, scenario=None):
+    """단계 2 섬 노드 L3 코드 -> (NodeStatus, NodeTypeLabel). 행마다 호출하는 경우 scenario를 한 번 구해 넘기세요."""
+    scenario = resolve_scenario(scenario)
+    current_status = config.STATUS_ORIGINAL_NONURBAN; current_label = config.NODE_TYPE_LABELS.get(code, f"Unknown_{code}")
+    if code in scenario.forest_codes: current_status = config.STATUS_ORIGINAL_NONURBAN; current_label = config.NODE_TYPE_LABELS.get(code, f"Forest_{code}")
+    elif code in scenario.low_priority_urban_codes: current_status = config.STATUS_ORIGINAL_LOW_PRI
+    elif code in scenario.high_priority_urban_codes: current_status = config.STATUS_ORIGINAL_HIGH_PRI
+    elif code in scenario.transport_codes: current_status = config.STATUS_ORIGINAL_TRANSPORT
+    return current_status, current_label
+
+
+def classify_grazing(status, type_label, l3_code_val, scenario=None):
+    """3C 목축지 분류 규칙. (IsGrazing, GrazingType) 반환."""
+    scenario = resolve_scenario(scenario)
+    current_is_grazing = "No"; current_grazing_type = "NonGrazing"
+    if status == config.STATUS_DEMOLISHED: current_is_grazing = "Yes"; current_grazing_type = "DemolishedToGrazing"
+    elif status == config.STATUS_REPLACED:
+        if type_label in ("LS", "NGRASS_Grazing"): current_is_grazing = "Yes"; current_grazing_type = "EvolvedToGrazing"
+        elif scenario.evolved_to_l3_lookup.get(type_label) in scenario.grazing_codes: current_is_grazing = "Yes"; current_grazing_type = "EvolvedToGrazing"
+        elif scenario.evolved_to_l3_lookup.get(type_label) in scenario.forest_codes: current_grazing_type = "EvolvedToForest"
+    elif status == config.STATUS_ORIGINAL_NONURBAN:
+        if l3_code_val in scenario.forest_codes: current_grazing_type = "OriginalForest"
+        elif l3_code_val in scenario.base_grazing_codes: current_is_grazing = "Yes"; current_grazing_type = "OriginalGrazing"
+    return current_is_grazing, current_grazing_type
+
+
+# (시나리오, 어휘(사전 값 목록)) -> 조회표. 같은 시나리오·어휘를 쓰는 테이블 복사본·실현끼리 공유됩니다.
+_GRAZING_TABLES = {}
+_GRAZING_TABLE_CACHE_SIZE = 8
+
+
+def grazing_decision_table(codebooks, scenario=None):
+    """
+    3C 결정표: [status 코드, label 코드, l3_code 코드] -> (IsGrazing 코드, GrazingType 코드), uint8 배열 (S, L, C, 2).
+    classify_grazing을 어휘의 모든 조합에 한 번씩 적용해 만들며, 시나리오와 어휘가 같으면 다시 만들지 않습니다.
+    """
+    scenario = resolve_scenario(scenario)
+    vocab = tuple(tuple(codebooks[column].values) for column in ("status", "label", "l3_code", "is_grazing", "grazing_type"))
+    key = (scenario, vocab)
+    table = _GRAZING_TABLES.get(key)
+    if table is None:
+        statuses, labels, l3_codes = vocab[:3]
+        table = np.zeros((len(statuses), len(labels), len(l3_codes), 2), dtype=np.uint8)
+        for s, status in enumerate(statuses):
+            for l, label in enumerate(labels):
+                for c, l3_code in enumerate(l3_codes):
+                    is_grazing, grazing_type = classify_grazing(status, label, l3_code, scenario)
+                    table[s, l, c] = codebooks["is_grazing"].code(is_grazing), codebooks["grazing_type"].code(grazing_type)
+        if len(_GRAZING_TABLES) >= _GRAZING_TABLE_CACHE_SIZE: _GRAZING_TABLES.clear()
+        _GRAZING_TABLES[key] = table
+    return table
+
+
+def update_grazing_fields(node_store, rows=None, scenario=None):
+    """노드 테이블(rows를 주면 해당 행만)에 3C 목축지 분류를 결정표 조회 한 번으로 적용합니다."""
+    table = grazing_decision_table(node_store.codebooks, scenario)
+    rows = slice(None) if rows is None else np.asarray(rows, dtype=np.intp)
+    result = table[node_store.status[rows], node_store.label[rows], node_store.l3_code[rows]]
+    node_store.is_grazing[rows] = result[:, 0]; node_store.grazing_type[rows] = result[:, 1]
+
+
+def classify_grazing_columns(statuses, labels, l3_codes, scenario=None):
+    """
+    문자열 컬럼 전체에 3C 분류를 한 번에 적용합니다 (피처 클래스 커서 경로용).
+    반환: (IsGrazing 배열, GrazingType 배열, GrazingType별 노드 수).
+    """
+    books = island_codebooks()
+    codes = [books[column].encode(values) for column, values in (("status", statuses), ("label", labels), ("l3_code", l3_codes))]
+    result = grazing_decision_table(books, scenario)[codes[0], codes[1], codes[2]]
+    counts = np.bincount(result[:, 1], minlength=len(books["grazing_type"]))
+    return books["is_grazing"].decode(result[:, 0]), books["grazing_type"].decode(result[:, 1]), {value: int(counts[code]) for code, value in enumerate(books["grazing_type"].values) if counts[code]}
+
+
+class CandidateQueues:
+    """
+    대체 후보(ReplacePriority 내림차순) / 철거 후보(오름차순) 힙.
+    단계 2 이후 우선순위는 바뀌지 않고 상태만 바뀌므로 한 번만 만들고, 이미 대체·철거되어
+    자격을 잃은 노드는 꺼낼 때 버립니다 (지연 삭제). Phase마다 N개 선택 비용은 O(N log M).
+    동순위는 행(UniqueID) 순서로, 기존 안정 정렬과 같은 결과를 냅니다.
+    """
+
+    def __init__(self, node_store):
+        self.node_store = node_store
+        self._urban_codes = frozenset(node_store.codebooks["status"].codes(config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI).tolist())
+        self._demolished_label_code = node_store.code("label", config.DEMOLISHED_LABEL)
+        original_urban = node_store.mask("status", config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI)
+        replace_rows = np.flatnonzero(original_urban | (node_store.label == self._demolished_label_code))
+        self._replace_heap = list(zip((-node_store.priority[replace_rows]).tolist(), replace_rows.tolist())); heapq.heapify(self._replace_heap)
+        demolish_rows = np.flatnonzero(original_urban)
+        self._demolish_heap = list(zip(node_store.priority[demolish_rows].tolist(), demolish_rows.tolist())); heapq.heapify(self._demolish_heap)
+
+    def _is_original_urban(self, row):
+        return int(self.node_store.status[row]) in self._urban_codes
+
+    def _can_replace(self, row):
+        return self._is_original_urban(row) or self.node_store.label[row] == self._demolished_label_code
+
+    @staticmethod
+    def _pop(heap, n, eligible):
+        picked = []
+        while heap and len(picked) < n:
+            item = heapq.heappop(heap)
+            if eligible(item[1]): picked.append(item)
+        return picked
+
+    def pop_replacement(self, n):
+        """우선순위가 가장 높은 대체 가능 노드 최대 n개의 (키, 행) 목록."""
+        return self._pop(self._replace_heap, n, self._can_replace)
+
+    def pop_demolition(self, n):
+        """우선순위가 가장 낮은 철거 가능 노드 최대 n개의 (키, 행) 목록."""
+        return self._pop(self._demolish_heap, n, self._is_original_urban)
+
+    def push_back_replacement(self, items):
+        """꺼냈지만 사용하지 않은 대체 후보를 되돌립니다."""
+        for item in items: heapq.heappush(self._replace_heap, item)
+
+
+class SourcePool:
+    """
+    아직 처리되지 않은 원본 노드 풀. 생성 시 원본 행 순열을 한 번 섞어 두고 커서로 앞에서부터 꺼내므로,
+    Phase마다 k개 추출은 O(k) 슬라이스입니다 (남은 노드에서 비복원 균등 추출과 같은 분포).
+    EvolvedCategory 코드와 잠재력(1/CompressionFactor, 무효 행은 0)도 미리 배열로 만들어 두어
+    추출한 행의 카테고리별 잠재력 합은 bincount 한 번으로 구합니다.
+    processed_ids(이미 처리된 UniqueID)를 주면 해당 행은 처리된 것으로 보고 순열 앞쪽에 둡니다.
+    """
+
+    def __init__(self, source_table, rng=None, processed_ids=(), scenario=None):
+        self.source_table = source_table
+        # 순열은 rng에서 뽑은 시드로 만들어, 같은 rng 시드면 같은 추출 순서가 됩니다.
+        permutation_rng = np.random.default_rng((rng or random).getrandbits(64))
+        done = np.zeros(len(source_table), dtype=bool)
+        if len(processed_ids): done[source_table.index_of(processed_ids)] = True
+        self._order = np.concatenate([np.flatnonzero(done), permutation_rng.permutation(np.flatnonzero(~done))])
+        self._cursor = int(np.count_nonzero(done))
+        factors = source_table.compression_factor
+        self._valid = source_table.mask("evolved_category", *resolve_scenario(scenario).evolved_categories) & (factors > 0)
+        self._potential = np.divide(1.0, factors, out=np.zeros(len(factors)), where=self._valid)
+
+    def __len__(self):
+        """남은(미처리) 원본 노드 수. 소진된 풀은 거짓이므로 풀이 주어졌는지는 None과 비교해 판별하세요."""
+        return len(self._order) - self._cursor
+
+    @property
+    def processed_count(self):
+        return self._cursor
+
+    def draw(self, n):
+        """미처리 원본 노드 최대 n개의 행 인덱스를 꺼내고 처리된 것으로 표시합니다."""
+        rows = self._order[self._cursor:self._cursor + n]; self._cursor += len(rows)
+        return rows
+
+    def unique_ids(self, rows):
+        return self.source_table.unique_id[rows].tolist()
+
+    def category_potentials(self, rows):
+        """
+        rows의 EvolvedCategory별 잠재력 합 {카테고리: 합}과 제외된(카테고리/압축계수 무효) 행 수.
+        키 순서는 rows에서 처음 등장한 순서입니다.
+        """
+        valid = self._valid[rows]; valid_codes = self.source_table.evolved_category[rows][valid]
+        codebook = self.source_table.codebooks["evolved_category"]
+        potentials = np.bincount(valid_codes, weights=self._potential[rows][valid], minlength=len(codebook))
+        _, first_seen = np.unique(valid_codes, return_index=True)
+        return {codebook.values[code]: float(potentials[code]) for code in valid_codes[np.sort(first_seen)].tolist()}, int(np.count_nonzero(~valid))
+
+
+def run_scenario_phase(phase_name, node_store, source_table, **kwargs):
+    """
+    [단계 3] 하나의 Phase를 메모리 내 노드 테이블에 적용합니다.
+    node_store는 제자리에서 갱신되며 (processed_source_node_ids, newly_replaced_ids, newly_demolished_ids)를 반환합니다.
+    kwargs['rng'](random.Random)를 주면 원본 노드 추출과 카테고리 순서 섞기에 사용합니다 (없으면 전역 random).
+    kwargs['candidate_queues'](CandidateQueues)를 주면 Phase 간에 재사용하며, 없으면 이번 호출에서 만듭니다.
+    kwargs['source_pool'](SourcePool)도 마찬가지이며, 없으면 processed_source_node_ids를 제외하고 이번 호출에서 만듭니다.
+    kwargs['scenario'](scenario.Scenario)가 없으면 config 기본 시나리오의 카테고리·코드 집합을 사용합니다.
+    """
+    rng = kwargs.get('rng') or random; scenario = resolve_scenario(kwargs.get('scenario'))
+    candidate_queues = kwargs.get('candidate_queues') or CandidateQueues(node_store)
+    total_source_nodes_count = kwargs.get('total_source_nodes_count', 0)
+    total_original_replaceable_count = kwargs.get('total_original_replaceable_count', 0)
+    processed_source_node_ids = kwargs.get('processed_source_node_ids', set())
+    source_pool = kwargs.get('source_pool')
+    if source_pool is None: source_pool = SourcePool(source_table, rng, processed_source_node_ids, scenario)
+    p_cumulative_migration_ratio_curr = kwargs.get('p_cumulative_migration_ratio_curr', 0.0)
+    p_cumulative_demolition_ratio_curr = kwargs.get('p_cumulative_demolition_ratio_curr', 0.0)
+
+    original_urban = node_store.mask("status", config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI)
+    newly_replaced_ids = set(); newly_demolished_ids = set(); stages = instrumentation.stages(f"step3.{phase_name}")
+
+    # === 3A. Incremental Replacement First ===
+    stages.next("3A_replace"); print(f"  --- 3A. {phase_name} 대체 작업 (메모리) ---")
+    target_source_cumulative = round(total_source_nodes_count * p_cumulative_migration_ratio_curr)
+    num_source_to_process_this_step = max(0, target_source_cumulative - len(processed_source_node_ids))
+    print(f"    누적 처리 원본 목표 {target_source_cumulative}개, 이전 처리 {len(processed_source_node_ids)}개, 이번 단계 처리 {num_source_to_process_this_step}개")
+    num_evolved_nodes_this_step = 0; evolved_category_counts_this_step = {}; selected_new_source_oids = []
+    if num_source_to_process_this_step > 0 and total_source_nodes_count > 0:
+        if num_source_to_process_this_step > len(source_pool): print(f"    경고: 처리할 새 원본 노드 부족."); num_source_to_process_this_step = len(source_pool)
+        if num_source_to_process_this_step > 0:
+            src_idx = source_pool.draw(num_source_to_process_this_step); selected_new_source_oids = source_pool.unique_ids(src_idx)
+            evolved_category_potential_this_step, num_excluded = source_pool.category_potentials(src_idx)
+            if num_excluded: print(f"        -> 제외된 원본 노드 {num_excluded}개 (카테고리/압축계수 무효).")
+            num_evolved_nodes_this_step = round(sum(evolved_category_potential_this_step.values())); print(f"    생성될 총 진화 노드 수: {num_evolved_nodes_this_step}")
+            if num_evolved_nodes_this_step > 0: evolved_category_counts_this_step = allocate_integer_counts(evolved_category_potential_this_step, num_evolved_nodes_this_step, rng); print(f"    카테고리별 할당량: {dict(evolved_category_counts_this_step)}")
+    elif total_source_nodes_count == 0: print("    원본 노드 없어 대체 작업 생략.")
+
+    available_for_replacement = original_urban | node_store.mask("label", config.DEMOLISHED_LABEL)
+    current_replaceable_slots_count = int(np.count_nonzero(available_for_replacement))
+    print(f"    현재 대체 가능한 슬롯 수 (Original Urban + Demolished_To_Grazing): {current_replaceable_slots_count}")
+    num_nodes_to_replace_this_scenario = min(num_evolved_nodes_this_step, current_replaceable_slots_count)
+    if num_nodes_to_replace_this_scenario > 0 and evolved_category_counts_this_step:
+        slot_items = candidate_queues.pop_replacement(num_nodes_to_replace_this_scenario)
+        slot_idx = np.array([row for _, row in slot_items], dtype=np.int64)
+        temp_category_counts = evolved_category_counts_this_step.copy()
+        category_keys_ordered = list(temp_category_counts.keys()); rng.shuffle(category_keys_ordered)
+        assigned = []
+        while len(assigned) < num_nodes_to_replace_this_scenario:
+            assigned_this_target = False
+            for category in category_keys_ordered:
+                if temp_category_counts.get(category, 0) > 0: assigned.append(category); temp_category_counts[category] -= 1; assigned_this_target = True; category_keys_ordered.append(category_keys_ordered.pop(0)); break
+            if not assigned_this_target: print(f"Warning: Ran out of categories to assign."); break
+        slot_idx = slot_idx[:len(assigned)]; candidate_queues.push_back_replacement(slot_items[len(assigned):])
+        node_store.assign("label", slot_idx, assigned); node_store.assign("status", slot_idx, config.STATUS_REPLACED)
+        newly_replaced_ids = set(node_store.unique_id[slot_idx].tolist())
+        print(f"    {len(slot_idx)}개 노드 상태 '{config.STATUS_REPLACED}' 업데이트 완료.")
+    else: print("    이번 단계 대체 작업 없음.")
+    processed_source_node_ids.update(selected_new_source_oids)
+
+    # === 3B. Incremental Demolition (After Replacement) ===
+    stages.next("3B_demolish"); print(f"  --- 3B. {phase_name} 철거 작업 (메모리) ---")
+    target_demolished_cumulative_current = min(round(total_original_replaceable_count * p_cumulative_demolition_ratio_curr), total_original_replaceable_count)
+    if p_cumulative_demolition_ratio_curr >= 1.0: target_demolished_cumulative_current = total_original_replaceable_count
+    num_already_demolished_total = int(np.count_nonzero(node_store.mask("status", config.STATUS_DEMOLISHED)))
+    num_to_demolish_this_step = max(0, target_demolished_cumulative_current - num_already_demolished_total)
+    demolishable = node_store.mask("status", config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI)
+    actual_num_to_demolish_this_step = min(num_to_demolish_this_step, int(np.count_nonzero(demolishable)))
+    print(f"    누적 철거 목표 {target_demolished_cumulative_current}개, 현재까지 총 철거된 수 {num_already_demolished_total}개, 이번 단계 {actual_num_to_demolish_this_step}개")
+    if actual_num_to_demolish_this_step > 0:
+        dem_idx = np.array([row for _, row in candidate_queues.pop_demolition(actual_num_to_demolish_this_step)], dtype=np.int64)
+        node_store.assign("status", dem_idx, config.STATUS_DEMOLISHED); node_store.assign("label", dem_idx, config.DEMOLISHED_LABEL)
+        newly_demolished_ids = set(node_store.unique_id[dem_idx].tolist())
+        print(f"    {len(dem_idx)}개 노드 상태 '{config.STATUS_DEMOLISHED}', 라벨 '{config.DEMOLISHED_LABEL}' 업데이트.")
+    else: print("    이번 단계 추가 철거 대상 없음.")
+
+    # --- 3C. 목축지 분류 (이번 단계에서 바뀐 행만) ---
+    stages.next("3C_grazing")
+    changed_rows = node_store.index_of(sorted(newly_replaced_ids | newly_demolished_ids))
+    update_grazing_fields(node_store, changed_rows, scenario)
+    print(f"    ({phase_name}) 목축지 분류 필드 업데이트 완료 (변경 노드 {len(changed_rows)}개). GrazingType별: {node_store.value_counts('grazing_type')}")
+    stages.close()
+    return processed_source_node_ids, newly_replaced_ids, newly_demolished_ids
+
+
+def phase_schedule(migration_ratios=None, demolition_ratios=None, scenario=None):
+    """Phase 일정 -> [(phase_name, 누적 이전 비율, 누적 철거 비율)]. 비율 목록을 주지 않으면 scenario(기본: config)의 일정을 사용합니다."""
+    if migration_ratios is None or demolition_ratios is None: scenario = resolve_scenario(scenario)
+    migration_ratios = scenario.migration_ratios if migration_ratios is None else migration_ratios
+    demolition_ratios = scenario.demolition_ratios if demolition_ratios is None else demolition_ratios
+    return [(f"Phase_{i+1}_{int(m*100)}pct", m, d) for i, (m, d) in enumerate(zip(migration_ratios, demolition_ratios))]
+
+
+def run_phase_schedule(node_store, source_table, schedule, rng=None, scenario=None):
+    """
+    Phase 일정 [(phase_name, 누적 이전 비율, 누적 철거 비율)] 전체를 node_store에 차례로 적용합니다.
+    Phase마다 (phase_name, processed_source_node_ids, newly_replaced_ids, newly_demolished_ids)를 내보냅니다.
+    """
+    total_replaceable = int(np.count_nonzero(node_store.mask("status", config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI)))
+    processed_source_ids = set(); candidate_queues = CandidateQueues(node_store); source_pool = SourcePool(source_table, rng, scenario=scenario)
+    for phase_name, migration_ratio, demolition_ratio in schedule:
+        processed_source_ids, newly_replaced_ids, newly_demolished_ids = run_scenario_phase(
+            phase_name, node_store, source_table, rng=rng, candidate_queues=candidate_queues, source_pool=source_pool, scenario=scenario,
+            total_source_nodes_count=len(source_table), total_original_replaceable_count=total_replaceable,
+            processed_source_node_ids=processed_source_ids,
+            p_cumulative_migration_ratio_curr=migration_ratio, p_cumulative_demolition_ratio_curr=demolition_ratio)
+        yield phase_name, processed_source_ids, newly_replaced_ids, newly_demolished_ids
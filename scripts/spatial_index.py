@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+노드 좌표용 격자(Grid) 공간 인덱스
+
+노드 좌표 위에 한 번만 구축하고, 섬 ID(그룹)별로 분할하여 보관합니다.
+배치 k-최근접 / 반경 질의를 NumPy로 처리하므로 단계 2의 공업지역 거리(NearIndDist)나
+향후 교통·산림 경계 근접도 같은 요인을 지오프로세싱 호출 없이 계산할 수 있습니다.
+10^5 ~ 10^6 노드 규모를 대상으로 하며, 질의는 내부적으로 청크 단위로 나누어 처리합니다.
+"""
+import numpy as np
+
+# 셀당 평균 점 개수 목표 (셀 크기 자동 결정용)
+_TARGET_POINTS_PER_CELL = 4.0
+# 한 번에 처리할 질의 점 개수
+_QUERY_CHUNK = 100_000
+
+
+def _ring_offsets(r):
+    """체비셰프 거리 r인 셀 오프셋 (m x 2)."""
+    if r == 0: return np.zeros((1, 2), dtype=np.int64)
+    side = np.arange(-r, r + 1, dtype=np.int64)
+    top = np.column_stack([side, np.full(len(side), r)]); bottom = np.column_stack([side, np.full(len(side), -r)])
+    inner = np.arange(-r + 1, r, dtype=np.int64)
+    left = np.column_stack([np.full(len(inner), -r), inner]); right = np.column_stack([np.full(len(inner), r), inner])
+    return np.concatenate([top, bottom, left, right])
+
+
+def _square_offsets(r):
+    """체비셰프 거리 r 이하인 모든 셀 오프셋."""
+    side = np.arange(-r, r + 1, dtype=np.int64)
+    gx, gy = np.meshgrid(side, side)
+    return np.column_stack([gx.ravel(), gy.ravel()])
+
+
+class SpatialIndex:
+    """
+    점 좌표의 격자 인덱스.
+    groups(정수, 0 이상)를 주면 같은 그룹 안에서만 질의하고, -1인 점은 인덱스에서 제외합니다.
+    ids를 주면 질의 시 query_ids와 같은 ID(자기 자신)를 결과에서 뺄 수 있습니다.
+    """
+
+    def __init__(self, x, y, groups=None, ids=None, cell_size=None):
+        x = np.asarray(x, dtype=np.float64); y = np.asarray(y, dtype=np.float64)
+        groups = np.zeros(len(x), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+        keep = np.flatnonzero((groups >= 0) & np.isfinite(x) & np.isfinite(y))
+        self.size = len(keep)
+        if self.size == 0:
+            self.x0 = self.y0 = 0.0; self.cell_size = 1.0; self.nx = self.ny = 1; self.n_groups = 0
+        else:
+            self.x0 = float(x[keep].min()); self.y0 = float(y[keep].min())
+            width = float(x[keep].max()) - self.x0; height = float(y[keep].max()) - self.y0
+            if cell_size is None:
+                cell_size = self._default_cell_size(x[keep], y[keep], groups[keep], width, height)
+            self.cell_size = float(max(cell_size, 1e-9))
+            self.nx = int(width // self.cell_size) + 1; self.ny = int(height // self.cell_size) + 1
+            self.n_groups = int(groups[keep].max()) + 1
+        cx = ((x[keep] - self.x0) // self.cell_size).astype(np.int64) if self.size else np.empty(0, dtype=np.int64)
+        cy = ((y[keep] - self.y0) // self.cell_size).astype(np.int64) if self.size else np.empty(0, dtype=np.int64)
+        g = groups[keep]
+        keys = self._encode(g, cx, cy)
+        order = np.argsort(keys, kind="stable")
+        self._point_index = keep[order]
+        self._x = x[self._point_index]; self._y = y[self._point_index]
+        self._ids = None if ids is None else np.asarray(ids)[self._point_index]
+        sorted_keys = keys[order]
+        self._cell_keys, self._cell_start, self._cell_count = np.unique(sorted_keys, return_index=True, return_counts=True)
+        # 그룹별 셀 범위 (링 확장 종료 조건)
+        self._g_min_cx = np.full(self.n_groups, np.iinfo(np.int64).max); self._g_max_cx = np.full(self.n_groups, -1)
+        self._g_min_cy = np.full(self.n_groups, np.iinfo(np.int64).max); self._g_max_cy = np.full(self.n_groups, -1)
+        self._g_count = np.zeros(self.n_groups, dtype=np.int64)
+        if self.size:
+            np.minimum.at(self._g_min_cx, g, cx); np.maximum.at(self._g_max_cx, g, cx)
+            np.minimum.at(self._g_min_cy, g, cy); np.maximum.at(self._g_max_cy, g, cy)
+            np.add.at(self._g_count, g, 1)
+
+    def _default_cell_size(self, x, y, g, width, height):
+        """그룹(섬)별 점 밀도를 기준으로 셀당 평균 점 개수가 목표치가 되도록 셀 크기를 정합니다."""
+        n_groups = int(g.max()) + 1
+        g_min_x = np.full(n_groups, np.inf); g_max_x = np.full(n_groups, -np.inf); g_min_y = np.full(n_groups, np.inf); g_max_y = np.full(n_groups, -np.inf)
+        np.minimum.at(g_min_x, g, x); np.maximum.at(g_max_x, g, x); np.minimum.at(g_min_y, g, y); np.maximum.at(g_max_y, g, y)
+        used = np.isfinite(g_min_x)
+        group_area = float(((g_max_x[used] - g_min_x[used]) * (g_max_y[used] - g_min_y[used])).sum())
+        if group_area <= 0: group_area = width * height
+        if group_area <= 0: return max(width, height, 1.0) / max(len(x) / _TARGET_POINTS_PER_CELL, 1.0)
+        return float(np.sqrt(group_area * _TARGET_POINTS_PER_CELL / len(x)))
+
+    def _encode(self, g, cx, cy):
+        return (np.asarray(g, dtype=np.int64) * self.ny + cy) * self.nx + cx
+
+    def _query_groups(self, n, groups):
+        if groups is None: return np.zeros(n, dtype=np.int64)
+        groups = np.asarray(groups, dtype=np.int64)
+        return np.where(groups < self.n_groups, groups, -1)
+
+    def _candidates(self, q_rows, q_cx, q_cy, q_g, offsets):
+        """질의 행별로 offsets 셀에 속한 (질의 행, 정렬된 점 위치) 쌍을 만듭니다."""
+        cx = q_cx[:, None] + offsets[:, 0]; cy = q_cy[:, None] + offsets[:, 1]
+        inside = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny) & (q_g[:, None] >= 0)
+        keys = self._encode(np.broadcast_to(q_g[:, None], cx.shape)[inside], cx[inside], cy[inside])
+        pos = np.searchsorted(self._cell_keys, keys)
+        pos_c = np.minimum(pos, max(len(self._cell_keys) - 1, 0))
+        found = (pos < len(self._cell_keys)) & (self._cell_keys[pos_c] == keys) if len(self._cell_keys) else np.zeros(len(keys), dtype=bool)
+        rows = np.broadcast_to(q_rows[:, None], cx.shape)[inside][found]
+        starts = self._cell_start[pos_c[found]]; counts = self._cell_count[pos_c[found]]
+        total = int(counts.sum())
+        pair_rows = np.repeat(rows, counts)
+        pair_pts = np.repeat(starts, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+        return pair_rows, pair_pts
+
+    def query_knn(self, qx, qy, k=1, groups=None, query_ids=None):
+        """
+        각 질의 점의 k-최근접 점. 반환: (거리 n x k, 원본 인덱스 n x k). 부족한 자리는 (inf, -1).
+        groups를 주면 같은 그룹의 점만, query_ids를 주면 같은 ID의 점은 제외합니다.
+        """
+        qx = np.asarray(qx, dtype=np.float64); qy = np.asarray(qy, dtype=np.float64)
+        n = len(qx)
+        best_d = np.full((n, k), np.inf); best_p = np.full((n, k), -1, dtype=np.int64)
+        if n == 0 or self.size == 0: return best_d, best_p
+        q_groups = self._query_groups(n, groups)
+        for c0 in range(0, n, _QUERY_CHUNK):
+            c1 = min(n, c0 + _QUERY_CHUNK)
+            self._knn_chunk(qx[c0:c1], qy[c0:c1], q_groups[c0:c1], None if query_ids is None else np.asarray(query_ids)[c0:c1], k, best_d[c0:c1], best_p[c0:c1])
+        found = best_p >= 0
+        best_idx = np.full((n, k), -1, dtype=np.int64); best_idx[found] = self._point_index[best_p[found]]
+        return best_d, best_idx
+
+    def _knn_chunk(self, qx, qy, q_g, q_ids, k, best_d, best_p):
+        n = len(qx)
+        q_cx = np.floor((qx - self.x0) / self.cell_size).astype(np.int64); q_cy = np.floor((qy - self.y0) / self.cell_size).astype(np.int64)
+        g_safe = np.where(q_g >= 0, q_g, 0)
+        # 그룹 셀 범위까지 남은 최대 링 (이보다 멀리 확장할 필요 없음)
+        max_ring = np.maximum.reduce([np.abs(q_cx - self._g_min_cx[g_safe]), np.abs(q_cx - self._g_max_cx[g_safe]), np.abs(q_cy - self._g_min_cy[g_safe]), np.abs(q_cy - self._g_max_cy[g_safe])])
+        active = (q_g >= 0) & (self._g_count[g_safe] > 0)
+        r = 0
+        while active.any():
+            a = np.flatnonzero(active)
+            rows, pts = self._candidates(a, q_cx[a], q_cy[a], q_g[a], _ring_offsets(r))
+            if len(rows):
+                d = np.hypot(qx[rows] - self._x[pts], qy[rows] - self._y[pts])
+                if q_ids is not None and self._ids is not None:
+                    keep = q_ids[rows] != self._ids[pts]; rows = rows[keep]; pts = pts[keep]; d = d[keep]
+                if k == 1 and len(rows):
+                    self._merge_nearest(rows, pts, d, best_d, best_p)
+                elif len(rows):
+                    self._merge_knn(rows, pts, d, k, best_d, best_p)
+            # 링 r까지 확인하면 남은 점은 최소 r * cell_size 이상 떨어져 있음
+            active[a] = (best_d[a, k - 1] > r * self.cell_size) & (r < max_ring[a])
+            r += 1
+
+    @staticmethod
+    def _merge_nearest(rows, pts, d, best_d, best_p):
+        """k=1 전용: 후보 쌍은 질의 행 순서로 생성되므로 정렬 없이 구간 최소값으로 갱신합니다."""
+        seg = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        seg_len = np.diff(np.r_[seg, len(d)])
+        seg_min = np.minimum.reduceat(d, seg)
+        is_min = d == np.repeat(seg_min, seg_len)
+        first = np.minimum.reduceat(np.where(is_min, np.arange(len(d)), len(d)), seg)
+        seg_rows = rows[seg]
+        better = seg_min < best_d[seg_rows, 0]
+        best_d[seg_rows[better], 0] = seg_min[better]; best_p[seg_rows[better], 0] = pts[first[better]]
+
+    @staticmethod
+    def _merge_knn(rows, pts, d, k, best_d, best_p):
+        """기존 k개 결과와 새 후보를 합쳐 질의 행별 상위 k개를 남깁니다."""
+        touched = np.unique(rows)
+        all_rows = np.concatenate([np.repeat(touched, k), rows])
+        all_d = np.concatenate([best_d[touched].ravel(), d]); all_p = np.concatenate([best_p[touched].ravel(), pts])
+        order = np.lexsort((all_d, all_rows))
+        all_rows = all_rows[order]; all_d = all_d[order]; all_p = all_p[order]
+        rank = np.arange(len(all_rows)) - np.searchsorted(all_rows, all_rows, side="left")
+        top = rank < k
+        best_d[all_rows[top], rank[top]] = all_d[top]; best_p[all_rows[top], rank[top]] = all_p[top]
+
+    def nearest(self, qx, qy, groups=None, query_ids=None):
+        """최근접 점까지의 거리와 원본 인덱스 (없으면 NaN, -1)."""
+        d, idx = self.query_knn(qx, qy, 1, groups, query_ids)
+        d = d[:, 0]
+        return np.where(np.isfinite(d), d, np.nan), idx[:, 0]
+
+    def query_radius(self, qx, qy, radius, groups=None, query_ids=None):
+        """
+        반경 radius 이내의 모든 점. 반환: (질의 인덱스, 원본 점 인덱스, 거리) 배열 — 질의 인덱스 순 정렬.
+        """
+        qx = np.asarray(qx, dtype=np.float64); qy = np.asarray(qy, dtype=np.float64)
+        n = len(qx)
+        if n == 0 or self.size == 0: return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        q_groups = self._query_groups(n, groups)
+        offsets = _square_offsets(int(np.ceil(radius / self.cell_size)))
+        out_q = []; out_p = []; out_d = []
+        for c0 in range(0, n, max(1, _QUERY_CHUNK // len(offsets))):
+            c1 = min(n, c0 + max(1, _QUERY_CHUNK // len(offsets)))
+            rows = np.arange(c0, c1)
+            q_cx = np.floor((qx[rows] - self.x0) / self.cell_size).astype(np.int64); q_cy = np.floor((qy[rows] - self.y0) / self.cell_size).astype(np.int64)
+            pr, pp = self._candidates(rows, q_cx, q_cy, q_groups[rows], offsets)
+            d = np.hypot(qx[pr] - self._x[pp], qy[pr] - self._y[pp])
+            keep = d <= radius
+            if query_ids is not None and self._ids is not None: keep &= np.asarray(query_ids)[pr] != self._ids[pp]
+            out_q.append(pr[keep]); out_p.append(self._point_index[pp[keep]]); out_d.append(d[keep])
+        q_idx = np.concatenate(out_q); p_idx = np.concatenate(out_p); dist = np.concatenate(out_d)
+        order = np.lexsort((dist, q_idx))
+        return q_idx[order], p_idx[order], dist[order]
+
+
+def build_code_index(x, y, l3_codes, code_set, groups=None, ids=None, cell_size=None):
+    """L3 코드 집합(예: config.INDUSTRIAL_L3_CODES)에 속한 노드만으로 인덱스를 만듭니다."""
+    mask = np.isin(np.asarray(l3_codes, dtype=object), list(code_set))
+    groups = None if groups is None else np.where(mask, np.asarray(groups, dtype=np.int64), -1)
+    if groups is None: groups = np.where(mask, 0, -1)
+    return SpatialIndex(x, y, groups=groups, ids=ids, cell_size=cell_size)
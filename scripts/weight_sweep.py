@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+SSI 가중치 스윕
+
+NearCenDist / NearIndDist와 섬별 정규화는 가중치와 무관하므로 단계 2 결과 노드 테이블에서
+구성 요소 행렬(노드 x 3)을 한 번만 만들고, 모든 가중치 조합의 ReplacePriority를
+행렬곱 한 번으로 계산합니다. 조합마다 Phase 일정을 같은 난수 시드로 실행하여
+결과 차이가 가중치에서만 오도록 하고, Phase별 대체/철거 노드 집합을 보고합니다.
+"""
+import contextlib
+import csv
+import io
+import itertools
+import random
+
+import numpy as np
+
+from . import config
+from . import scoring
+from . import simulation
+from .scenario import resolve_scenario
+
+
+def weight_grid(step=0.1):
+    """합이 1인 (w_status, w_center, w_industry) 조합을 step 간격으로 모두 만듭니다."""
+    n = int(round(1.0 / step))
+    return [(i / n, j / n, (n - i - j) / n) for i, j in itertools.product(range(n + 1), repeat=2) if i + j <= n]
+
+
+def scored_node_mask(node_store):
+    """단계 2에서 점수가 계산된 노드 (원래 도시 노드 중 ReplacePriority가 -1이 아닌 행)."""
+    replaceable = node_store.mask("status", config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI)
+    return replaceable & (node_store.priority >= 0)
+
+
+def component_matrix(node_store, scenario=None):
+    """
+    점수 계산 대상 행 인덱스와 구성 요소 행렬 (대상 수 x 3)을 반환합니다.
+    거리가 없는(NaN) 노드는 단계 2와 같은 정규화 규칙(scenario의 정규화 방식, 기본: config)을 따릅니다.
+    """
+    rows = np.flatnonzero(scored_node_mask(node_store))
+    group, keys = scoring.encode_groups(node_store.island_id[rows].tolist())
+    is_high = node_store.status[rows] == node_store.code("status", config.STATUS_ORIGINAL_HIGH_PRI)
+    return rows, scoring.score_components(is_high, node_store.near_cen_dist[rows], node_store.near_ind_dist[rows], group, len(keys), scenario=scenario)
+
+
+def priority_matrix(components, weight_triples):
+    """(대상 수 x 3) @ (3 x 조합 수) -> 조합별 ReplacePriority 열."""
+    return components @ np.asarray(weight_triples, dtype=np.float64).reshape(-1, 3).T
+
+
+class WeightSweepResult:
+    """가중치 조합별 Phase 결과. phases[k][phase_name] = {"replaced": frozenset, "demolished": frozenset}."""
+
+    def __init__(self, weight_triples, phase_names, phases):
+        self.weight_triples = [tuple(float(w) for w in triple) for triple in weight_triples]
+        self.phase_names = phase_names
+        self.phases = phases
+
+    def summary_rows(self):
+        """조합 x Phase별 대체/철거 노드 수 (출력/CSV용)."""
+        return [{"w_status": w[0], "w_center": w[1], "w_industry": w[2], "phase": phase_name,
+                 "replaced": len(result["replaced"]), "demolished": len(result["demolished"])}
+                for w, phase_results in zip(self.weight_triples, self.phases) for phase_name, result in phase_results.items()]
+
+
+def run_weight_sweep(node_store, source_table, weight_triples, seed=None, schedule=None, scenario=None):
+    """
+    weight_triples의 각 조합으로 ReplacePriority를 다시 매긴 뒤 Phase 일정(기본: scenario의 일정)을 실행합니다.
+    node_store는 단계 2 결과(Phase 적용 전) 테이블이며 변경되지 않습니다.
+    """
+    scenario = resolve_scenario(scenario); schedule = schedule or simulation.phase_schedule(scenario=scenario)
+    seed = config.MONTE_CARLO_SEED if seed is None else seed
+    rows, components = component_matrix(node_store, scenario=scenario)
+    priorities = priority_matrix(components, weight_triples)
+    print(f"가중치 스윕: 조합 {priorities.shape[1]}개, 점수 대상 노드 {len(rows)}개, Phase {len(schedule)}개")
+    phases = []
+    for k in range(priorities.shape[1]):
+        store = node_store.copy(writable=("priority",)); store.priority[rows] = priorities[:, k]
+        # 모든 조합에 같은 시드를 사용 (공통 난수) -> 결과 차이는 가중치에서만 발생
+        rng = random.Random(seed); phase_results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for phase_name, _, _, _ in simulation.run_phase_schedule(store, source_table, schedule, rng, scenario):
+                phase_results[phase_name] = {"replaced": frozenset(store.unique_id[store.mask("status", config.STATUS_REPLACED)].tolist()),
+                                             "demolished": frozenset(store.unique_id[store.mask("status", config.STATUS_DEMOLISHED)].tolist())}
+        phases.append(phase_results)
+    return WeightSweepResult(weight_triples, [name for name, _, _ in schedule], phases)
+
+
+def write_sweep_csv(result, csv_path):
+    """조합 x Phase별 노드 수와 대체/철거 UniqueID 목록(공백 구분)을 CSV로 저장합니다."""
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["w_status", "w_center", "w_industry", "phase", "replaced", "demolished", "replaced_ids", "demolished_ids"])
+        for w, phase_results in zip(result.weight_triples, result.phases):
+            for phase_name, sets in phase_results.items():
+                writer.writerow(list(w) + [phase_name, len(sets["replaced"]), len(sets["demolished"]), " ".join(map(str, sorted(sets["replaced"]))), " ".join(map(str, sorted(sets["demolished"])))])
+    print(f"  가중치 스윕 결과 저장: {csv_path} ({len(result.weight_triples)}개 조합)")
+    return csv_path
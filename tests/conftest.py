@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""저장소 루트에서 `python -m pytest`로 실행합니다. scripts 패키지를 찾도록 루트를 경로에 넣습니다."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""중단 후 이어 실행한 일괄 실행 결과가 중단 없이 실행한 결과와 같은지 확인합니다 (합성 GeoPackage 사용)."""
+import json
+
+import numpy as np
+
+from scripts import batch
+from scripts import benchmark
+from scripts import processing
+from scripts import simulation
+from scripts.node_store import open_arrays
+
+
+def _write_manifest(tmp_path):
+    gpkg_path = benchmark.write_archipelago_gpkg(benchmark.generate_archipelago(300, nodes_per_island=60, seed=3), str(tmp_path / "region.gpkg"))
+    manifest = {"defaults": {"backend": "gpkg", "gpkg_path": gpkg_path, "config": {"PERSIST_PHASE_RESULTS": True}}, "regions": [{"name": "r1", "seed": 11}]}
+    path = tmp_path / "manifest.json"; path.write_text(json.dumps(manifest), encoding="utf-8")
+    return str(path)
+
+
+def _last_phase_table(output_root):
+    last_phase = simulation.phase_schedule()[-1][0]
+    return open_arrays(str(output_root / "r1" / "checkpoints" / f"phase_{last_phase}"))
+
+
+def test_resumed_run_matches_uninterrupted(tmp_path, monkeypatch):
+    manifest = _write_manifest(tmp_path); full_root = tmp_path / "full"; resumed_root = tmp_path / "resumed"
+    assert batch.main([manifest, "--output-root", str(full_root)]) == 0
+
+    # 두 번째 Phase에서 실패시킨 뒤 같은 출력 경로로 다시 실행
+    second_phase = simulation.phase_schedule()[1][0]; execute = processing.execute_scenario_phase_in_memory
+    def failing(**kwargs):
+        if kwargs["phase_name"] == second_phase: raise RuntimeError("중단 시험")
+        return execute(**kwargs)
+    monkeypatch.setattr(processing, "execute_scenario_phase_in_memory", failing)
+    assert batch.main([manifest, "--output-root", str(resumed_root)]) == 1
+    monkeypatch.setattr(processing, "execute_scenario_phase_in_memory", execute)
+    assert batch.main([manifest, "--output-root", str(resumed_root)]) == 0
+
+    summary = json.loads((resumed_root / "batch_summary.json").read_text(encoding="utf-8"))[0]
+    assert summary["resumed_from"][:2] == [batch.STEP1, batch.STEP2] and f"phase:{second_phase}" in summary["stages_run"]
+    full = _last_phase_table(full_root); resumed = _last_phase_table(resumed_root)
+    np.testing.assert_array_equal(full.unique_id, resumed.unique_id); np.testing.assert_array_equal(full.priority, resumed.priority)
+    for column in full.MUTABLE_COLUMNS: np.testing.assert_array_equal(full.decode(column), resumed.decode(column))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""단계 2 캐시 항목을 다른 가중치로 읽으면 새로 계산한 단계 2와 같은 결과가 나오는지 확인합니다."""
+import numpy as np
+
+from scripts import benchmark
+from scripts import config
+from scripts import gpkg_backend
+from scripts import prep_cache
+from scripts.scenario import Scenario
+
+
+def test_weights_only_change_reuses_step2(tmp_path):
+    gpkg_path = benchmark.write_archipelago_gpkg(benchmark.generate_archipelago(600, nodes_per_island=80, industrial_share=0.1, seed=5), str(tmp_path / "region.gpkg"))
+    lc_layer, island_layer = (gpkg_backend.read_layer(gpkg_path, name) for name in (config.LC_LAYER_NAME, config.ISLAND_LAYER_NAME))
+    cached_scenario = Scenario.from_config(weights=(0.5, 0.3, 0.2)); new_scenario = Scenario.from_config(weights=(0.1, 0.3, 0.6))
+    key_for = lambda scenario: prep_cache.stage_key("step2", ["lc", "island"], prep_cache.STEP2_CONFIG_KEYS, scenario, prep_cache.STEP2_SCENARIO_FIELDS)
+    assert key_for(cached_scenario) == key_for(new_scenario)
+
+    cache = prep_cache.PrepCache(str(tmp_path / "cache")); key = key_for(cached_scenario)
+    store, prioritized_ids, total = gpkg_backend.prepare_target_island_nodes(lc_layer, island_layer, cached_scenario)
+    prep_cache.save_step2(cache, key, None, prioritized_ids, total, store, cached_scenario)
+    _, cached_ids, cached_total, cached_store = prep_cache.load_step2(cache, key, new_scenario)
+    fresh_store, fresh_ids, fresh_total = gpkg_backend.prepare_target_island_nodes(lc_layer, island_layer, new_scenario)
+    assert cached_total == fresh_total and cached_ids == fresh_ids and cached_ids != prioritized_ids
+    np.testing.assert_array_equal(cached_store.priority, fresh_store.priority)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""단계 2e 벡터화 SSI 점수를 기존 섬별 루프 공식(min-max)과 비교합니다."""
+import math
+
+import numpy as np
+import pytest
+
+from scripts import config
+from scripts import scoring
+from scripts.scenario import Scenario
+
+# (UniqueID, L3 코드, x, y, 섬 ID)
+# I1: 일반 섬 (공업 노드 2개, 산림 노드는 계산 제외), I2: 노드 1개 (평탄), I3: 공업 노드 없음 (공업거리 전부 없음),
+# I4: 중심점 없음, None: 섬 밖 노드
+NODES = [
+    (1, '111', 3.0, 4.0, 'I1'), (2, '131', 6.0, 8.0, 'I1'), (3, '121', 0.0, 10.0, 'I1'), (4, '121', 12.0, 0.0, 'I1'), (5, '311', 1.0, 1.0, 'I1'),
+    (6, '111', 105.0, 0.0, 'I2'),
+    (7, '112', 200.0, 3.0, 'I3'), (8, '112', 207.0, 0.0, 'I3'),
+    (9, '111', 300.0, 0.0, 'I4'),
+    (10, '111', 400.0, 0.0, None),
+]
+CENTROIDS = [('I1', 0.0, 0.0), ('I2', 100.0, 0.0), ('I3', 200.0, 0.0)]
+
+
+def _status(code):
+    if code in config.LOW_PRIORITY_URBAN_CODES: return config.STATUS_ORIGINAL_LOW_PRI
+    if code in config.HIGH_PRIORITY_URBAN_CODES: return config.STATUS_ORIGINAL_HIGH_PRI
+    return config.STATUS_ORIGINAL_NONURBAN
+
+
+def _inverse_minmax(values, missing_value):
+    """기존 CalculateField 식: 값이 없으면 missing_value, 범위가 1e-6 이하이면 0.5, 아니면 1 - (d - min) / (max - min)."""
+    present = [v for v in values if v is not None]
+    lo, hi = (min(present), max(present)) if present else (None, None)
+    result = []
+    for v in values:
+        if v is None: result.append(missing_value)
+        elif hi - lo <= 1e-6: result.append(0.5)
+        else: result.append(min(1.0, max(0.0, 1.0 - (v - lo) / (hi - lo))))
+    return result
+
+
+def _baseline(weights):
+    """기존 섬별 루프를 그대로 옮긴 참조 구현 (Near는 전수 비교). 반환: UniqueID -> (중심거리, 공업거리, 우선순위)."""
+    centroids = {island: (x, y) for island, x, y in CENTROIDS}; result = {}
+    for island in sorted({n[4] for n in NODES if n[4] is not None}):
+        if island not in centroids: continue
+        nodes = [n for n in NODES if n[4] == island and _status(n[1]) in (config.STATUS_ORIGINAL_LOW_PRI, config.STATUS_ORIGINAL_HIGH_PRI)]
+        industrial = [n for n in NODES if n[4] == island and n[1] in config.INDUSTRIAL_L3_CODES]
+        cen = [math.hypot(n[2] - centroids[island][0], n[3] - centroids[island][1]) for n in nodes]
+        ind = [min((math.hypot(n[2] - m[2], n[3] - m[3]) for m in industrial if m[0] != n[0]), default=None) for n in nodes]
+        inv_cen = _inverse_minmax(cen, 0.5); inv_ind = _inverse_minmax(ind, 0.0)
+        for n, c, i, sc, si in zip(nodes, cen, ind, inv_cen, inv_ind):
+            status_score = 1.0 if _status(n[1]) == config.STATUS_ORIGINAL_HIGH_PRI else 0.1
+            result[n[0]] = (c, i, weights[0] * status_score + weights[1] * sc + weights[2] * si)
+    return result
+
+
+def _score(max_workers=1, scenario=None):
+    ids, codes, x, y, islands = zip(*NODES); cen_ids, cen_x, cen_y = zip(*CENTROIDS)
+    return scoring.score_island_nodes(ids, x, y, islands, [_status(c) for c in codes], codes, cen_ids, cen_x, cen_y,
+                                      max_workers=max_workers, scenario=scenario or Scenario.from_config(normalization="minmax"))
+
+
+def test_minmax_matches_baseline():
+    weights = Scenario.from_config().weights; expected = _baseline(weights)
+    cen_dist, ind_dist, priority = _score()
+    for row, node in enumerate(NODES):
+        if node[0] not in expected:
+            assert priority[row] == -1.0 and np.isnan(cen_dist[row]) and np.isnan(ind_dist[row])
+            continue
+        cen, ind, expected_priority = expected[node[0]]
+        assert cen_dist[row] == pytest.approx(cen)
+        assert np.isnan(ind_dist[row]) if ind is None else ind_dist[row] == pytest.approx(ind)
+        assert priority[row] == pytest.approx(expected_priority)
+
+
+def test_single_node_and_missing_distance_islands():
+    w_status, w_cen, w_ind = Scenario.from_config().weights
+    _, ind_dist, priority = _score(); row = {node[0]: i for i, node in enumerate(NODES)}
+    # 노드 1개인 섬: 중심거리 평탄 0.5, 공업거리 없음 0
+    assert priority[row[6]] == pytest.approx(w_status * 0.1 + w_cen * 0.5)
+    # 공업 노드가 없는 섬: 공업 점수 0, 중심거리는 정상 정규화 (가까운 노드 1, 먼 노드 0)
+    assert np.isnan(ind_dist[[row[7], row[8]]]).all()
+    assert priority[row[7]] == pytest.approx(w_status * 0.1 + w_cen * 1.0) and priority[row[8]] == pytest.approx(w_status * 0.1)
+    # 공업 노드 자신은 거리에서 제외 (다른 공업 노드까지의 거리)
+    assert ind_dist[row[3]] == pytest.approx(math.hypot(12.0, 10.0))
+
+
+def test_normalize_edge_cases():
+    group = np.array([0, 1, 1]); single_and_missing = np.array([5.0, np.nan, np.nan])
+    assert scoring.normalize_inverse_distance(single_and_missing, group, 2, missing_value=0.0, flat_value=0.5, method="minmax").tolist() == [0.5, 0.0, 0.0]
+    flat = np.array([2.0, 3.0, 3.0])
+    assert scoring.normalize_inverse_distance(flat, group, 2, missing_value=0.0, flat_value=0.5, method="minmax").tolist() == [0.5, 0.5, 0.5]
+
+
+def test_parallel_matches_serial(monkeypatch):
+    monkeypatch.setattr(config, "SCORING_PARALLEL_MIN_NODES", 0)
+    serial = _score(max_workers=1); parallel = _score(max_workers=2)
+    for a, b in zip(serial, parallel): np.testing.assert_array_equal(a, b)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""격자 인덱스의 k-NN / 반경 질의를 전수 비교 결과와 대조합니다 (그룹 제한, 자기 자신 제외 포함)."""
+import numpy as np
+import pytest
+
+from scripts.spatial_index import SpatialIndex
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(7); n = 400
+    x = rng.uniform(0, 100, n); y = rng.uniform(0, 60, n)
+    groups = rng.integers(-1, 5, n)  # -1은 인덱스에서 제외
+    ids = np.arange(1, n + 1)
+    return x, y, groups, ids
+
+
+def _brute_distances(x, y, groups, ids, qx, qy, q_groups, q_ids):
+    """질의 행별 후보 거리 행렬. 다른 그룹, 그룹 -1, 같은 ID는 inf."""
+    d = np.hypot(qx[:, None] - x[None, :], qy[:, None] - y[None, :])
+    d[(q_groups[:, None] != groups[None, :]) | (groups[None, :] < 0) | (q_groups[:, None] < 0) | (q_ids[:, None] == ids[None, :])] = np.inf
+    return d
+
+
+@pytest.mark.parametrize("k", [1, 3])
+def test_knn_matches_brute_force(points, k):
+    x, y, groups, ids = points
+    index = SpatialIndex(x, y, groups=groups, ids=ids, cell_size=7.5)
+    dist, idx = index.query_knn(x, y, k=k, groups=groups, query_ids=ids)
+    brute = _brute_distances(x, y, groups, ids, x, y, groups, ids)
+    expected = np.sort(brute, axis=1)[:, :k]
+    np.testing.assert_allclose(dist, expected)
+    found = idx >= 0
+    assert (found == np.isfinite(expected)).all()
+    # 반환된 인덱스의 실제 거리가 보고된 거리와 같고, 자기 자신이나 다른 그룹 점이 아님
+    rows = np.nonzero(found)[0]
+    np.testing.assert_allclose(brute[rows, idx[found]], dist[found])
+
+
+def test_knn_without_groups_or_ids(points):
+    x, y, _, _ = points; rng = np.random.default_rng(1); qx = rng.uniform(-10, 110, 50); qy = rng.uniform(-10, 70, 50)
+    dist, idx = SpatialIndex(x, y).nearest(qx, qy)
+    brute = np.hypot(qx[:, None] - x[None, :], qy[:, None] - y[None, :])
+    np.testing.assert_allclose(dist, brute.min(axis=1))
+    np.testing.assert_allclose(brute[np.arange(len(qx)), idx], dist)
+
+
+@pytest.mark.parametrize("radius", [0.0, 4.0, 15.0])
+def test_radius_matches_brute_force(points, radius):
+    x, y, groups, ids = points
+    index = SpatialIndex(x, y, groups=groups, ids=ids, cell_size=7.5)
+    q_idx, p_idx, dist = index.query_radius(x, y, radius, groups=groups, query_ids=ids)
+    brute = _brute_distances(x, y, groups, ids, x, y, groups, ids)
+    exp_q, exp_p = np.nonzero(brute <= radius)
+    assert sorted(zip(q_idx.tolist(), p_idx.tolist())) == sorted(zip(exp_q.tolist(), exp_p.tolist()))
+    np.testing.assert_allclose(dist, brute[q_idx, p_idx])
+    # 질의 인덱스 순, 같은 질의 안에서는 거리 순
+    assert (np.diff(q_idx) >= 0).all() and all((np.diff(dist[q_idx == q]) >= 0).all() for q in np.unique(q_idx))